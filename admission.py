@@ -0,0 +1,272 @@
+"""
+admission.py
+------------
+Admission control cho API: mỗi request thuộc một lớp tải, mỗi lớp có số slot chạy đồng thời
+và hàng đợi có giới hạn. Lớp đã đầy thì trả lỗi ngay kèm Retry-After thay vì để threadpool
+của Starlette mở thêm hàng chục Chromium/ffmpeg và làm container OOM.
+
+  browser  crawl Playwright/Crawlee (/tiktok/*, /get_html, /generate-poster)
+  render   ffmpeg / tải media (/generate-video, /video/upload)
+  light    request HTTP nhẹ còn lại, kể cả các route /tiktok/* chỉ gọi HTTP
+           (/tiktok/get_metadata_videos, /tiktok/get_comments_v2)
+  (không giới hạn: /metrics, /jobs/{id}, /*/stats)
+
+Hàng đợi đầy -> 429; chờ quá ADMISSION_<LỚP>_QUEUE_TIMEOUT giây -> 503. Cả hai có Retry-After
+ước lượng từ thời gian giữ slot trung bình của lớp.
+
+Cấu hình qua biến môi trường (LỚP = BROWSER | RENDER | LIGHT):
+  ADMISSION_<LỚP>_LIMIT           số request chạy đồng thời (mặc định: 4 / 1 / 32)
+  ADMISSION_<LỚP>_QUEUE           số request chờ tối đa (mặc định: 16 / 4 / 128)
+  ADMISSION_<LỚP>_QUEUE_TIMEOUT   số giây chờ tối đa trong hàng đợi (mặc định: 60 / 120 / 30)
+"""
+
+import asyncio
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import metrics
+
+
+def _env(cls: str, key: str, default):
+    return type(default)(os.getenv(f"ADMISSION_{cls.upper()}_{key}", default))
+
+
+class AdmissionRejected(RuntimeError):
+    def __init__(self, cls: str, status_code: int, retry_after: int, detail: str) -> None:
+        super().__init__(detail)
+        self.cls = cls
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.detail = detail
+
+
+class _Waiter:
+    def __init__(self, wake) -> None:
+        self.wake = wake
+        self.granted = False
+        self.abandoned = False
+
+
+class ConcurrencyClass:
+    """Semaphore FIFO có hàng đợi giới hạn, dùng được cả từ event loop (acquire_async) lẫn thread (acquire/slot)."""
+
+    def __init__(self, name: str, limit: int, max_queue: int, queue_timeout: float) -> None:
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._avg_hold = None  # EWMA thời gian giữ slot (giây), để ước lượng Retry-After
+        self._waiters: "deque[_Waiter]" = deque()
+        self._lock = threading.Lock()
+
+    # ----- lõi -----
+    def _try_enter(self, wake, unbounded_queue: bool):
+        """Trả None nếu vào được ngay, ngược lại trả _Waiter đã xếp hàng."""
+        with self._lock:
+            if self.active < self.limit and not self._waiters:
+                self.active += 1
+                return None
+            if not unbounded_queue and len(self._waiters) >= self.max_queue:
+                self.rejected += 1
+                metrics.inc("admission_rejected_total", cls=self.name, reason="queue_full")
+                raise AdmissionRejected(
+                    self.name, 429, self.retry_after(),
+                    f"Lớp '{self.name}' đang quá tải ({self.active} đang chạy, {len(self._waiters)} đang chờ), thử lại sau",
+                )
+            waiter = _Waiter(wake)
+            self._waiters.append(waiter)
+            return waiter
+
+    def _leave_queue(self, waiter: _Waiter) -> bool:
+        """Rời hàng đợi; trả True nếu slot đã kịp được trao cho waiter này."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            waiter.abandoned = True
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass
+            return False
+
+    def _timed_out(self, waiter: _Waiter) -> None:
+        if self._leave_queue(waiter):
+            return  # slot tới đúng lúc hết giờ: vẫn chạy
+        with self._lock:
+            self.rejected += 1
+        metrics.inc("admission_rejected_total", cls=self.name, reason="queue_timeout")
+        raise AdmissionRejected(
+            self.name, 503, self.retry_after(),
+            f"Lớp '{self.name}' chờ quá {self.queue_timeout:.0f}s chưa có slot, thử lại sau",
+        )
+
+    def _release(self, held: float) -> None:
+        wake = None
+        with self._lock:
+            self._avg_hold = held if self._avg_hold is None else 0.8 * self._avg_hold + 0.2 * held
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if waiter.abandoned:
+                    continue
+                # Trao thẳng slot cho người chờ đầu hàng (active giữ nguyên)
+                waiter.granted = True
+                wake = waiter.wake
+                break
+            else:
+                self.active -= 1
+        if wake is not None:
+            wake()
+
+    def _admitted(self, queued_at: float) -> float:
+        with self._lock:
+            self.admitted += 1
+        now = time.perf_counter()
+        metrics.observe("admission_queue_seconds", now - queued_at, cls=self.name)
+        return now
+
+    def retry_after(self) -> int:
+        avg = self._avg_hold or 5.0
+        waves = (len(self._waiters) + 1) / max(1, self.limit)
+        return max(1, math.ceil(avg * waves))
+
+    # ----- API -----
+    async def acquire_async(self) -> float:
+        """Chờ slot trong event loop; trả mốc thời gian để truyền lại cho release()."""
+        queued_at = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        waiter = self._try_enter(lambda: loop.call_soon_threadsafe(event.set), unbounded_queue=False)
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(event.wait(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self._timed_out(waiter)
+            except BaseException:
+                # Client huỷ khi đang chờ: nếu slot đã được trao thì trả lại
+                if self._leave_queue(waiter):
+                    self._release(0.0)
+                raise
+        return self._admitted(queued_at)
+
+    def acquire(self, timeout: float | None = None, unbounded_queue: bool = False) -> float:
+        """Bản chặn cho thread (vd: job nền). timeout=None: chờ tới khi có slot."""
+        queued_at = time.perf_counter()
+        event = threading.Event()
+        waiter = self._try_enter(event.set, unbounded_queue=unbounded_queue)
+        if waiter is not None and not event.wait(timeout):
+            self._timed_out(waiter)
+        return self._admitted(queued_at)
+
+    def release(self, started_at: float) -> None:
+        self._release(time.perf_counter() - started_at)
+
+    @contextmanager
+    def slot(self, timeout: float | None = None, unbounded_queue: bool = False):
+        started_at = self.acquire(timeout, unbounded_queue)
+        try:
+            yield
+        finally:
+            self.release(started_at)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "active": self.active,
+                "queued": len(self._waiters),
+                "max_queue": self.max_queue,
+                "queue_timeout": self.queue_timeout,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "avg_hold_seconds": round(self._avg_hold, 3) if self._avg_hold is not None else None,
+            }
+
+
+CLASSES = {
+    name: ConcurrencyClass(
+        name,
+        limit=_env(name, "LIMIT", limit),
+        max_queue=_env(name, "QUEUE", queue),
+        queue_timeout=_env(name, "QUEUE_TIMEOUT", timeout),
+    )
+    for name, limit, queue, timeout in (
+        ("browser", 4, 16, 60.0),
+        ("render", 1, 4, 120.0),
+        ("light", 32, 128, 30.0),
+    )
+}
+
+# (method, tiền tố path) -> lớp; khớp theo thứ tự, None = không giới hạn
+ROUTE_CLASSES = [
+    (None, "/metrics", None),
+    ("GET", "/jobs/", None),
+    (None, "/browser_pool/stats", None),
+    (None, "/cache/", None),
+    (None, "/admission/stats", None),
+    ("POST", "/jobs/", "light"),  # job chỉ xếp hàng ở đây; phần nặng lấy slot bên trong job
+    (None, "/tiktok/get_metadata_videos", "light"),  # chỉ HTTP, không mở browser
+    (None, "/tiktok/get_comments_v2", "light"),  # chỉ gọi API comment qua aiohttp
+    (None, "/tiktok/", "browser"),
+    (None, "/get_html", "browser"),
+    (None, "/generate-poster", "browser"),
+    (None, "/generate-video", "render"),
+    (None, "/video/upload", "render"),
+]
+DEFAULT_CLASS = "light"
+
+
+def classify(method: str, path: str):
+    for m, prefix, cls in ROUTE_CLASSES:
+        if (m is None or m == method) and path.startswith(prefix):
+            return cls
+    return DEFAULT_CLASS
+
+
+def stats() -> dict:
+    return {name: c.stats() for name, c in CLASSES.items()}
+
+
+class AdmissionMiddleware:
+    """app.add_middleware(AdmissionMiddleware) — giữ slot của lớp trong suốt request (kể cả khi stream response)."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        cls = classify(scope.get("method", ""), scope.get("path", ""))
+        if cls is None:
+            return await self.app(scope, receive, send)
+
+        limiter = CLASSES[cls]
+        try:
+            started_at = await limiter.acquire_async()
+        except AdmissionRejected as e:
+            return await self._reject(send, e)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release(started_at)
+
+    @staticmethod
+    async def _reject(send, e: AdmissionRejected) -> None:
+        body = json.dumps({"detail": e.detail}, ensure_ascii=False).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": e.status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(e.retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,144 @@
+"""
+bench_comments.py
+-----------------
+Benchmark model Comment của tiktok_comment_scrapper: bộ nhớ cho N comment và tốc độ parse
+từ JSON API comment/list, trước/sau khi chuyển sang __slots__ + đọc field trực tiếp.
+
+  before   class thường (__dict__ mỗi instance), strftime ngay trong __init__,
+           jmespath.search(chuỗi query) ở mỗi comment (đúng như bản cũ)
+  jmespath Comment hiện tại + JMESPath compile sẵn (để thấy riêng phần lợi của compile)
+  after    Comment hiện tại (__slots__, format create_time khi đọc) + comment_fields (đọc dict trực tiếp)
+
+    python bench_comments.py [--count 100000]
+
+Bộ nhớ đo bằng tracemalloc (chỉ tính object Comment + field, không tính JSON gốc).
+"""
+
+import argparse
+import gc
+import time
+import tracemalloc
+from datetime import datetime
+
+import jmespath
+
+from tiktok_comment_scrapper.tiktokcomment.tiktokcomment import comment_fields
+from tiktok_comment_scrapper.tiktokcomment.typing import Comment
+
+# Query per-comment của bản cũ
+COMMENT_QUERY = """
+{
+    comment_id: cid,
+    username: user.unique_id,
+    nickname: user.nickname,
+    comment: text,
+    create_time: create_time,
+    avatar: user.avatar_thumb.url_list[0],
+    total_reply: reply_comment_total,
+    likes: digg_count
+}
+"""
+COMMENT_EXPR = jmespath.compile(COMMENT_QUERY)
+
+
+class LegacyComment:
+    """Bản Comment trước khi dùng __slots__ (chỉ giữ phần ảnh hưởng bộ nhớ/tốc độ)."""
+
+    def __init__(self, comment_id, username, nickname, comment, create_time, avatar, total_reply, likes=0, replies=[]):
+        self._comment_id = comment_id
+        self._username = username
+        self._nickname = nickname
+        self._comment = comment
+        self._create_time = datetime.fromtimestamp(create_time).strftime("%Y-%m-%dT%H:%M:%S")
+        self._avatar = avatar
+        self._total_reply = total_reply
+        self._replies = replies
+        self._likes = likes
+
+    @property
+    def dict(self):
+        return {
+            'comment_id': self._comment_id,
+            'username': self._username,
+            'nickname': self._nickname,
+            'comment': self._comment,
+            'create_time': self._create_time,
+            'avatar': self._avatar,
+            'total_reply': self._total_reply,
+            'likes': self._likes,
+            'replies': [reply.dict for reply in self._replies]
+        }
+
+
+def parse_before(raw):
+    return LegacyComment(**jmespath.search(COMMENT_QUERY, raw), replies=[])
+
+
+def parse_jmespath(raw):
+    return Comment(**COMMENT_EXPR.search(raw), replies=[])
+
+
+def parse_after(raw):
+    return Comment(**comment_fields(raw), replies=[])
+
+
+def raw_comments(count: int) -> list:
+    return [
+        {
+            "cid": str(7400000000000000000 + i),
+            "text": f"bình luận số {i}",
+            "create_time": 1700000000 + i,
+            "digg_count": i % 1000,
+            "reply_comment_total": 0,
+            "user": {
+                "unique_id": f"user{i % 5000}",
+                "nickname": f"User {i % 5000}",
+                "avatar_thumb": {"url_list": [f"https://p16-sign.tiktokcdn.com/avatar/{i % 5000}.jpeg"]},
+            },
+            "share_info": {"title": "video", "url": "https://www.tiktok.com/@user/video/1"},
+        }
+        for i in range(count)
+    ]
+
+
+def measure(parse, raws):
+    gc.collect()
+    tracemalloc.start()
+    comments = [parse(raw) for raw in raws]
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # Parse không bật tracemalloc (tracemalloc làm chậm cấp phát)
+    del comments
+    gc.collect()
+    start = time.perf_counter()
+    comments = [parse(raw) for raw in raws]
+    elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for comment in comments:
+        comment.dict
+    to_dict = time.perf_counter() - start
+    return memory, elapsed, to_dict
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark bộ nhớ / tốc độ parse của Comment")
+    parser.add_argument("--count", type=int, default=100_000, help="Số comment")
+    args = parser.parse_args()
+
+    raws = raw_comments(args.count)
+    print(f"{args.count} comment")
+    print(f"  {'':<8} {'bộ nhớ':>10} {'byte/cmt':>9} {'parse':>10} {'cmt/s':>10} {'.dict':>8}")
+    results = {}
+    for name, parse in (("before", parse_before), ("jmespath", parse_jmespath), ("after", parse_after)):
+        memory, elapsed, to_dict = measure(parse, raws)
+        results[name] = (memory, elapsed)
+        print(f"  {name:<8} {memory / 2**20:8.1f}MB {memory / args.count:9.0f} {elapsed:9.3f}s "
+              f"{args.count / elapsed:10.0f} {to_dict:7.3f}s")
+    (mem_b, t_b), (mem_a, t_a) = results["before"], results["after"]
+    print(f"  bộ nhớ giảm {1 - mem_a / mem_b:.0%}, parse nhanh x{t_b / t_a:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+bench_rehydration.py
+--------------------
+Micro-benchmark tách itemStruct khỏi HTML trang video TikTok:
+
+  bs4         đường cũ: BeautifulSoup(html.parser) cả trang + json.loads (cần beautifulsoup4)
+  str+json    decode response sang str, str.find + json.loads
+  bytes+fast  rehydration.extract_item_struct trên bytes (orjson nếu có cài)
+
+    python bench_rehydration.py [trang1.html trang2.html ...] [--number 50]
+
+Không truyền file thì đo các trang mẫu trong bench_pages/ cộng một trang tổng hợp ~700KB
+(script rehydration nằm sau nhiều HTML/JS khác). Trang mẫu được dựng lại theo bố cục trang thật
+(thứ tự script, các khoá của __DEFAULT_SCOPE__, field của itemStruct), đã rút gọn và ẩn danh
+(id, url, token là giá trị giả):
+
+  video.html         trang video bình thường (có itemStruct)
+  unavailable.html   video bị xoá / ẩn: có JSON rehydration nhưng không có itemInfo -> empty
+  captcha.html       trang kiểm tra captcha: không có script rehydration -> shell
+
+Lưu trang thật để đo: curl -A "Mozilla/5.0" -o video.html https://www.tiktok.com/@user/video/<id>
+"""
+
+import argparse
+import glob
+import json
+import os
+import time
+
+import rehydration
+
+
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_pages")
+
+
+def _item_struct(data):
+    detail = data.get("__DEFAULT_SCOPE__", {}).get("webapp.video-detail", {})
+    item_struct = detail.get("itemInfo", {}).get("itemStruct")
+    return item_struct if item_struct and item_struct.get("stats") else None
+
+
+def extract_bs4(raw: bytes):
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(raw.decode("utf-8"), "html.parser")
+    elem = soup.find("script", id="__UNIVERSAL_DATA_FOR_REHYDRATION__")
+    return _item_struct(json.loads(elem.string)) if elem else None
+
+
+def extract_str_json(raw: bytes):
+    html = raw.decode("utf-8")
+    blob = rehydration.find_rehydration_json(html)
+    return _item_struct(json.loads(blob)) if blob is not None else None
+
+
+def extract_fast(raw: bytes):
+    return rehydration.extract_item_struct(raw)[0]
+
+
+def synthetic_page() -> bytes:
+    item_struct = {
+        "id": "7300000000000000000",
+        "desc": "video mẫu #fyp #xuhuong",
+        "createTime": "1700000000",
+        "stats": {"diggCount": 1200, "commentCount": 45, "shareCount": 30, "collectCount": "12", "playCount": 56000},
+        "author": {"id": "1", "uniqueId": "user", "nickname": "User", "signature": "bio"},
+        "authorStats": {"followerCount": 100, "followingCount": 10, "heart": 5000, "videoCount": 20},
+        "video": {"cover": "https://example.com/cover.jpg"},
+        "music": {"id": "2", "title": "nhạc nền", "authorName": "User"},
+        "textExtra": [{"hashtagName": "fyp"}, {"hashtagName": "xuhuong"}],
+    }
+    data = {
+        "__DEFAULT_SCOPE__": {
+            "webapp.app-context": {"language": "vi-VN", "abTestVersion": {"parameters": {f"k{i}": {"vid": str(i)} for i in range(2000)}}},
+            "webapp.video-detail": {"itemInfo": {"itemStruct": item_struct}, "statusCode": 0},
+        }
+    }
+    filler = "".join(f'<div class="css-{i}"><span>item {i}</span><a href="/tag/{i}">#{i}</a></div>' for i in range(8000))
+    scripts = "".join(f"<script>window.__c{i}={json.dumps(list(range(200)))}</script>" for i in range(20))
+    html = (
+        "<!DOCTYPE html><html><head><title>TikTok</title>"
+        f"{scripts}</head><body>{filler}"
+        '<script id="__UNIVERSAL_DATA_FOR_REHYDRATION__" type="application/json">'
+        f"{json.dumps(data, ensure_ascii=False)}</script></body></html>"
+    )
+    return html.encode("utf-8")
+
+
+def bench(fn, pages, number: int) -> float:
+    """Thời gian trung bình mỗi trang (ms), lấy min của 3 lượt."""
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(number):
+            for raw in pages:
+                fn(raw)
+        best = min(best, time.perf_counter() - start)
+    return best / (number * len(pages)) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="So sánh tốc độ tách itemStruct từ HTML trang video")
+    parser.add_argument("pages", nargs="*", help="File HTML trang video đã lưu")
+    parser.add_argument("--number", type=int, default=50, help="Số lần lặp mỗi trang")
+    args = parser.parse_args()
+
+    pages = []
+    for path in args.pages or sorted(glob.glob(os.path.join(PAGES_DIR, "*.html"))):
+        with open(path, "rb") as f:
+            pages.append((os.path.basename(path), f.read()))
+    if not args.pages:
+        pages.append(("synthetic", synthetic_page()))
+
+    candidates = [("str+json", extract_str_json), ("bytes+fast", extract_fast)]
+    try:
+        import bs4  # noqa: F401
+        candidates.insert(0, ("bs4", extract_bs4))
+    except ImportError:
+        print("[WARNING] chưa cài beautifulsoup4, bỏ qua đường bs4")
+
+    print(f"JSON parser: {'orjson' if rehydration.orjson else 'json'}, ms/trang (min của 3 lượt x {args.number})")
+    print(f"  {'trang':<18} {'KB':>6} {'kết quả':<8}" + "".join(f" {name:>11}" for name, _ in candidates))
+    for name, raw in pages:
+        expected, reason = rehydration.extract_item_struct(raw)
+        row = f"  {name:<18} {len(raw) / 1024:6.0f} {reason or 'ok':<8}"
+        for cand, fn in candidates:
+            assert fn(raw) == expected, f"{cand} cho kết quả khác trên {name}"
+            row += f" {bench(fn, [raw], args.number):11.3f}"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
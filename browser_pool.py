@@ -0,0 +1,256 @@
+"""
+browser_pool.py
+---------------
+Pool Chromium sống lâu (Playwright sync API) dùng chung cho các script crawl/render.
+Mỗi lần dùng chỉ tạo context + page mới trên browser đã warm, nên tra cứu use-count
+chỉ tốn một lần load trang thay vì một lần boot Chromium.
+
+    with browser_pool.new_page(block=route_filter, **browser_pool.DEFAULT_CONTEXT) as page:
+        page.goto(url)
+
+Playwright sync chỉ dùng được trong process/thread đã khởi tạo nó, nên mỗi worker của
+worker_pool (và mỗi lần chạy CLI) giữ một pool riêng. Worker đẩy số liệu sử dụng vào
+dict dùng chung để API process tổng hợp (xem worker_pool.browser_pool_stats()).
+
+Cấu hình qua biến môi trường:
+  BROWSER_POOL_SIZE    số browser warm mỗi process (mặc định: 1)
+  BROWSER_MAX_PAGES    số page một browser phục vụ trước khi bị thay mới (mặc định: 50)
+  BROWSER_MAX_RSS_MB   RSS tối đa (MB) của toàn bộ tiến trình Chromium con; vượt thì thay browser (mặc định: 1500)
+  BROWSER_HEADLESS     "0" để chạy có giao diện (mặc định: headless)
+"""
+
+import atexit
+import os
+import time
+from contextlib import contextmanager
+
+import metrics
+
+POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "1"))
+MAX_PAGES_PER_BROWSER = int(os.getenv("BROWSER_MAX_PAGES", "50"))
+MAX_RSS_MB = float(os.getenv("BROWSER_MAX_RSS_MB", "1500"))
+HEADLESS = os.getenv("BROWSER_HEADLESS", "1") != "0"
+
+LAUNCH_ARGS = [
+    "--disable-blink-features=AutomationControlled",
+    "--no-sandbox",
+    "--disable-dev-shm-usage",
+    "--disable-web-security",
+    "--disable-features=IsolateOrigins,site-per-process",
+]
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36"
+
+# Context mặc định các script crawl TikTok đang dùng
+DEFAULT_CONTEXT = {
+    "user_agent": USER_AGENT,
+    "viewport": {"width": 1280, "height": 720},
+    "bypass_csp": True,
+    "java_script_enabled": True,
+}
+
+BLOCKED_TYPES = {"image", "font", "stylesheet", "media"}
+BLOCKED_KEYWORDS = {"analytics", "tracking", "collect", "adsbygoogle"}
+
+
+def make_route_filter(blocked_types=BLOCKED_TYPES, blocked_keywords=BLOCKED_KEYWORDS, blocked_domains=()):
+    """Tạo route_filter chặn theo resource type, keyword trong URL và domain."""
+    def route_filter(route, request):
+        url = request.url.lower()
+        if request.resource_type in blocked_types:
+            return route.abort()
+        if any(k in url for k in blocked_keywords):
+            return route.abort()
+        if any(d in url for d in blocked_domains):
+            return route.abort()
+        return route.continue_()
+    return route_filter
+
+
+def _descendants_rss_mb():
+    """Tổng RSS (MB) các tiến trình con cháu của process hiện tại (driver + Chromium). Chỉ Linux."""
+    try:
+        children = {}
+        for name in os.listdir("/proc"):
+            if not name.isdigit():
+                continue
+            try:
+                with open(f"/proc/{name}/stat") as f:
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, ValueError, IndexError):
+                continue
+            children.setdefault(ppid, []).append(int(name))
+
+        page_size = os.sysconf("SC_PAGE_SIZE")
+        total = 0
+        stack = [os.getpid()]
+        while stack:
+            for pid in children.get(stack.pop(), []):
+                try:
+                    with open(f"/proc/{pid}/statm") as f:
+                        total += int(f.read().split()[1]) * page_size
+                except (OSError, ValueError, IndexError):
+                    pass
+                stack.append(pid)
+        return total / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class _Slot:
+    def __init__(self, browser) -> None:
+        self.browser = browser
+        self.pages_served = 0
+        self.in_use = False
+        self.launched_at = time.time()
+
+
+class BrowserPool:
+    def __init__(self, size=POOL_SIZE, max_pages=MAX_PAGES_PER_BROWSER, max_rss_mb=MAX_RSS_MB, headless=HEADLESS) -> None:
+        self.size = size
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self.headless = headless
+        self._playwright = None
+        self._slots = []
+        self._stats_sink = None
+        self.launches = 0
+        self.recycles = 0
+        self.pages_served = 0
+        self.last_rss_mb = None
+
+    def _ensure_started(self) -> None:
+        if self._playwright is None:
+            from playwright.sync_api import sync_playwright
+            self._playwright = sync_playwright().start()
+            atexit.register(self.close)
+
+    def _launch(self) -> _Slot:
+        self._ensure_started()
+        with metrics.timer("browser_launch_seconds"):
+            browser = self._playwright.chromium.launch(headless=self.headless, args=LAUNCH_ARGS)
+        self.launches += 1
+        slot = _Slot(browser)
+        self._slots.append(slot)
+        return slot
+
+    def warm(self) -> None:
+        """Boot trước đủ `size` browser."""
+        while len(self._slots) < self.size:
+            self._launch()
+        self._publish()
+
+    def _acquire(self) -> _Slot:
+        free = [s for s in self._slots if not s.in_use and s.browser.is_connected()]
+        for s in [s for s in self._slots if not s.browser.is_connected()]:
+            self._slots.remove(s)
+        if free:
+            slot = min(free, key=lambda s: s.pages_served)
+        else:
+            # Hết browser rảnh (hoặc page lồng nhau): boot thêm, vượt `size` sẽ bị đóng khi trả về
+            slot = self._launch()
+        slot.in_use = True
+        return slot
+
+    def _release(self, slot: _Slot) -> None:
+        slot.in_use = False
+        slot.pages_served += 1
+        self.pages_served += 1
+
+        retire = (
+            not slot.browser.is_connected()
+            or slot.pages_served >= self.max_pages
+            or len(self._slots) > self.size
+        )
+        if not retire and self.max_rss_mb:
+            self.last_rss_mb = _descendants_rss_mb()
+            retire = self.last_rss_mb is not None and self.last_rss_mb > self.max_rss_mb
+        if retire:
+            self._retire(slot)
+        self._publish()
+
+    def _retire(self, slot: _Slot) -> None:
+        if slot in self._slots:
+            self._slots.remove(slot)
+        self.recycles += 1
+        try:
+            slot.browser.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def new_page(self, block=None, **context_options):
+        """Mở context + page mới trên một browser của pool; đóng context khi ra khỏi `with`.
+
+        block: route_filter (xem make_route_filter) áp cho mọi request của context.
+        context_options: truyền thẳng vào browser.new_context().
+        """
+        slot = self._acquire()
+        self._publish()
+        context = None
+        try:
+            context = slot.browser.new_context(**context_options)
+            if block is not None:
+                context.route("**/*", block)
+            yield metrics.instrument_page(context.new_page(), "browser_pool")
+        finally:
+            if context is not None:
+                try:
+                    context.close()
+                except Exception:
+                    pass
+            self._release(slot)
+
+    def stats(self) -> dict:
+        return {
+            "pid": os.getpid(),
+            "size": self.size,
+            "browsers": len(self._slots),
+            "in_use": sum(1 for s in self._slots if s.in_use),
+            "pages_served": self.pages_served,
+            "pages_per_browser": [s.pages_served for s in self._slots],
+            "launches": self.launches,
+            "recycles": self.recycles,
+            "rss_mb": self.last_rss_mb,
+            "updated_at": time.time(),
+        }
+
+    def set_stats_sink(self, sink) -> None:
+        """sink: dict-like (vd: Manager().dict()) nhận stats theo pid sau mỗi lần mượn/trả page."""
+        self._stats_sink = sink
+        self._publish()
+
+    def _publish(self) -> None:
+        if self._stats_sink is None:
+            return
+        try:
+            self._stats_sink[os.getpid()] = self.stats()
+        except Exception:
+            pass
+
+    def close(self) -> None:
+        for slot in list(self._slots):
+            try:
+                slot.browser.close()
+            except Exception:
+                pass
+        self._slots.clear()
+        if self._stats_sink is not None:
+            try:
+                self._stats_sink.pop(os.getpid(), None)
+            except Exception:
+                pass
+        if self._playwright is not None:
+            try:
+                self._playwright.stop()
+            except Exception:
+                pass
+            self._playwright = None
+
+
+_pool = BrowserPool()
+
+new_page = _pool.new_page
+warm = _pool.warm
+stats = _pool.stats
+set_stats_sink = _pool.set_stats_sink
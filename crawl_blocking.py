@@ -0,0 +1,109 @@
+"""
+crawl_blocking.py
+-----------------
+Chặn tài nguyên không cần cho crawl (ảnh, font, video, tracker) trên page của Crawlee
+PlaywrightCrawler, giống route_filter của các script standalone (browser_pool.make_route_filter)
+nhưng chạy với async API, có ghi đè theo label và đếm vào metrics:
+
+  crawl_blocked_requests_total{label, type, reason}   số request bị chặn
+  crawl_response_bytes_total{label, type}             số byte (content-length) vẫn tải về
+
+Request bị abort thì không tải nên không biết được kích thước; hiệu quả xem qua mức giảm của
+crawl_response_bytes_total.
+
+Mặc định không chặn stylesheet: handler DOM (is_visible, tìm container cuộn theo overflow-y)
+cần CSS thật.
+
+Cấu hình qua biến môi trường (danh sách cách nhau bởi dấu phẩy, chuỗi rỗng = không chặn gì):
+  CRAWL_BLOCK                     "0" để tắt hẳn (mặc định: "1")
+  CRAWL_BLOCK_TYPES               resource type bị chặn (mặc định: image,font,media)
+  CRAWL_BLOCK_KEYWORDS            chuỗi con của URL bị chặn
+  CRAWL_BLOCK_DOMAINS             domain (kể cả subdomain) bị chặn
+  CRAWL_BLOCK_<KEY>_<LABEL>       ghi đè cho một label, vd: CRAWL_BLOCK_TYPES_VIDEO=image,font
+"""
+
+import os
+from urllib.parse import urlsplit
+
+import metrics
+
+BLOCK_TYPES = {"image", "font", "media"}
+# Không thêm "collect"/"embed" như bản standalone: dễ trúng API nội bộ của TikTok
+BLOCK_KEYWORDS = {"analytics", "tracking", "adsbygoogle", "googletagmanager", "doubleclick", "monitor_browser"}
+BLOCK_DOMAINS = {
+    "google-analytics.com",
+    "googletagmanager.com",
+    "doubleclick.net",
+    "facebook.com",
+    "connect.facebook.net",
+    "analytics.tiktok.com",
+}
+
+# Ghi đè trong code theo label (key có mặt thay cho giá trị mặc định/env chung)
+LABEL_OVERRIDES = {
+    # Trang video: thêm phụ đề + manifest của player
+    "video": {"types": BLOCK_TYPES | {"texttrack", "manifest"}},
+}
+
+
+def _env_set(name: str, default: set) -> set:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return {v.strip().lower() for v in value.split(",") if v.strip()}
+
+
+def policy(label: str | None):
+    """Chính sách chặn cho `label`: {"types", "keywords", "domains"}; None nếu đã tắt."""
+    if os.getenv("CRAWL_BLOCK", "1") == "0":
+        return None
+    override = LABEL_OVERRIDES.get(label or "", {})
+    result = {}
+    for key, default in (("types", BLOCK_TYPES), ("keywords", BLOCK_KEYWORDS), ("domains", BLOCK_DOMAINS)):
+        value = _env_set(f"CRAWL_BLOCK_{key.upper()}", default)
+        value = override.get(key, value)
+        if label:
+            value = _env_set(f"CRAWL_BLOCK_{key.upper()}_{label.upper()}", value)
+        result[key] = value
+    return result
+
+
+def _reason(request, rules: dict):
+    if request.resource_type in rules["types"]:
+        return "type"
+    url = request.url.lower()
+    if any(k in url for k in rules["keywords"]):
+        return "keyword"
+    host = urlsplit(url).hostname or ""
+    if any(host == d or host.endswith("." + d) for d in rules["domains"]):
+        return "domain"
+    return None
+
+
+async def install(page, label: str | None) -> None:
+    """Gắn route chặn tài nguyên lên page (gọi trong pre-navigation hook, trước goto). Idempotent."""
+    rules = policy(label)
+    if rules is None or getattr(page, "_crawl_blocking", False):
+        return
+    page._crawl_blocking = True
+    label = label or "default"
+
+    async def handle(route) -> None:
+        request = route.request
+        reason = _reason(request, rules)
+        if reason is None:
+            await route.continue_()
+            return
+        metrics.inc("crawl_blocked_requests_total", label=label, type=request.resource_type, reason=reason)
+        await route.abort()
+
+    def count_bytes(response) -> None:
+        try:
+            size = int(response.headers.get("content-length") or 0)
+        except (TypeError, ValueError):
+            return
+        if size:
+            metrics.inc("crawl_response_bytes_total", size, label=label, type=response.request.resource_type)
+
+    await page.route("**/*", handle)
+    page.on("response", count_bytes)
@@ -0,0 +1,153 @@
+"""
+crawl_concurrency.py
+--------------------
+Giới hạn concurrency thích ứng cho Crawlee PlaywrightCrawler theo tỉ lệ bị chặn.
+
+AutoscaledPool của Crawlee đã tự tăng/giảm số task theo CPU/RAM/event loop (trong khoảng
+min..max của ConcurrencySettings) nhưng không biết gì về CAPTCHA hay page timeout. Kết quả
+từng request được ghi vào cửa sổ trượt:
+
+- tỉ lệ CAPTCHA + timeout trong cửa sổ vượt `threshold` -> giảm nửa limit (tối đa 1 lần / `cooldown` giây)
+- `window` request liên tiếp thành công -> limit + 1 (tới `max_limit`)
+
+Sau bind(crawler), limit được áp thẳng làm trần concurrency của AutoscaledPool (max, và
+desired nếu đang cao hơn): Crawlee mở ít page/context hơn thay vì mở rồi để page nằm chờ slot.
+Task đang chạy quá limit mới vẫn chạy nốt, pool chỉ không mở task mới cho tới khi xuống dưới limit.
+acquire()/release() chỉ đếm số page đang chạy (peak), không bao giờ giữ page nằm chờ.
+
+Crawlee không có API công khai để đổi trần concurrency khi đang chạy nên bind() ghi vào
+thuộc tính nội bộ của AutoscaledPool; requirements.txt pin đúng bản Crawlee đã kiểm tra
+(TESTED_CRAWLEE_VERSION). Bản khác thì bind() cảnh báo; thiếu thuộc tính thì bind() log
+[ERROR] + metric crawl_concurrency_unbound_total và limiter không có tác dụng (Crawlee vẫn
+tự scale theo CPU/RAM).
+"""
+
+import asyncio
+import time
+from collections import deque
+from importlib import metadata
+
+import metrics
+
+# Bản Crawlee đã kiểm tra AutoscaledPool._max_concurrency / _desired_concurrency
+TESTED_CRAWLEE_VERSION = "1.0.1"
+_POOL_ATTRS = ("_max_concurrency", "_desired_concurrency")
+
+
+class AdaptiveLimiter:
+    def __init__(self, min_limit: int, max_limit: int, start: int | None = None,
+                 window: int = 20, threshold: float = 0.2, cooldown: float = 10.0) -> None:
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.start = max(min_limit, min(max_limit, start if start is not None else max_limit))
+        self.limit = self.start
+        self.window = window
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.active = 0
+        self.peak = 0
+        self.counts = {"ok": 0, "captcha": 0, "timeout": 0, "error": 0}
+        self.decreases = 0
+        self.increases = 0
+        self._held = set()
+        self._outcomes = deque(maxlen=window)  # True = bị chặn (captcha/timeout)
+        self._streak = 0
+        self._last_decrease = 0.0
+        self._pool = None  # AutoscaledPool của Crawlee sau bind()
+
+    # ----- Crawlee -----
+    def bind(self, crawler) -> bool:
+        """Áp limit lên AutoscaledPool của `crawler`. Trả False (và log [ERROR]) nếu Crawlee không còn các thuộc tính đó."""
+        try:
+            version = metadata.version("crawlee")
+        except metadata.PackageNotFoundError:
+            version = None
+        if version != TESTED_CRAWLEE_VERSION:
+            print(f"[WARNING] crawl_concurrency: Crawlee {version} chưa được kiểm tra "
+                  f"(đã kiểm tra {TESTED_CRAWLEE_VERSION}), xem requirements.txt", flush=True)
+        pool = getattr(crawler, "_autoscaled_pool", None)
+        if pool is None or not all(isinstance(getattr(pool, a, None), int) for a in _POOL_ATTRS):
+            print(f"[ERROR] crawl_concurrency: Crawlee {version} không có AutoscaledPool.{'/'.join(_POOL_ATTRS)}; "
+                  "limiter theo CAPTCHA/timeout KHÔNG có tác dụng trong lần crawl này", flush=True)
+            metrics.inc("crawl_concurrency_unbound_total")
+            return False
+        self._pool = pool
+        self._apply()
+        return True
+
+    def _apply(self) -> None:
+        pool = self._pool
+        if pool is None:
+            return
+        pool._max_concurrency = self.limit
+        if pool._desired_concurrency > self.limit:
+            pool._desired_concurrency = self.limit
+
+    # ----- đếm page -----
+    async def acquire(self, key) -> None:
+        if key in self._held:
+            return
+        self._held.add(key)
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+
+    def release(self, key) -> None:
+        if key not in self._held:
+            return
+        self._held.discard(key)
+        self.active -= 1
+
+    # ----- tín hiệu -----
+    def record(self, outcome: str) -> None:
+        """outcome: "ok" | "captcha" | "timeout" | "error" (error không tính là bị chặn)."""
+        self.counts[outcome] = self.counts.get(outcome, 0) + 1
+        if outcome == "error":
+            return
+        blocked = outcome != "ok"
+        self._outcomes.append(blocked)
+        if blocked:
+            self._streak = 0
+            rate = self.block_rate()
+            now = time.monotonic()
+            if (len(self._outcomes) >= 5 and rate > self.threshold and self.limit > self.min_limit
+                    and now - self._last_decrease >= self.cooldown):
+                self.limit = max(self.min_limit, self.limit // 2)
+                self.decreases += 1
+                self._last_decrease = now
+                metrics.inc("crawl_concurrency_changes_total", direction="down")
+                self._apply()
+            return
+        self._streak += 1
+        if self._streak >= self.window and self.limit < self.max_limit:
+            self._streak = 0
+            self.limit += 1
+            self.increases += 1
+            metrics.inc("crawl_concurrency_changes_total", direction="up")
+            self._apply()
+
+    def block_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return sum(self._outcomes) / len(self._outcomes)
+
+    def stats(self) -> dict:
+        return {
+            "min": self.min_limit,
+            "max": self.max_limit,
+            "start": self.start,
+            "final": self.limit,
+            "peak_active": self.peak,
+            "increases": self.increases,
+            "decreases": self.decreases,
+            "block_rate": round(self.block_rate(), 3),
+            "outcomes": dict(self.counts),
+        }
+
+
+def classify_error(error: BaseException) -> str:
+    """Map exception của request về outcome cho AdaptiveLimiter.record()."""
+    if type(error).__name__ == "CaptchaDetected":
+        return "captcha"
+    if isinstance(error, asyncio.TimeoutError) or "timeout" in type(error).__name__.lower():
+        return "timeout"
+    return "error"
@@ -1,4 +1,6 @@
-from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
+from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+import browser_pool
+from result_channel import write_result
 import time
 from urllib.parse import urljoin
 import sys
@@ -32,6 +34,7 @@ def crawl_comment_threads(
     ]
     - Nếu không có bình luận: trả về [].
     - Với mỗi thread: chỉ click 'Xem ... câu trả lời' đúng 1 lần (không chờ).
+    - `headless` giữ để tương thích: browser lấy từ browser_pool (BROWSER_HEADLESS).
     """
 
     def _dedupe_preserve_order(items):
@@ -65,25 +68,7 @@ def crawl_comment_threads(
             pass
         return None, None, None
 
-    with sync_playwright() as p:
-        browser = p.chromium.launch(
-            headless=headless,
-            args=[
-                "--disable-blink-features=AutomationControlled",
-                "--no-sandbox",
-                "--disable-dev-shm-usage",
-            ],
-        )
-        context = browser.new_context(
-            user_agent=("Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                        "AppleWebKit/537.36 (KHTML, like Gecko) "
-                        "Chrome/117.0.0.0 Safari/537.36"),
-            viewport={"width": 1280, "height": 720},
-            bypass_csp=True,
-            java_script_enabled=True,
-        )
-        page = context.new_page()
-
+    with browser_pool.new_page(**browser_pool.DEFAULT_CONTEXT) as page:
         # Điều hướng
         page.goto(url, wait_until="domcontentloaded")
         page.wait_for_load_state("domcontentloaded")
@@ -106,8 +91,6 @@ def crawl_comment_threads(
             top_level_any.first.wait_for(timeout=10000)
         except PlaywrightTimeoutError:
             # Không có bình luận
-            context.close()
-            browser.close()
             return []
 
         # Cuộn để load thêm các thread (container của cmt gốc)
@@ -238,8 +221,6 @@ def crawl_comment_threads(
                 "replies": _dedupe_preserve_order(replies),
             })
 
-        context.close()
-        browser.close()
         return results
 
 if __name__ == "__main__":
@@ -251,4 +232,5 @@ if __name__ == "__main__":
         headless=True,
         max_scrolls=10,
     )
-    print(json.dumps(results, ensure_ascii=False))
+    if not write_result(results):
+        print(json.dumps(results, ensure_ascii=False))
@@ -1,4 +1,5 @@
-from playwright.sync_api import sync_playwright
+import browser_pool
+from result_channel import write_result
 import json
 import gc
 import time
@@ -14,33 +15,7 @@ def log(msg, level="INFO"):
 
 # ===== Main Crawler =====
 def get_hashtag_used_count(url):
-    with sync_playwright() as p:
-        browser = p.chromium.launch(
-            headless=True,
-            args=[
-                "--disable-blink-features=AutomationControlled",
-                "--no-sandbox",
-                "--disable-dev-shm-usage",
-                "--disable-web-security",
-                "--disable-features=IsolateOrigins,site-per-process"
-            ]
-        )
-
-        context = browser.new_context(
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36",
-            viewport={"width": 1280, "height": 720},
-            bypass_csp=True,
-            java_script_enabled=True
-        )
-
-        # def route_filter(route, request):
-        #     if request.resource_type in BLOCKED_TYPES or any(k in request.url.lower() for k in BLOCKED_KEYWORDS):
-        #         return route.abort()
-        #     return route.continue_()
-
-        # context.route("**/*", route_filter)
-        page = context.new_page()
-
+    with browser_pool.new_page(**browser_pool.DEFAULT_CONTEXT) as page:
         try:
             page.goto(url)
             page.wait_for_load_state("domcontentloaded")
@@ -61,9 +36,6 @@ def get_hashtag_used_count(url):
             log(f"Error during page navigation: {e}", "ERROR")
             return {"error": str(e)}
         finally:
-            page.close()
-            context.close()
-            browser.close()
             return text 
 
 import re
@@ -91,13 +63,17 @@ def parse_count(text):
 
     return int(number * multiplier)
 
+def get_hashtag_use_count(hashtag):
+    return {"use_count": parse_count(get_hashtag_used_count(f"https://www.tiktok.com/tag/{hashtag}"))}
+
 # ===== CLI Runner =====
 if __name__ == "__main__":
     try:
         hashtag = str(sys.argv[1])
-        result = parse_count(get_hashtag_used_count(f"https://www.tiktok.com/tag/{hashtag}"))
-        log("Result:")
-        print(json.dumps({"use_count": result}, indent=2, ensure_ascii=False))
+        result = get_hashtag_use_count(hashtag)
+        if not write_result(result):
+            log("Result:")
+            print(json.dumps(result, indent=2, ensure_ascii=False))
     except Exception as e:
         log(f"Unexpected error: {e}", "FATAL")
         sys.exit(1)
@@ -1,30 +1,51 @@
+"""
+get_meta_data_video.py
+----------------------
+Lấy metadata video TikTok (tác giả, lượt xem/tim/share/lưu, EER, nhạc) từ JSON
+__UNIVERSAL_DATA_FOR_REHYDRATION__ của trang video, bằng aiohttp:
+
+- một connection pool dùng chung cho cả batch, tối đa `concurrency` request đồng thời
+- giới hạn request/giây cho mỗi host, dùng chung cho mọi lời gọi trong process (mọi request
+  /tiktok/get_metadata_videos song song cộng lại); `rate_per_host` của lời gọi chỉ hạ được, không nâng được
+- retry lỗi mạng / 429 / 5xx / trang shell (captcha) với backoff lũy thừa có jitter
+- kết quả trả ra ngay khi từng video xong (iter_video_data), không đợi cả batch
+
+    python get_meta_data_video.py [tiktok_videos.json] [--concurrency 16] [--rate 5] [--retries 3]
+
+Cấu hình qua biến môi trường:
+  METADATA_RATE_PER_HOST   trần request/giây mỗi host của cả process (mặc định: 5, 0 = không giới hạn)
+"""
+
+import argparse
+import asyncio
 import json
-import requests
-from bs4 import BeautifulSoup
+import os
+import random
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+
+import metrics
+import rehydration
+import video_http
+from result_channel import write_item, write_result
+
+DEFAULT_CONCURRENCY = 16
+DEFAULT_RATE_PER_HOST = float(os.getenv("METADATA_RATE_PER_HOST", "5"))
+DEFAULT_RETRIES = 3
+BACKOFF_BASE = 0.5  # giây
+BACKOFF_MAX = 10.0
+RETRY_REASONS = {"status", "shell", "error"}  # "empty" (video bị xoá/ẩn) thì retry cũng vô ích
+
 
 def calc_eer(hearts, comments, shares, saves, plays):
     if plays == 0:
         return 0
     return ((hearts * 1 + comments * 5 + shares * 7 + saves * 10) / plays) * 100
 
-def fetch_tiktok_video_data(url):
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36"
-    }
-
-    response = requests.get(url, headers=headers)
-    if response.status_code != 200:
-        raise RuntimeError(f"Failed to fetch video page: {response.status_code}")
-
-    soup = BeautifulSoup(response.text, 'html.parser')
-    elem = soup.find('script', id='__UNIVERSAL_DATA_FOR_REHYDRATION__')
-    if not elem:
-        raise RuntimeError('No JSON data element found on video page')
-
-    raw = elem.string
-    data_json = json.loads(raw)
-    item_struct = data_json['__DEFAULT_SCOPE__']['webapp.video-detail']['itemInfo']['itemStruct']
 
+def build_video_data(item_struct, url):
     music_info = item_struct.get('music', {})
     music = {
         'id': music_info.get('id'),
@@ -71,31 +92,158 @@ def fetch_tiktok_video_data(url):
 
     return item
 
+
 def convert_timestamp_to_vn_time(timestamp):
     from datetime import datetime, timezone, timedelta
     vn_timezone = timezone(timedelta(hours=7))  # Vietnam timezone (UTC+7)
     return datetime.fromtimestamp(timestamp, tz=vn_timezone).strftime('%Y-%m-%d %H:%M:%S')
 
+
+class HostRateLimiter:
+    """Giãn các request tới cùng một host cách nhau ít nhất 1/rate giây.
+
+    `parent` (nếu có) cũng phải cho qua: limiter riêng của một lời gọi chỉ làm chậm thêm,
+    tổng tốc độ vẫn không vượt limiter chung.
+    """
+
+    def __init__(self, rate_per_host: float, parent: "HostRateLimiter | None" = None) -> None:
+        self.interval = 1.0 / rate_per_host if rate_per_host > 0 else 0.0
+        self.parent = parent
+        self._next_at = {}
+
+    async def wait(self, url: str) -> None:
+        if self.interval:
+            host = urlsplit(url).hostname or ""
+            # Không có await giữa đọc và ghi _next_at nên không cần lock (và không bị gắn vào
+            # một event loop: limiter chung sống qua nhiều asyncio.run() của CLI)
+            now = time.monotonic()
+            at = max(now, self._next_at.get(host, now))
+            self._next_at[host] = at + self.interval
+            if at > now:
+                await asyncio.sleep(at - now)
+        if self.parent is not None:
+            await self.parent.wait(url)
+
+
+# Limiter chung của process: mọi lời gọi iter_video_data cùng chia ngân sách mỗi host
+host_rate_limiter = HostRateLimiter(DEFAULT_RATE_PER_HOST)
+
+
+def _rate_limiter(rate_per_host: float | None) -> HostRateLimiter:
+    """Limiter cho một lời gọi: limiter chung, thêm giới hạn riêng nếu `rate_per_host` thấp hơn trần."""
+    if not rate_per_host or (DEFAULT_RATE_PER_HOST > 0 and rate_per_host >= DEFAULT_RATE_PER_HOST):
+        return host_rate_limiter
+    return HostRateLimiter(rate_per_host, parent=host_rate_limiter)
+
+
+async def _fetch_once(session, url):
+    """Trả (item_struct, None) hoặc (None, lý do) — lý do như rehydration.extract_item_struct."""
+    try:
+        async with session.get(url) as resp:
+            if resp.status == 429 or resp.status >= 500:
+                return None, "status"
+            if resp.status != 200:
+                return None, f"http_{resp.status}"
+            return rehydration.extract_item_struct(await resp.read())
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        return None, "error"
+
+
+async def fetch_video_data(session, url, rate_limiter: HostRateLimiter, retries: int = DEFAULT_RETRIES) -> dict:
+    """Một video: item metadata, hoặc {'video_url', 'error'} sau khi hết lượt retry."""
+    reason = None
+    for attempt in range(retries + 1):
+        if attempt:
+            # Full jitter: tránh mọi request lỗi cùng lúc retry cùng lúc
+            await asyncio.sleep(random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)))
+        await rate_limiter.wait(url)
+        item_struct, reason = await _fetch_once(session, url)
+        metrics.inc("video_http_fetch_total", outcome=reason or "ok")
+        if item_struct is not None:
+            try:
+                return build_video_data(item_struct, url)
+            except (KeyError, TypeError, ValueError):
+                reason = "empty"
+        if reason not in RETRY_REASONS:
+            break
+    return {'video_url': url, 'error': reason}
+
+
+async def iter_video_data(urls, concurrency: int = DEFAULT_CONCURRENCY, rate_per_host: float | None = None,
+                          retries: int = DEFAULT_RETRIES):
+    """Async generator: yield kết quả từng video theo thứ tự xong trước (item hoặc {'video_url', 'error'}).
+
+    `rate_per_host` chỉ hạ được tốc độ dưới trần METADATA_RATE_PER_HOST (None = theo trần).
+    """
+    rate_limiter = _rate_limiter(rate_per_host)
+    connector = aiohttp.TCPConnector(limit=concurrency, ttl_dns_cache=300)
+    timeout = aiohttp.ClientTimeout(total=video_http.TIMEOUT)
+    async with aiohttp.ClientSession(headers=video_http.HEADERS, connector=connector, timeout=timeout) as session:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(url):
+            async with semaphore:
+                return await fetch_video_data(session, url, rate_limiter, retries)
+
+        tasks = [asyncio.ensure_future(one(url)) for url in urls]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+            # Chờ task bị huỷ kết thúc hẳn trước khi đóng session (không còn request trên session đã đóng)
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def fetch_many_video_data(urls, **options) -> list:
+    return [result async for result in iter_video_data(urls, **options)]
+
+
+async def fetch_tiktok_video_data(url):
+    result = (await fetch_many_video_data([url]))[0]
+    if 'error' in result:
+        raise RuntimeError(f"Failed to fetch video page: {result['error']}")
+    return result
+
+
 def fetch_video_list(file_path):
     with open(file_path, 'r', encoding='utf-8') as f:
         return json.load(f)
 
-def main():
-    input_file = "tiktok_videos.json"
 
-    video_list = fetch_video_list(input_file)
-    all_video_data = []
+def fetch_all_video_data(input_file="tiktok_videos.json", concurrency=DEFAULT_CONCURRENCY,
+                         rate_per_host=None, retries=DEFAULT_RETRIES):
+    urls = [video['url'] for video in fetch_video_list(input_file)]
 
-    for video in video_list:
-        try:
-            video_data = fetch_tiktok_video_data(video['url'])
-            all_video_data.append(video_data)
-            print(f"Fetched data for {video['url']}")
-        except Exception as e:
-            print(f"Failed to fetch data for {video['url']}: {e}")
-
-    print("Results:")
-    print(json.dumps(all_video_data, indent=2, ensure_ascii=False))
+    async def run():
+        all_video_data = []
+        async for result in iter_video_data(urls, concurrency, rate_per_host, retries):
+            if 'error' in result:
+                print(f"Failed to fetch data for {result['video_url']}: {result['error']}")
+                continue
+            print(f"Fetched data for {result['video_url']}")
+            write_item(result)
+            all_video_data.append(result)
+        return all_video_data
+
+    return asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lấy metadata video TikTok song song")
+    parser.add_argument("input_file", nargs="?", default="tiktok_videos.json", help="File JSON [{'url': ...}, ...]")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Số request đồng thời")
+    parser.add_argument("--rate", type=float, default=None,
+                        help=f"Số request/giây mỗi host, chỉ hạ được dưới trần METADATA_RATE_PER_HOST ({DEFAULT_RATE_PER_HOST:g})")
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES, help="Số lần retry mỗi video")
+    args = parser.parse_args()
+
+    all_video_data = fetch_all_video_data(args.input_file, args.concurrency, args.rate, args.retries)
+
+    if not write_result(all_video_data):
+        print("Results:")
+        print(json.dumps(all_video_data, indent=2, ensure_ascii=False))
 
 if __name__ == "__main__":
 
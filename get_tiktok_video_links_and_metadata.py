@@ -1,28 +1,95 @@
 # main.py
+import os
 from datetime import timedelta
 # /app/
 
 
 from crawlee import ConcurrencySettings, Request
 from crawlee.crawlers import PlaywrightCrawler
+from crawlee.storage_clients import MemoryStorageClient
 
-from routes import router
+import crawl_sessions
+import metrics
+import video_http
+from crawl_concurrency import AdaptiveLimiter, classify_error
+from routes import router, pre_navigation_hook, fetch_videos_http
+import result_channel
+from result_channel import write_item, write_result
 
-async def crawl_links_tiktok(url: str, browser_type: str, label: str, max_items: int, max_comments: int) -> None:
-    """The crawler entry point."""
+# Giới hạn concurrency (API truyền qua env của subprocess); CRAWL_MAX_REQUESTS=0: tự tính
+MIN_CONCURRENCY = int(os.getenv("CRAWL_MIN_CONCURRENCY", "1"))
+MAX_CONCURRENCY = int(os.getenv("CRAWL_MAX_CONCURRENCY", "8"))
+MAX_REQUESTS = int(os.getenv("CRAWL_MAX_REQUESTS", "0"))
+
+# Thống kê concurrency của lần crawl gần nhất (AdaptiveLimiter.stats())
+last_concurrency = {}
+
+async def crawl_links_tiktok(urls: list[str], browser_type: str, label: str, max_items: int, max_comments: int,
+                             get_comments: bool = True, enqueue_videos: bool = False,
+                             min_concurrency: int = MIN_CONCURRENCY, max_concurrency: int = MAX_CONCURRENCY,
+                             max_requests: int = MAX_REQUESTS) -> list[dict]:
+    """The crawler entry point. Trả về các item crawler đã push vào dataset.
+
+    Ở chế độ stream item đã được gửi từng cái qua write_item và không nằm trong dataset:
+    trả về [], số item xem ở result_channel.items_written.
+
+    Mọi URL chạy chung một crawler (chung concurrency). Với enqueue_videos, newest/popular
+    enqueue request 'video' cho từng link vào chính crawler này nên profile và video chạy xen kẽ.
+
+    Concurrency nằm trong [min_concurrency, max_concurrency]: Crawlee tự tăng/giảm theo CPU/RAM,
+    AdaptiveLimiter hạ trần concurrency của Crawlee khi tỉ lệ CAPTCHA/timeout tăng.
+    Thống kê để ở `last_concurrency`.
+    """
+    if isinstance(urls, str):
+        urls = urls.split()
+
+    # label video chỉ lấy metadata (get_comments tắt hoặc max_comments <= 0): đọc qua HTTP trước,
+    # chỉ URL HTTP không đọc được (captcha / shell rỗng) mới mở bằng Playwright (cũng không lấy comment)
+    if label == 'video' and not get_comments:
+        max_comments = 0
+    http_items = []
+    if label == 'video' and max_comments <= 0:
+        async def _collect(items) -> None:
+            if not result_channel.streaming():
+                http_items.extend(items)
+            for item in items:
+                write_item(item)
+        urls = await fetch_videos_http(urls, _collect)
 
     # Create a crawler with the necessary settings
+    start = min(max_concurrency, 5)  # mức khởi đầu cũ
     concurrency_settings = ConcurrencySettings(
-        max_concurrency=5,
-        desired_concurrency=5,   # 👈 phải ≤ max_concurrency
-        min_concurrency=1,     # (tuỳ chọn)
+        max_concurrency=max_concurrency,
+        desired_concurrency=start,   # 👈 phải ≤ max_concurrency
+        min_concurrency=min_concurrency,
     )
+    limiter = AdaptiveLimiter(min_concurrency, max_concurrency, start)
+
+    def _finish(context, outcome: str) -> None:
+        # Kết quả request -> limiter (concurrency) + điểm của session đã dùng
+        limiter.record(outcome)
+        crawl_sessions.record(context.session, outcome)
+        limiter.release(context.request.id)
 
+    async def _handle(context) -> None:
+        await router(context)
+        _finish(context, "ok")
+
+    # Dataset + request queue chỉ nằm trong bộ nhớ của lần crawl này: không ghi ./storage,
+    # không lẫn với crawl khác đang chạy song song, tự mất khi process kết thúc
     crawler = PlaywrightCrawler(
+        storage_client=MemoryStorageClient(),
         concurrency_settings=concurrency_settings,
-        request_handler=router,
+        request_handler=_handle,
         headless=True,
-        max_requests_per_crawl=50,
+        # Mỗi session (cookie + UA + viewport + proxy) một browser context riêng;
+        # session bị CAPTCHA được cho nghỉ, retry đi sang session khác
+        use_session_pool=True,
+        session_pool=crawl_sessions.new_pool(),
+        use_incognito_pages=True,
+        proxy_configuration=crawl_sessions.proxy_configuration(),
+        # Mỗi profile + tối đa max_items video của nó
+        max_requests_per_crawl=max_requests or max(50, len(urls) * (1 + max_items if enqueue_videos else 1)),
         request_handler_timeout=timedelta(seconds=1500),
         browser_type=browser_type,
         browser_new_context_options={
@@ -31,25 +98,72 @@ async def crawl_links_tiktok(url: str, browser_type: str, label: str, max_items:
         }
     )
 
+    # Limit của AdaptiveLimiter thành trần concurrency của chính Crawlee (ít page được mở hơn)
+    limiter.bind(crawler)
+
+    @crawler.pre_navigation_hook
+    async def _before_goto(context) -> None:
+        # Đo page.goto / sleep cố định trên page của Crawlee
+        metrics.instrument_page(context.page, "crawlee")
+        await crawl_sessions.apply_identity(context.page, context.session)
+        # Chặn ảnh/font/video/tracker + gắn listener API trước khi trang load
+        await pre_navigation_hook(context)
+        # Chỉ đếm page đang chạy (peak), không chờ
+        await limiter.acquire(context.request.id)
+
+    # Lỗi (kể cả lỗi lúc goto, trước khi vào handler): trả slot + ghi CAPTCHA/timeout
+    @crawler.error_handler
+    async def _on_error(context, error) -> None:
+        _finish(context, classify_error(error))
+
+    @crawler.failed_request_handler
+    async def _on_failed(context, error) -> None:
+        _finish(context, classify_error(error))
+
     # Run the crawler to collect data from several user pages
-    await crawler.run(
-            [Request.from_url(url, user_data={'limit': max_items, 'max_comments': max_comments}, label=label)]
-    )
+    user_data = {
+        'limit': max_items,
+        'max_comments': max_comments,
+        'enqueue_videos': enqueue_videos,
+        'video_max_comments': max_comments if get_comments else 0,
+    }
+    try:
+        if urls:
+            await crawler.run([Request.from_url(url, user_data=dict(user_data), label=label) for url in urls])
+    finally:
+        await video_http.close()
+    if result_channel.streaming():
+        # Item đã stream hết trong lúc crawl: chỉ đếm, không đọc lại (copy) dataset
+        items = []
+        count = result_channel.items_written
+    else:
+        items = http_items + (await crawler.get_data()).items
+        count = len(items)
+    metrics.observe("crawl_items_pushed", count, label=label)
+    last_concurrency.clear()
+    last_concurrency.update(limiter.stats())
+    return items
     
 import sys
 import asyncio
 import json
 if __name__ == '__main__':
     if len(sys.argv) < 4:
-        sys.exit("Usage: python get_tiktok_video_links_and_metadata.py <browser_type> <label> <max_items> <TikTok_URL>")
+        sys.exit("Usage: python get_tiktok_video_links_and_metadata.py <browser_type> <label> <max_items> <get_comments> \"<TikTok_URL> [TikTok_URL ...]\" [max_comments] [enqueue_videos 0|1]")
     
-    tiktok_url = sys.argv[5].strip()
+    tiktok_urls = sys.argv[5].split()
     web = sys.argv[1].strip() if len(sys.argv) > 2 else "chromium"
     label = sys.argv[2].strip() if len(sys.argv) > 3 else "newest"
     max_items = int(sys.argv[3].strip()) if len(sys.argv) > 4 else 30
-    get_comments = sys.argv[4]
-    max_comments = int(sys.argv[6]) if len(sys.argv) > 5 else 100
-    asyncio.run(crawl_links_tiktok(tiktok_url, web, label, max_items, max_comments))
+    get_comments = sys.argv[4].strip().lower() in ("true", "1", "yes")
+    max_comments = int(sys.argv[6]) if len(sys.argv) > 6 else 100
+    enqueue_videos = len(sys.argv) > 7 and sys.argv[7].strip() == "1"
+    result = asyncio.run(crawl_links_tiktok(tiktok_urls, web, label, max_items, max_comments, get_comments, enqueue_videos))
+    if result_channel.streaming():
+        # Item đã được stream từng cái (routes._push_data): frame cuối chỉ báo hoàn tất
+        write_result({"count": result_channel.items_written, "concurrency": last_concurrency})
+    elif not write_result({"items": result, "concurrency": last_concurrency}):
+        print(json.dumps(result, ensure_ascii=False))
         
     
         
\ No newline at end of file
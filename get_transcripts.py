@@ -2,6 +2,7 @@
 import subprocess
 import sys
 import json
+from result_channel import write_result
 from pathlib import Path
 import tempfile
 
@@ -63,12 +64,16 @@ def download_transcript(url: str) -> str:
         print("[DEBUG] Using:", vtt_files[0])
         return vtt_to_text(vtt_files[0])
     
+def get_transcript(url: str) -> dict:
+    return {"transcripts": download_transcript(url)}
+
 if __name__ == "__main__":
     if len(sys.argv) < 2:
         print("Usage: python get_transcripts.py <youtube_url>")
         sys.exit(1)
 
     url = sys.argv[1]
-    transcript = download_transcript(url)
-    print("Result:\n")
-    print(json.dumps({"transcripts": transcript}, ensure_ascii=False))
+    result = get_transcript(url)
+    if not write_result(result):
+        print("Result:\n")
+        print(json.dumps(result, ensure_ascii=False))
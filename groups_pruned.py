@@ -1,5 +1,6 @@
 import os
 import json
+from result_channel import write_result
 import argparse
 from typing import Iterable, List, Tuple, Any
 
@@ -148,6 +149,24 @@ def compute_groups(df_text: pd.DataFrame,
     groups_pruned = groups_pruned[groups_pruned['id_count'] >= min_id_count].reset_index(drop=True)
     return groups_pruned
 
+def get_pruned_groups(db_url: str, nmin: int = 2, nmax: int = 100, eer_min: float = 1.0,
+                      duration_max: int = 60, min_id_count: int = 2) -> List[dict]:
+    """Đọc DB, tính groups_pruned và trả về dạng list[dict] (records)."""
+    engine = create_engine(normalize_db_url(db_url), pool_pre_ping=True)
+    try:
+        df = read_data(engine, eer_min=eer_min, duration_max=duration_max)
+    finally:
+        engine.dispose()
+
+    desc = df.get('description', pd.Series(index=df.index)).fillna('').astype(str)
+    tran = df.get('transcripts', pd.Series(index=df.index)).fillna('').astype(str)
+    clean_text = clean_text_series(desc, tran)
+    df_text = pd.DataFrame({'text': clean_text}, index=df.index)
+    df_text.index.name = "id"
+
+    groups_pruned = compute_groups(df_text, nmin=nmin, nmax=nmax, min_id_count=min_id_count)
+    return groups_pruned.to_dict(orient="records")
+
 import sys
 def main():
     parser = argparse.ArgumentParser(description="In JSON của DataFrame groups_pruned (không giới hạn).")
@@ -170,27 +189,19 @@ def main():
     if not db_url:
         parser.error("Thiếu DB URL: truyền --db-url, hoặc positional db_url, hoặc đặt env DATABASE_URL")
 
-    # (Tuỳ bạn: chuẩn hoá prefix nếu dùng SQLAlchemy)
-    if db_url.startswith("postgres://"):
-        db_url = db_url.replace("postgres://", "postgresql+psycopg2://", 1)
-    db_url = normalize_db_url(db_url)
-
-    engine = create_engine(db_url, pool_pre_ping=True)
-
-    df = read_data(engine, eer_min=args.eer_min, duration_max=args.duration_max)
-
-    desc = df.get('description', pd.Series(index=df.index)).fillna('').astype(str)
-    tran = df.get('transcripts', pd.Series(index=df.index)).fillna('').astype(str)
-    clean_text = clean_text_series(desc, tran)
-    df_text = pd.DataFrame({'text': clean_text}, index=df.index)
-    df_text.index.name = "id"
-
-    groups_pruned = compute_groups(df_text, nmin=args.nmin, nmax=args.nmax, min_id_count=args.min_id_count)
+    out = get_pruned_groups(
+        db_url,
+        nmin=args.nmin,
+        nmax=args.nmax,
+        eer_min=args.eer_min,
+        duration_max=args.duration_max,
+        min_id_count=args.min_id_count,
+    )
 
-    # ✅ In CHỈ nội dung groups_pruned
-    out = groups_pruned.to_dict(orient="records")
-    print("Results:\n")
-    print(json.dumps(out, ensure_ascii=False, indent=2 if args.pretty else None))
+    # ✅ In CHỈ nội dung groups_pruned (chạy dưới API thì ghi vào kênh kết quả)
+    if not write_result(out):
+        print("Results:\n")
+        print(json.dumps(out, ensure_ascii=False, indent=2 if args.pretty else None))
 
 
 if __name__ == "__main__":
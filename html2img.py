@@ -2,7 +2,7 @@ from pathlib import Path
 import argparse
 import tempfile
 import os
-from playwright.sync_api import sync_playwright
+import browser_pool
 
 def parse_size(s: str):
     # "1080x1350" -> (1080, 1350)
@@ -48,13 +48,10 @@ def html_string_to_image(
     try:
         url = Path(temp_html_path).as_uri()
 
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True)
-            context = browser.new_context(
-                viewport={"width": size[0], "height": size[1]},
-                device_scale_factor=scale,
-            )
-            page = context.new_page()
+        with browser_pool.new_page(
+            viewport={"width": size[0], "height": size[1]},
+            device_scale_factor=scale,
+        ) as page:
             page.set_default_timeout(60_000)
 
             page.goto(url, wait_until=wait)
@@ -74,9 +71,6 @@ def html_string_to_image(
 
             page.screenshot(**screenshot_kwargs)
 
-            context.close()
-            browser.close()
-
         print(f"Đã xuất ảnh: {output_path}")
         
     finally:
@@ -157,7 +151,6 @@ if __name__ == "__main__":
     
     # Ví dụ sử dụng html_string_to_image:
     html_example = """<!DOCTYPE html>\n<html lang="en">\n<head>\n    <meta charset="UTF-8">\n    <meta name="viewport" content="width=device-width, initial-scale=1.0">\n    <title>6 Products Poster - TikTok Safe</title>\n    <style>\n        @import url('https://fonts.googleapis.com/css2?family=Dancing+Script:wght@400;500;600;700&display=swap');\n        \n        * {\n            margin: 0;\n            padding: 0;\n            box-sizing: border-box;\n        }\n        \n        .poster {\n            width: 1080px;\n            height: 1350px;\n            background: #f7f7f7;\n            position: relative;\n            font-family: 'Arial', sans-serif;\n        }\n        \n        .safe-area {\n            width: 100%;\n            height: 100%;\n            position: relative;\n        }\n        \n        .grid-container {\n            width: 100%;\n            height: calc(100% - 200px);\n            padding: 30px 30px 20px 30px;\n            display: grid;\n            grid-template-columns: 1fr 2fr;\n            grid-template-rows: 1fr 1fr 1fr;\n            gap: 20px;\n        }\n        \n        .text-area {\n            height: 180px;\n            display: flex;\n            align-items: center;\n            justify-content: center;\n            padding: 0 40px;\n        }\n        \n        .image-container {\n            position: relative;\n            overflow: hidden;\n            border-radius: 15px;\n            box-shadow: 0 8px 25px rgba(0,0,0,0.1);\n            background: white;\n            padding: 12px;\n        }\n        \n        .image-container img {\n            width: 100%;\n            height: 100%;\n            object-fit: cover;\n            object-position: center;\n            border-radius: 8px;\n        }\n        \n        .img-4 img,\n        .img-5 .sub-image img {\n            background: #f7f7f7;\n        }\n        \n        .img-1 { grid-column: 1; grid-row: 1; }\n        .img-2 { grid-column: 2; grid-row: 1 / 3; }\n        .img-3 { grid-column: 1; grid-row: 2; }\n        .img-4 { grid-column: 1; grid-row: 3; }\n        .img-5 {\n            grid-column: 2;\n            grid-row: 3;\n            display: grid;\n            grid-template-columns: 1fr 1fr;\n            gap: 15px;\n            background: none;\n            box-shadow: none;\n            border-radius: 0;\n        }\n        \n        .img-5 .sub-image {\n            border-radius: 15px;\n            overflow: hidden;\n            box-shadow: 0 8px 25px rgba(0,0,0,0.1);\n            background: white;\n            padding: 12px;\n        }\n        \n        .img-5 .sub-image img {\n            width: 100%;\n            height: 100%;\n            object-fit: cover;\n            object-position: center;\n            border-radius: 8px;\n        }\n        \n        .aesthetic-text {\n            font-family: 'Dancing Script', cursive;\n            font-weight: 600;\n            font-size: 47px;\n            color: #333;\n            text-align: center;\n            letter-spacing: 1px;\n            line-height: 1.1;\n            word-wrap: break-word;\n            hyphens: auto;\n            max-width: 100%;\n        }\n    </style>\n</head>\n<body>\n    <div class="poster">\n        <div class="safe-area">\n            <div class="grid-container">\n                <div class="image-container img-1">\n                    <img src="https://cdn.pnj.io/images/detailed/252/on-gnnpxmw000036-nhan-vang-10k-dinh-da-peridot-pnj-1.jpg" alt="Product 1">\n                </div>\n                <div class="image-container img-2">\n                    <img src="https://cdn.pnj.io/images/detailed/252/on-gnnpxmw000036-nhan-vang-10k-dinh-da-peridot-pnj-2.jpg" alt="Product 2">\n                </div>\n                <div class="image-container img-3">\n                    <img src="https://cdn.pnj.io/images/detailed/252/on-gnnpxmw000036-nhan-vang-10k-dinh-da-peridot-pnj-3.jpg" alt="Product 3">\n                </div>\n                <div class="image-container img-4">\n                    <img src="https://cdn.pnj.io/images/detailed/252/sp-gnnpxmw000036-nhan-vang-10k-dinh-da-peridot-pnj-1.png" alt="Product 4">\n                </div>\n                <div class="img-5">\n                    <div class="sub-image">\n                        <img src="https://cdn.pnj.io/images/detailed/252/sp-gnnpxmw000036-nhan-vang-10k-dinh-da-peridot-pnj-2.png" alt="Product 5">\n                    </div>\n                    <div class="sub-image">\n                        <img src="https://cdn.pnj.io/images/detailed/252/sp-gnnpxmw000036-nhan-vang-10k-dinh-da-peridot-pnj-3.png" alt="Product 6">\n                    </div>\n                </div>\n            </div>\n            \n            <div class="text-area">\n                <div class="aesthetic-text">Mời đoàn mình xem Nhẫn Peridot PNJ! Đẹp sang chảnh, Gen Z mê tít!</div>\n            </div>\n        </div>\n    </div>\n</body>\n</html>"""
-    html_example = 
     # Uncomment để test:
     html_string_to_image(html_example, "test_output.png")
     
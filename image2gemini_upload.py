@@ -11,6 +11,7 @@ import requests
 from pathlib import Path
 from mimetypes import guess_type
 import json
+from result_channel import write_result
 
 TMP_DIR = Path("/tmp/my_images")
 TMP_DIR.mkdir(parents=True, exist_ok=True)
@@ -23,7 +24,7 @@ def download_image(url: str) -> Path:
 
     r = requests.get(url, timeout=30)
     if not r.ok:
-        sys.exit("Lỗi tải ảnh")
+        raise RuntimeError(f"Lỗi tải ảnh: HTTP {r.status_code}")
 
     with out_path.open("wb") as f:
         f.write(r.content)
@@ -43,19 +44,23 @@ def upload_gemini(file_path: Path, gemini_api_key) -> dict:
     r.raise_for_status()
     return r.json()
 
+def download_and_upload(gemini_api_key: str, img_url: str) -> dict:
+    img_file = download_image(img_url)
+    try:
+        return upload_gemini(img_file, gemini_api_key)
+    finally:
+        if img_file.exists():
+            img_file.unlink(missing_ok=True)
+
 def main():
     if len(sys.argv) < 3:
         sys.exit("Cách dùng: python image2gemini_upload.py <gemini_api_key> <Image_URL>")
 
     img_url = sys.argv[2].strip()
-    img_file = download_image(img_url)
     gemini_api_key = sys.argv[1].strip()
-    try:
-        resp = upload_gemini(img_file, gemini_api_key)
+    resp = download_and_upload(gemini_api_key, img_url)
+    if not write_result(resp):
         print(json.dumps(resp, indent=2, ensure_ascii=False))
-    finally:
-        if img_file.exists():
-            img_file.unlink(missing_ok=True)
 
 if __name__ == "__main__":
     main()
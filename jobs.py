@@ -0,0 +1,183 @@
+"""
+jobs.py
+-------
+Job bất đồng bộ cho các crawl/render dài: POST trả job_id ngay, client poll
+GET /jobs/{id} để lấy trạng thái, tiến độ, kết quả tạm và kết quả cuối,
+thay vì giữ kết nối HTTP tới 900s (9000s với video).
+
+Job lưu trong bộ nhớ, giới hạn số lượng và bị xoá sau TTL khi đã xong.
+
+Cấu hình qua biến môi trường:
+  JOB_STORE_MAX        số job tối đa giữ trong store (mặc định: 200)
+  JOB_TTL_SECONDS      thời gian giữ job sau khi xong (mặc định: 3600)
+  JOB_RUNNER_THREADS   số job chạy đồng thời (mặc định: 16)
+"""
+
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+JOB_STORE_MAX = int(os.getenv("JOB_STORE_MAX", "200"))
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", "3600"))
+JOB_RUNNER_THREADS = int(os.getenv("JOB_RUNNER_THREADS", "16"))
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class JobStoreFull(RuntimeError):
+    pass
+
+
+class Job:
+    def __init__(self, kind: str) -> None:
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.state = QUEUED
+        self.progress = {}
+        self.partial_results = []
+        self.result = None
+        self.result_file = None  # đường dẫn file kết quả (vd: video render xong)
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def done(self) -> bool:
+        return self.state in (SUCCEEDED, FAILED)
+
+    def set_progress(self, **progress) -> None:
+        with self._lock:
+            self.progress.update(progress)
+
+    def add_partial(self, items) -> None:
+        with self._lock:
+            if isinstance(items, list):
+                self.partial_results.extend(items)
+            else:
+                self.partial_results.append(items)
+
+    def on_event(self, kind: str, payload=None) -> None:
+        """Nhận sự kiện từ worker_pool: "progress" (dict), "items" (item/list item) hoặc
+        "restart" (job được chạy lại từ đầu trên pool mới: bỏ tiến độ và item tạm cũ)."""
+        if kind == "progress" and isinstance(payload, dict):
+            self.set_progress(**payload)
+        elif kind == "items":
+            self.add_partial(payload)
+        elif kind == "restart":
+            with self._lock:
+                self.progress.clear()
+                self.partial_results = []
+
+    def finish(self, result=None, error=None) -> None:
+        """Chuyển sang SUCCEEDED/FAILED. finished_at được ghi cùng lúc với state (dưới lock) để
+        không ai thấy job đã xong mà finished_at còn None; xong thì bỏ partial_results vì
+        `result` đã chứa đủ item (job lỗi thì giữ lại phần đã lấy được)."""
+        with self._lock:
+            self.finished_at = time.time()
+            if error is None:
+                self.result = result
+                self.partial_results = []
+                self.state = SUCCEEDED
+            else:
+                self.error = error
+                self.state = FAILED
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            data = {
+                "job_id": self.id,
+                "kind": self.kind,
+                "state": self.state,
+                "progress": dict(self.progress),
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+            if self.state == SUCCEEDED:
+                data["result"] = None if self.result_file else self.result
+                data["has_file"] = bool(self.result_file)
+            else:
+                data["partial_results"] = list(self.partial_results)
+            if self.error:
+                data["error"] = self.error
+            return data
+
+    def cleanup(self) -> None:
+        if self.result_file:
+            try:
+                os.unlink(self.result_file)
+            except OSError:
+                pass
+
+
+class JobStore:
+    def __init__(self, max_jobs: int = JOB_STORE_MAX, ttl: int = JOB_TTL_SECONDS) -> None:
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self) -> None:
+        now = time.time()
+        expired = [
+            jid for jid, job in self._jobs.items()
+            if job.done and job.finished_at is not None and now - job.finished_at > self.ttl
+        ]
+        for jid in expired:
+            self._jobs.pop(jid).cleanup()
+
+        # Vẫn quá giới hạn: bỏ các job đã xong cũ nhất (job đang chạy thì giữ)
+        if len(self._jobs) >= self.max_jobs:
+            for jid in [jid for jid, job in self._jobs.items() if job.done]:
+                if len(self._jobs) < self.max_jobs:
+                    break
+                self._jobs.pop(jid).cleanup()
+
+    def create(self, kind: str) -> Job:
+        with self._lock:
+            self._evict()
+            if len(self._jobs) >= self.max_jobs:
+                raise JobStoreFull(f"Đang có {len(self._jobs)} job chưa xong, thử lại sau")
+            job = Job(kind)
+            self._jobs[job.id] = job
+            return job
+
+    def get(self, job_id: str):
+        with self._lock:
+            self._evict()
+            return self._jobs.get(job_id)
+
+
+store = JobStore()
+_runner = ThreadPoolExecutor(max_workers=JOB_RUNNER_THREADS, thread_name_prefix="job")
+
+
+def _run(job: Job, func, args, kwargs) -> None:
+    job.state = RUNNING
+    job.started_at = time.time()
+    try:
+        result = func(job, *args, **kwargs)
+    except Exception as e:
+        # HTTPException mang thông tin lỗi trong .detail
+        job.finish(error=str(getattr(e, "detail", None) or e))
+    else:
+        job.finish(result)
+
+
+def submit(kind: str, func, *args, **kwargs) -> Job:
+    """Tạo job và chạy `func(job, *args, **kwargs)` ở thread nền.
+
+    `func` trả về kết quả cuối; có thể gọi job.set_progress()/job.add_partial(),
+    hoặc truyền `on_event=job.on_event` cho worker_pool để nhận tiến độ từ worker.
+    """
+    job = store.create(kind)
+    _runner.submit(_run, job, func, args, kwargs)
+    return job
@@ -1,6 +1,7 @@
 
 import os
 import wave
+from result_channel import write_result
 import contextlib
 from natsort import natsorted
 from moviepy import AudioFileClip, TextClip, ColorClip, ImageClip, CompositeVideoClip, vfx, afx
@@ -242,18 +243,24 @@ def delete_resource(script_dir='./script', audio_dir='./audio', image_dir='./ima
     if os.path.exists(image_dir) and os.path.isdir(image_dir):
         shutil.rmtree(image_dir)
 
-def main(transcripts, wav_urls, image_urls, fps=30, show_script=False):
-    delete_resource()
-    save_transcripts_to_folder(transcripts)
-    download_wavs_from_urls(wav_urls)
-    download_images_from_urls(image_urls)
-    make_video(fps=fps, show_script=show_script)
+def main(transcripts, wav_urls, image_urls, fps=30, show_script=False, work_dir='.'):
+    """Render video vào <work_dir>/audio/my_video.mp4.
+    Truyền work_dir riêng cho mỗi job để nhiều lần render chạy song song không đè file của nhau."""
+    script_dir = os.path.join(work_dir, 'script')
+    audio_dir = os.path.join(work_dir, 'audio')
+    image_dir = os.path.join(work_dir, 'image')
+    delete_resource(script_dir, audio_dir, image_dir)
+    save_transcripts_to_folder(transcripts, script_dir)
+    download_wavs_from_urls(wav_urls, audio_dir)
+    download_images_from_urls(image_urls, image_dir)
+    make_video(script_dir, audio_dir, image_dir, fps=fps, show_script=show_script)
+    return os.path.join(audio_dir, 'my_video.mp4')
     
 import sys
 if __name__ == "__main__":
     import json
     if len(sys.argv) < 6:
-        print("Usage: python make_video_from_image.py <transcripts_json> <wav_urls_json> <image_urls_json> <fps> <show_script>")
+        print("Usage: python make_video_from_image.py <transcripts_json> <wav_urls_json> <image_urls_json> <fps> <show_script> [work_dir]")
         sys.exit(1)
 
     transcripts = json.loads(sys.argv[1])
@@ -261,5 +268,7 @@ if __name__ == "__main__":
     image_urls = json.loads(sys.argv[3])
     fps = int(sys.argv[4])
     show_script = sys.argv[5].lower() in ("true", "1", "yes")
+    work_dir = sys.argv[6] if len(sys.argv) > 6 else '.'
 
-    main(transcripts, wav_urls, image_urls, fps=fps, show_script=show_script)
\ No newline at end of file
+    video_path = main(transcripts, wav_urls, image_urls, fps=fps, show_script=show_script, work_dir=work_dir)
+    write_result({"video_path": os.path.abspath(video_path)})
\ No newline at end of file
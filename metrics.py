@@ -0,0 +1,347 @@
+"""
+metrics.py
+----------
+Metrics kiểu Prometheus (counter + histogram) cho API, worker của worker_pool và các script
+chạy bằng subprocess, xuất ra GET /metrics (text format 0.0.4, không cần prometheus_client).
+
+Mỗi process giữ số liệu trong bộ nhớ. Nếu có env METRICS_DIR (API process đặt qua
+setup_multiprocess() trước khi spawn worker/subprocess), process ghi snapshot vào
+METRICS_DIR/<pid>.json tối đa 1 lần/giây, sau mỗi task của worker và khi thoát.
+API cộng dồn snapshot của mọi process khi bị scrape; file của process đã chết được gộp vào
+archive.json rồi xoá, nên số file không tăng theo số subprocess đã chạy.
+
+Chạy nhiều worker uvicorn thì các API process dùng chung METRICS_DIR: mỗi API process cũng
+ghi snapshot của chính nó, nên scrape vào worker nào cũng thấy số liệu của cả server; việc
+gộp vào archive.json giữ flock trên METRICS_DIR/.lock để hai API process không gộp trùng.
+
+    metrics.inc("captcha_detected_total", label="video")
+    with metrics.timer("db_write_seconds", target="trending_music"):
+        ...
+"""
+
+import atexit
+import fcntl
+import functools
+import inspect
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+ENV_DIR = "METRICS_DIR"
+FLUSH_INTERVAL = 1.0
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 900)
+COUNT_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+# Tên metric -> (loại, mô tả, buckets)
+METRICS = {
+    "http_request_duration_seconds": ("histogram", "Latency request HTTP theo route", LATENCY_BUCKETS),
+    "worker_init_seconds": ("histogram", "Thời gian khởi động worker (import + warm browser)", LATENCY_BUCKETS),
+    "worker_queue_seconds": ("histogram", "Thời gian task chờ trong hàng đợi worker_pool", LATENCY_BUCKETS),
+    "worker_task_seconds": ("histogram", "Thời gian chạy task trên worker", LATENCY_BUCKETS),
+    "worker_killed_total": ("counter", "Số worker bị kill vì task quá timeout", None),
+    "worker_resubmitted_total": ("counter", "Số job được gửi lại lên pool mới vì pool cũ bị bỏ khi kill job khác", None),
+    "subprocess_spawn_seconds": ("histogram", "Thời gian spawn subprocess", LATENCY_BUCKETS),
+    "subprocess_duration_seconds": ("histogram", "Tổng thời gian chạy subprocess", LATENCY_BUCKETS),
+    "browser_launch_seconds": ("histogram", "Thời gian launch Chromium của browser_pool", LATENCY_BUCKETS),
+    "page_goto_seconds": ("histogram", "Thời gian page.goto", LATENCY_BUCKETS),
+    "fixed_sleep_seconds_total": ("counter", "Tổng thời gian nằm trong các sleep cố định (wait_for_timeout)", None),
+    "captcha_detected_total": ("counter", "Số lần phát hiện CAPTCHA", None),
+    "crawl_retries_total": ("counter", "Số request crawl bị ép retry", None),
+    "crawl_items_pushed": ("histogram", "Số item push_data mỗi lần crawl", COUNT_BUCKETS),
+    "db_write_seconds": ("histogram", "Latency ghi DB của save_trending_*", LATENCY_BUCKETS),
+    "admission_queue_seconds": ("histogram", "Thời gian request chờ slot của lớp admission", LATENCY_BUCKETS),
+    "admission_rejected_total": ("counter", "Số request bị admission từ chối (429/503)", None),
+    "crawl_blocked_requests_total": ("counter", "Số request bị chặn bởi crawl_blocking", None),
+    "crawl_response_bytes_total": ("counter", "Số byte response (content-length) page của Crawlee đã tải", None),
+    "crawl_concurrency_changes_total": ("counter", "Số lần AdaptiveLimiter tăng/giảm concurrency của crawl", None),
+    "crawl_concurrency_unbound_total": ("counter", "Số lần crawl mà AdaptiveLimiter không gắn được vào AutoscaledPool của Crawlee", None),
+    "crawl_session_events_total": ("counter", "Sự kiện của session pool crawl (cooldown/cooldown_skip/retired)", None),
+    "video_http_fetch_total": ("counter", "Số lần đọc trang video qua HTTP theo kết quả (ok/status/shell/empty/error)", None),
+}
+
+_lock = threading.Lock()
+_collect_lock = threading.Lock()
+_counters = {}  # (name, labels) -> value
+_hists = {}  # (name, labels) -> [bucket counts..., sum, count]
+_dirty = False
+_last_flush = 0.0
+_atexit_registered = False
+
+
+def _labels(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name: str, value: float = 1, **labels) -> None:
+    global _dirty
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+        _dirty = True
+    _maybe_flush()
+
+
+def observe(name: str, value: float, **labels) -> None:
+    global _dirty
+    buckets = METRICS[name][2]
+    key = (name, _labels(labels))
+    with _lock:
+        h = _hists.get(key)
+        if h is None:
+            h = _hists[key] = [0] * len(buckets) + [0.0, 0]
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                h[i] += 1
+        h[-2] += value
+        h[-1] += 1
+        _dirty = True
+    _maybe_flush()
+
+
+@contextmanager
+def timer(name: str, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def timed(name: str, **labels):
+    """Decorator đo thời gian chạy hàm (sync hoặc async) vào histogram `name`."""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with timer(name, **labels):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(name, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def instrument_page(page, source: str):
+    """Bọc page.goto (đo thời gian) và page.wait_for_timeout (cộng dồn sleep cố định) của một page Playwright."""
+    if getattr(page, "_metrics_instrumented", False):
+        return page
+    page._metrics_instrumented = True
+    goto = page.goto
+    wait_for_timeout = page.wait_for_timeout
+
+    if inspect.iscoroutinefunction(goto):
+        async def timed_goto(*args, **kwargs):
+            with timer("page_goto_seconds", source=source):
+                return await goto(*args, **kwargs)
+
+        async def counted_wait(timeout, *args, **kwargs):
+            inc("fixed_sleep_seconds_total", timeout / 1000, source=source)
+            return await wait_for_timeout(timeout, *args, **kwargs)
+    else:
+        def timed_goto(*args, **kwargs):
+            with timer("page_goto_seconds", source=source):
+                return goto(*args, **kwargs)
+
+        def counted_wait(timeout, *args, **kwargs):
+            inc("fixed_sleep_seconds_total", timeout / 1000, source=source)
+            return wait_for_timeout(timeout, *args, **kwargs)
+
+    page.goto = timed_goto
+    page.wait_for_timeout = counted_wait
+    return page
+
+
+# ===== Multi-process =====
+def setup_multiprocess(path: str | None = None) -> str:
+    """Gọi trong API process trước khi spawn worker/subprocess: bật METRICS_DIR.
+
+    Không xoá thư mục: các worker uvicorn khác có thể đang dùng chung. Snapshot của process
+    đã chết (lần chạy trước, hoặc subprocess của worker khác) chỉ được gộp vào archive.json.
+    """
+    path = path or os.getenv(ENV_DIR) or os.path.join(tempfile.gettempdir(), "video_api_metrics")
+    os.makedirs(path, exist_ok=True)
+    os.environ[ENV_DIR] = path
+    with _locked(path):
+        _collect_files(path, {"counters": {}, "hists": {}})
+    return path
+
+
+@contextmanager
+def _locked(path: str):
+    """Khoá giữa các thread (_collect_lock) và giữa các API process (flock trên METRICS_DIR/.lock)."""
+    with _collect_lock, open(os.path.join(path, ".lock"), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _snapshot() -> dict:
+    with _lock:
+        return {
+            "counters": [[name, list(labels), value] for (name, labels), value in _counters.items()],
+            "hists": [[name, list(labels), list(h)] for (name, labels), h in _hists.items()],
+        }
+
+
+def _write_json(path: str, data: dict) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def flush() -> None:
+    """Ghi snapshot của process hiện tại vào METRICS_DIR (không làm gì nếu chưa bật)."""
+    global _dirty, _last_flush
+    path = os.getenv(ENV_DIR)
+    if not path or not _dirty:
+        return
+    _dirty = False
+    _last_flush = time.monotonic()
+    try:
+        _write_json(os.path.join(path, f"{os.getpid()}.json"), _snapshot())
+    except Exception as e:
+        print(f"[WARNING] không ghi được metrics: {e}")
+
+
+def _maybe_flush() -> None:
+    global _atexit_registered
+    if not os.getenv(ENV_DIR):
+        return
+    if not _atexit_registered:
+        _atexit_registered = True
+        atexit.register(flush)
+    if time.monotonic() - _last_flush >= FLUSH_INTERVAL:
+        flush()
+
+
+def _add(total: dict, counters, hists) -> None:
+    for key, value in counters:
+        total["counters"][key] = total["counters"].get(key, 0) + value
+    for key, h in hists:
+        cur = total["hists"].get(key)
+        if cur is None or len(cur) != len(h):
+            total["hists"][key] = list(h)
+        else:
+            total["hists"][key] = [a + b for a, b in zip(cur, h)]
+
+
+def _merge(total: dict, snap: dict) -> None:
+    """Cộng một snapshot (dạng JSON của _snapshot()) vào `total`."""
+    _add(
+        total,
+        (((name, tuple(map(tuple, labels))), value) for name, labels, value in snap.get("counters", [])),
+        (((name, tuple(map(tuple, labels))), h) for name, labels, h in snap.get("hists", [])),
+    )
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+        return True
+    except OSError:
+        return False
+
+
+def collect() -> dict:
+    """Số liệu đã cộng dồn: process hiện tại + snapshot các process khác + archive."""
+    total = {"counters": {}, "hists": {}}
+    _merge(total, _snapshot())
+
+    path = os.getenv(ENV_DIR)
+    if not path or not os.path.isdir(path):
+        return total
+
+    with _locked(path):
+        archive = _collect_files(path, total)
+    _add(total, archive["counters"].items(), archive["hists"].items())
+    return total
+
+
+def _collect_files(path: str, total: dict) -> dict:
+    """Cộng snapshot của process còn sống vào `total`; gộp process đã chết vào archive và trả archive."""
+    archive_path = os.path.join(path, "archive.json")
+    archive = {"counters": {}, "hists": {}}
+    try:
+        with open(archive_path, "r", encoding="utf-8") as f:
+            _merge(archive, json.load(f))
+    except (OSError, ValueError):
+        pass
+
+    archived = []
+    for filename in os.listdir(path):
+        stem, ext = os.path.splitext(filename)
+        if ext != ".json" or not stem.isdigit() or int(stem) == os.getpid():
+            continue
+        file_path = os.path.join(path, filename)
+        try:
+            with open(file_path, "r", encoding="utf-8") as f:
+                snap = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if _alive(int(stem)):
+            _merge(total, snap)
+        else:
+            # Process đã thoát: gộp vào archive để không phải đọc lại file này
+            _merge(archive, snap)
+            archived.append(file_path)
+
+    if archived:
+        _write_json(archive_path, {
+            "counters": [[n, list(l), v] for (n, l), v in archive["counters"].items()],
+            "hists": [[n, list(l), h] for (n, l), h in archive["hists"].items()],
+        })
+        for file_path in archived:
+            try:
+                os.unlink(file_path)
+            except OSError:
+                pass
+    return archive
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_labels(labels, extra=()) -> str:
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+def _fmt_float(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def render() -> str:
+    """Xuất toàn bộ metrics theo Prometheus text format 0.0.4."""
+    data = collect()
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == "counter":
+            for (n, labels), value in sorted(data["counters"].items()):
+                if n == name:
+                    lines.append(f"{name}{_fmt_labels(labels)} {_fmt_float(value)}")
+            continue
+        for (n, labels), h in sorted(data["hists"].items()):
+            if n != name:
+                continue
+            for bound, count in zip(buckets, h):
+                lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', _fmt_float(bound))])} {count}")
+            lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', '+Inf')])} {h[-1]}")
+            lines.append(f"{name}_sum{_fmt_labels(labels)} {_fmt_float(h[-2])}")
+            lines.append(f"{name}_count{_fmt_labels(labels)} {h[-1]}")
+    return "\n".join(lines) + "\n"
@@ -1,9 +1,12 @@
-from playwright.sync_api import sync_playwright
+import browser_pool
+import metrics
+from result_channel import write_result
 import json
 import gc
 import time
 import sys
 from urllib.parse import unquote, urljoin
+from worker_pool import emit
 
 BASE_URL = "https://www.tiktok.com/music/"
 
@@ -53,159 +56,132 @@ def select_dropdown_option(page, placeholder_text, value, option_selector):
 
 # ===== Main Crawler =====
 def crawl_tiktok_audio(url, limit=1000, period='7'):
-    with sync_playwright() as p:
-        browser = p.chromium.launch(
-            headless=True,
-            args=[
-                "--disable-blink-features=AutomationControlled",
-                "--no-sandbox",
-                "--disable-dev-shm-usage",
-                "--disable-web-security",
-                "--disable-features=IsolateOrigins,site-per-process"
-            ]
-        )
-
-        context = browser.new_context(
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36",
-            viewport={"width": 1280, "height": 720},
-            bypass_csp=True,
-            java_script_enabled=True
-        )
-
-        def route_filter(route, request):
-            if request.resource_type in BLOCKED_TYPES or any(k in request.url.lower() for k in BLOCKED_KEYWORDS):
-                return route.abort()
-            return route.continue_()
+    route_filter = browser_pool.make_route_filter(BLOCKED_TYPES, BLOCKED_KEYWORDS)
 
-        context.route("**/*", route_filter)
-        page = context.new_page()
+    with browser_pool.new_page(block=route_filter, **browser_pool.DEFAULT_CONTEXT) as page:
+        page.goto(url)
+        page.wait_for_load_state("domcontentloaded")
+        log(f"Navigated to {url}")
 
+        # Close banner if present
         try:
-            page.goto(url)
-            page.wait_for_load_state("domcontentloaded")
-            log(f"Navigated to {url}")
-
-            # Close banner if present
-            try:
-                banner = page.wait_for_selector("#ccModuleBannerWrap div div div div", timeout=5000)
-                banner.click()
-                page.wait_for_timeout(1000)
-                log("Banner clicked.")
-            except:
-                log("Banner not found or clickable.")
-
-            # Set language to Vietnamese
-            select_dropdown_option(
-                page,
-                "Nhập/chọn từ danh sách",
-                "việt nam",
-                'div.byted-select-popover-panel-inner span.byted-high-light:has-text("Việt Nam")'
+            banner = page.wait_for_selector("#ccModuleBannerWrap div div div div", timeout=5000)
+            banner.click()
+            page.wait_for_timeout(1000)
+            log("Banner clicked.")
+        except:
+            log("Banner not found or clickable.")
+
+        # Set language to Vietnamese
+        select_dropdown_option(
+            page,
+            "Nhập/chọn từ danh sách",
+            "việt nam",
+            'div.byted-select-popover-panel-inner span.byted-high-light:has-text("Việt Nam")'
+        )
+        
+        # ===== Kiểm tra đã chọn ngôn ngữ là "Việt Nam" =====
+        try:
+            lang_selector = page.wait_for_selector(
+                "#ccModuleBannerWrap div div div div span span span span div span:nth-child(1)",
+                timeout=5000
             )
-            
-            # ===== Kiểm tra đã chọn ngôn ngữ là "Việt Nam" =====
-            try:
-                lang_selector = page.wait_for_selector(
-                    "#ccModuleBannerWrap div div div div span span span span div span:nth-child(1)",
-                    timeout=5000
-                )
-                current_lang = lang_selector.inner_text().strip()
-                if current_lang != "Việt Nam":
-                    raise ValueError(f"Ngôn ngữ hiện tại là '{current_lang}', không phải 'Việt Nam'")
-                log("Đã xác nhận ngôn ngữ là 'Việt Nam'.")
-            except Exception as e:
-                log(f"Lỗi khi kiểm tra ngôn ngữ: {e}", "ERROR")
-                return []
-
-            page.wait_for_selector('#soundPeriodSelect > span > div > div', timeout=10000)
-
-            period_button = page.query_selector('#soundPeriodSelect > span > div > div')
-            if period_button:
-                period_button.click()
-                page.wait_for_selector(f"div.creative-component-single-line:has-text('{period} ngày qua')", timeout=5000)
-
-
-                month_period = page.query_selector(f"div.creative-component-single-line:has-text('{period} ngày qua')")
-                if month_period:
-                    month_period.click()
-                    log(f"Đã chọn khoảng thời gian '{period}'.")
-            else:
-                log("Không tìm thấy nút chọn khoảng thời gian.", "ERROR")
-                return []
-            
-            try:
-                page.wait_for_selector('a.index-mobile_goToDetailBtnWrapper__puubr', timeout=10000)
-                log("Video elements loaded.")
-            except:
-                log("Video elements not found. Exiting.", "ERROR")
-                return []
-
-            collected = []
-            seen_ids = set()
-            empty_attempts = 0
-
-            while len(collected) < limit:
-                video_elements = page.query_selector_all('a.index-mobile_goToDetailBtnWrapper__puubr')
-                new_found = 0
-
-                for el in video_elements[-20:]:  # Only scan the most recent ones
-                    audio_url = el.get_attribute("href")
-                    if audio_url and audio_url not in seen_ids:
-                        song_name, song_id = extract_song_info(audio_url)
-                        key = song_id or song_name
-                        if key in seen_ids:
-                            continue
-                        seen_ids.add(key)
-
-                        if song_id:
-                            full_url = f"{BASE_URL}{song_name}-{song_id}"
-                        else:
-                            full_url = None
-
-                        collected.append({
-                            "audio_url": full_url,    # URL TikTok public dạng /music/tên-bài-ID
-                            "song_name": song_name,   # chỉ chữ
-                            "song_id": song_id
-                        })
-                        new_found += 1
-
-                if new_found == 0:
-                    empty_attempts += 1
-                    log(f"No new videos found. Attempt {empty_attempts}/3")
-                    if empty_attempts >= 3:
-                        log("No new videos for 3 consecutive attempts. Stopping.")
-                        break
-                else:
-                    empty_attempts = 0
-
-                log(f"Collected {len(collected)} / {limit} videos...")
-
-                if len(collected) >= limit:
-                    break
-
-                view_more = page.query_selector('#ccContentContainer > div.BannerLayout_listWrapper__2FJA_ > div > div:nth-child(2) > div.InduceLogin_induceLogin__pN61i > div > div.ViewMoreBtn_viewMoreBtn__fOkv2 > div')
-                if view_more:
-                    view_more.scroll_into_view_if_needed()
-                    page.wait_for_timeout(500)
-                    view_more.click()
-                    log("Clicked 'View More' button.")
-                    try:
-                        page.wait_for_function(
-                            f'#ccContentContainer > div.BannerLayout_listWrapper__2FJA_ > div > div:nth-child(2) > div.CommonDataList_listWrap__4ejAT.index-mobile_listWrap__INNh7.SoundList_soundListWrapper__Ab_az > div:nth-child(1) > div > div > a.length > {len(seen_ids)}',
-                            timeout=10000
-                        )
-                    except:
-                        page.wait_for_timeout(2000)
-                else:
-                    log("No 'View More' button found. Stopping.")
+            current_lang = lang_selector.inner_text().strip()
+            if current_lang != "Việt Nam":
+                raise ValueError(f"Ngôn ngữ hiện tại là '{current_lang}', không phải 'Việt Nam'")
+            log("Đã xác nhận ngôn ngữ là 'Việt Nam'.")
+        except Exception as e:
+            log(f"Lỗi khi kiểm tra ngôn ngữ: {e}", "ERROR")
+            return []
+
+        page.wait_for_selector('#soundPeriodSelect > span > div > div', timeout=10000)
+
+        period_button = page.query_selector('#soundPeriodSelect > span > div > div')
+        if period_button:
+            period_button.click()
+            page.wait_for_selector(f"div.creative-component-single-line:has-text('{period} ngày qua')", timeout=5000)
+
+
+            month_period = page.query_selector(f"div.creative-component-single-line:has-text('{period} ngày qua')")
+            if month_period:
+                month_period.click()
+                log(f"Đã chọn khoảng thời gian '{period}'.")
+        else:
+            log("Không tìm thấy nút chọn khoảng thời gian.", "ERROR")
+            return []
+        
+        try:
+            page.wait_for_selector('a.index-mobile_goToDetailBtnWrapper__puubr', timeout=10000)
+            log("Video elements loaded.")
+        except:
+            log("Video elements not found. Exiting.", "ERROR")
+            return []
+
+        collected = []
+        seen_ids = set()
+        empty_attempts = 0
+
+        while len(collected) < limit:
+            video_elements = page.query_selector_all('a.index-mobile_goToDetailBtnWrapper__puubr')
+            new_found = 0
+
+            for el in video_elements[-20:]:  # Only scan the most recent ones
+                audio_url = el.get_attribute("href")
+                if audio_url and audio_url not in seen_ids:
+                    song_name, song_id = extract_song_info(audio_url)
+                    key = song_id or song_name
+                    if key in seen_ids:
+                        continue
+                    seen_ids.add(key)
+
+                    if song_id:
+                        full_url = f"{BASE_URL}{song_name}-{song_id}"
+                    else:
+                        full_url = None
+
+                    collected.append({
+                        "audio_url": full_url,    # URL TikTok public dạng /music/tên-bài-ID
+                        "song_name": song_name,   # chỉ chữ
+                        "song_id": song_id
+                    })
+                    new_found += 1
+
+            if new_found == 0:
+                empty_attempts += 1
+                log(f"No new videos found. Attempt {empty_attempts}/3")
+                if empty_attempts >= 3:
+                    log("No new videos for 3 consecutive attempts. Stopping.")
                     break
+            else:
+                empty_attempts = 0
+
+            log(f"Collected {len(collected)} / {limit} videos...")
+            emit("progress", {"period": period, "collected": len(collected), "limit": limit})
+
+            if len(collected) >= limit:
+                break
+
+            view_more = page.query_selector('#ccContentContainer > div.BannerLayout_listWrapper__2FJA_ > div > div:nth-child(2) > div.InduceLogin_induceLogin__pN61i > div > div.ViewMoreBtn_viewMoreBtn__fOkv2 > div')
+            if view_more:
+                view_more.scroll_into_view_if_needed()
+                page.wait_for_timeout(500)
+                view_more.click()
+                log("Clicked 'View More' button.")
+                try:
+                    page.wait_for_function(
+                        f'#ccContentContainer > div.BannerLayout_listWrapper__2FJA_ > div > div:nth-child(2) > div.CommonDataList_listWrap__4ejAT.index-mobile_listWrap__INNh7.SoundList_soundListWrapper__Ab_az > div:nth-child(1) > div > div > a.length > {len(seen_ids)}',
+                        timeout=10000
+                    )
+                except:
+                    page.wait_for_timeout(2000)
+            else:
+                log("No 'View More' button found. Stopping.")
+                break
 
-                gc.collect()
+            gc.collect()
 
-            return collected[:limit]
+        return collected[:limit]
 
-        finally:
-            context.close()
-            browser.close()
 import os
 import re
 import sys
@@ -244,6 +220,7 @@ def parse_song_from_url(audio_url: str) -> Tuple[Optional[str], Optional[str]]:
 def normalize_text(s: Optional[str]) -> str:
     return (s or "").strip()
 
+@metrics.timed("db_write_seconds", target="trending_music")
 def save_trending_music(musics: List[Dict[str, str]], period) -> None:
     """
     Ghi vào tiktok_trends_music(audio_url, song_name, song_id, ranking).
@@ -322,16 +299,25 @@ def save_trending_music(musics: List[Dict[str, str]], period) -> None:
     finally:
         conn.close()
 
+def crawl_and_save_trending_audio(limit=10, periods=(7, 30, 120)):
+    """Crawl + lưu nhạc trending cho từng period, trả về toàn bộ bài hát kèm period/ranking."""
+    all_results = []
+    for i, period in enumerate(periods, start=1):
+        log(f"Starting crawl with limit={limit} and period={period} days...")
+        result = crawl_tiktok_audio(TIKTOK_URL, limit=int(limit), period=period)
+        save_trending_music(result, period)
+        items = [{**item, "period": period, "ranking": idx} for idx, item in enumerate(result, start=1)]
+        all_results.extend(items)
+        emit("items", items)
+        emit("progress", {"periods_done": i, "periods_total": len(periods)})
+    return all_results
+
 # ===== CLI Runner =====
 if __name__ == "__main__":
     try:
         limit = int(sys.argv[1]) if len(sys.argv) > 1 else 10
-        for i in [7,30,120]:
-            period = i
-            log(f"Starting crawl with limit={limit} and period={period} days...")
-            result = crawl_tiktok_audio(TIKTOK_URL, limit=limit, period = period)
-            
-            save_trending_music(result, period)
+        result = crawl_and_save_trending_audio(limit)
+        write_result(result)
         # log("Result:")
         # print(json.dumps(result, indent=2, ensure_ascii=False))
     except Exception as e:
@@ -1,4 +1,6 @@
-from playwright.sync_api import sync_playwright
+import browser_pool
+import metrics
+from result_channel import write_result
 import json
 import gc
 import time
@@ -118,114 +120,85 @@ def select_dropdown_option(page, placeholder_text, value, option_selector):
 
 # ===== Main Crawler (đổi phần load thêm từ scroll -> click View more) =====
 def crawl_tiktok_hashtag(url, limit=1000):
-    with sync_playwright() as p:
-        browser = p.chromium.launch(
-            headless=True,
-            args=[
-                "--disable-blink-features=AutomationControlled",
-                "--no-sandbox",
-                "--disable-dev-shm-usage",
-                "--disable-web-security",
-                "--disable-features=IsolateOrigins,site-per-process",
-            ]
-        )
-
-        context = browser.new_context(
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36",
-            viewport={"width": 1280, "height": 720},
-            bypass_csp=True,
-            java_script_enabled=True
-        )
-
-
-        def route_filter(route, request):
-            if request.resource_type in BLOCKED_TYPES or any(k in request.url.lower() for k in BLOCKED_KEYWORDS):
-                return route.abort()
-            return route.continue_()
-
-        context.route("**/*", route_filter)
-        page = context.new_page()
+    route_filter = browser_pool.make_route_filter(BLOCKED_TYPES, BLOCKED_KEYWORDS)
+
+    with browser_pool.new_page(block=route_filter, **browser_pool.DEFAULT_CONTEXT) as page:
+        page.goto(url)
+        page.wait_for_load_state("domcontentloaded")
+        log(f"Navigated to {url}")
+
+        # page.wait_for_selector("#hashtagIndustrySelect > span > div > div > div", timeout=5000)
+        # type_button = page.query_selector("#hashtagIndustrySelect > span > div > div > div")
+        # if type_button:
+        #     type_button.click()
+        #     log("Industry dropdown opened.")
+            
+        #     page.wait_for_selector('body > div:nth-child(5) > div > div > div > div > div > div:nth-child(1)', timeout=5000)
+        #     fashion_button = page.query_selector('body > div:nth-child(5) > div > div > div > div > div > div:nth-child(1)')
+        #     if fashion_button:
+        #         fashion_button.click()
+        #         log("Fashion industry selected.")
+        #     else:
+        #         log("Fashion industry button not found.", "ERROR")
+        #         return []
+        time.sleep(5)
+        ITEM_SELECTOR = "span.CardPc_titleText__RYOWo"
 
         try:
-            page.goto(url)
-            page.wait_for_load_state("domcontentloaded")
-            log(f"Navigated to {url}")
-
-            # page.wait_for_selector("#hashtagIndustrySelect > span > div > div > div", timeout=5000)
-            # type_button = page.query_selector("#hashtagIndustrySelect > span > div > div > div")
-            # if type_button:
-            #     type_button.click()
-            #     log("Industry dropdown opened.")
-                
-            #     page.wait_for_selector('body > div:nth-child(5) > div > div > div > div > div > div:nth-child(1)', timeout=5000)
-            #     fashion_button = page.query_selector('body > div:nth-child(5) > div > div > div > div > div > div:nth-child(1)')
-            #     if fashion_button:
-            #         fashion_button.click()
-            #         log("Fashion industry selected.")
-            #     else:
-            #         log("Fashion industry button not found.", "ERROR")
-            #         return []
-            time.sleep(5)
-            ITEM_SELECTOR = "span.CardPc_titleText__RYOWo"
-
-            try:
-                page.wait_for_selector(ITEM_SELECTOR, timeout=10000)
-                log("Hashtag elements loaded.")
-            except:
-                log("Hashtag elements not found. Exiting.", "ERROR")
-                return []
-
-            page.wait_for_timeout(2000)  # cho trang ổn định
-
-            collected, seen_ids, empty_attempts = [], set(), 0
-
-            while len(collected) < limit:
-                # Lấy item hiện có
-                items = page.query_selector_all(ITEM_SELECTOR)
-                new_found = 0
-                for el in items[-40:]:  # quét lô gần nhất
-                    hashtag = (el.inner_text() or "").strip()
-                    if hashtag and hashtag not in seen_ids:
-                        seen_ids.add(hashtag)
-                        collected.append({"hashtag": hashtag})
-                        new_found += 1
-                        if len(collected) >= limit:
-                            break
-
-                if new_found == 0:
-                    empty_attempts += 1
-                    log(f"No new items found. Attempt {empty_attempts}/3")
-                else:
-                    empty_attempts = 0
-
-                log(f"Collected {len(collected)} / {limit} hashtags...")
-
-                if len(collected) >= limit:
-                    break
-                view_more = page.query_selector('#ccContentContainer > div.HashtagList_listContainer__BvfHH.index-mobile_listContainer__ttJOQ > div > div.InduceLogin_induceLogin__pN61i > div > div.ViewMoreBtn_viewMoreBtn__fOkv2 > div')
-                if view_more:
-                    view_more.scroll_into_view_if_needed()
-                    page.wait_for_timeout(500)
-                    view_more.click()
-                    log("Clicked 'View More' button.")
-                    try:
-                        page.wait_for_function(
-                            f'span.CardPc_titleText__RYOWo.length > {len(seen_ids)}',
-                            timeout=10000
-                        )
-                    except:
-                        page.wait_for_timeout(2000)
-                else:
-                    log("No 'View More' button found. Stopping.")
-                    break
-
-                gc.collect()
-
-            return collected[:limit]
-
-        finally:
-            context.close()
-            browser.close()
+            page.wait_for_selector(ITEM_SELECTOR, timeout=10000)
+            log("Hashtag elements loaded.")
+        except:
+            log("Hashtag elements not found. Exiting.", "ERROR")
+            return []
+
+        page.wait_for_timeout(2000)  # cho trang ổn định
+
+        collected, seen_ids, empty_attempts = [], set(), 0
+
+        while len(collected) < limit:
+            # Lấy item hiện có
+            items = page.query_selector_all(ITEM_SELECTOR)
+            new_found = 0
+            for el in items[-40:]:  # quét lô gần nhất
+                hashtag = (el.inner_text() or "").strip()
+                if hashtag and hashtag not in seen_ids:
+                    seen_ids.add(hashtag)
+                    collected.append({"hashtag": hashtag})
+                    new_found += 1
+                    if len(collected) >= limit:
+                        break
+
+            if new_found == 0:
+                empty_attempts += 1
+                log(f"No new items found. Attempt {empty_attempts}/3")
+            else:
+                empty_attempts = 0
+
+            log(f"Collected {len(collected)} / {limit} hashtags...")
+
+            if len(collected) >= limit:
+                break
+            view_more = page.query_selector('#ccContentContainer > div.HashtagList_listContainer__BvfHH.index-mobile_listContainer__ttJOQ > div > div.InduceLogin_induceLogin__pN61i > div > div.ViewMoreBtn_viewMoreBtn__fOkv2 > div')
+            if view_more:
+                view_more.scroll_into_view_if_needed()
+                page.wait_for_timeout(500)
+                view_more.click()
+                log("Clicked 'View More' button.")
+                try:
+                    page.wait_for_function(
+                        f'span.CardPc_titleText__RYOWo.length > {len(seen_ids)}',
+                        timeout=10000
+                    )
+                except:
+                    page.wait_for_timeout(2000)
+            else:
+                log("No 'View More' button found. Stopping.")
+                break
+
+            gc.collect()
+
+        return collected[:limit]
+
 import os
 import re
 import sys
@@ -247,6 +220,7 @@ def normalize_hashtag(s: str) -> str:
     s = s.replace(" ", "")
     return s.lower()
 
+@metrics.timed("db_write_seconds", target="trending_hashtags")
 def save_trending_hashtags(hashtags: List[Dict[str, str]]) -> None:
     """
     Ghi vào bảng tiktok_trends_hashtag(hashtag_name, ranking).
@@ -304,15 +278,18 @@ def save_trending_hashtags(hashtags: List[Dict[str, str]]) -> None:
         conn.close()
 
 
+def crawl_and_save_trending_hashtags(limit=10):
+    """Crawl + lưu hashtag trending, trả về danh sách đã crawl."""
+    result = crawl_tiktok_hashtag(TIKTOK_URL, limit=int(limit))
+    save_trending_hashtags(result)
+    return result
+
 # ===== CLI Runner (giữ nguyên) =====
 if __name__ == "__main__":
     try:
-        TIKTOK_URL = "https://ads.tiktok.com/business/creativecenter/inspiration/popular/hashtag/pc/vi"
         limit = int(sys.argv[1]) if len(sys.argv) > 1 else 10
-        result = crawl_tiktok_hashtag(TIKTOK_URL, limit=limit)
-        
-        
-        save_trending_hashtags(result)
+        result = crawl_and_save_trending_hashtags(limit)
+        write_result(result)
         
     #     log("Result:")
     #     print(json.dumps(result, indent=2, ensure_ascii=False))
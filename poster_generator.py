@@ -35,12 +35,13 @@ def html_string_to_image(
     quality: int | None = None,  # JPEG quality 0-100, chỉ dùng khi image_type="jpeg"
 ) -> None:
     """
-    Chuyển HTML string thành ảnh bằng Playwright (Chromium).
+    Chuyển HTML string thành ảnh bằng Playwright (Chromium), dùng browser warm của browser_pool.
     Lưu ý: cần cài playwright và data browser trước khi dùng.
     """
     # Import lazy để không bắt buộc người dùng cài playwright nếu chỉ cần HTML
     try:
-        from playwright.sync_api import sync_playwright
+        import playwright.sync_api  # noqa: F401
+        import browser_pool
     except Exception as e:
         raise RuntimeError(
             "Thiếu playwright. Cài bằng: pip install playwright && playwright install chromium"
@@ -58,13 +59,10 @@ def html_string_to_image(
     try:
         url = Path(temp_html_path).as_uri()
 
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True)
-            context = browser.new_context(
-                viewport={"width": size[0], "height": size[1]},
-                device_scale_factor=scale,
-            )
-            page = context.new_page()
+        with browser_pool.new_page(
+            viewport={"width": size[0], "height": size[1]},
+            device_scale_factor=scale,
+        ) as page:
             page.set_default_timeout(60_000)
 
             page.goto(url, wait_until=wait)
@@ -84,9 +82,6 @@ def html_string_to_image(
 
             page.screenshot(**screenshot_kwargs)
 
-            context.close()
-            browser.close()
-
     finally:
         # Xóa file tạm thời
         try:
@@ -417,6 +412,33 @@ def build_html(image_urls: Sequence[str], title_text: str) -> str:
 
 
 # ==== CLI ====
+def render_poster(images: Sequence[str], text: str, fmt: str = "jpeg", quality: int | None = 90,
+                  scale: int = 2, wait: str = "networkidle") -> bytes:
+    """Sinh poster và trả về bytes ảnh (dùng cho API qua worker_pool, không ghi file HTML)."""
+    import tempfile, os
+
+    html = build_html(images, text)
+    suffix = ".jpg" if fmt == "jpeg" else ".png"
+    fd, img_path = tempfile.mkstemp(suffix=suffix)
+    os.close(fd)
+    try:
+        html_string_to_image(
+            html_content=html,
+            output_path=Path(img_path),
+            size=(1080, 1350),
+            scale=scale,
+            wait=wait,
+            image_type=fmt,
+            quality=quality if fmt == "jpeg" else None,
+        )
+        return Path(img_path).read_bytes()
+    finally:
+        try:
+            os.unlink(img_path)
+        except OSError:
+            pass
+
+
 def parse_args(argv: Sequence[str]) -> argparse.Namespace:
     p = argparse.ArgumentParser(
         description="Sinh HTML poster 1080x1350 từ danh sách ảnh (URL/path). "
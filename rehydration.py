@@ -0,0 +1,66 @@
+"""
+rehydration.py
+--------------
+Tách JSON <script id="__UNIVERSAL_DATA_FOR_REHYDRATION__"> khỏi HTML trang TikTok mà không parse
+cả trang: tìm thẳng trên bytes của response (không decode ~1MB HTML sang str), chỉ cắt đoạn
+JSON của script đó rồi parse bằng orjson (nếu có cài, không thì json chuẩn).
+
+  find_rehydration_json(raw)   bytes/str của script rehydration, hoặc None
+  extract_item_struct(raw)     (item_struct, None) hoặc (None, lý do) — lý do:
+      shell   không có script rehydration (trang captcha / shell rỗng)
+      empty   có JSON nhưng không có itemStruct (video bị ẩn / chặn theo vùng)
+      error   JSON hỏng
+
+So sánh với đường cũ (BeautifulSoup): python bench_rehydration.py [trang.html ...]
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson là tuỳ chọn
+    orjson = None
+
+MARKER = b'id="__UNIVERSAL_DATA_FOR_REHYDRATION__"'
+_SCRIPT_END = b"</script>"
+
+
+def loads(data):
+    """json.loads nhanh: orjson nếu có, nhận cả bytes lẫn str."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def find_rehydration_json(raw):
+    """Đoạn JSON bên trong script rehydration (cùng kiểu với `raw`), hoặc None."""
+    if isinstance(raw, str):
+        marker, tag_end, script_end = MARKER.decode(), ">", _SCRIPT_END.decode()
+    else:
+        marker, tag_end, script_end = MARKER, b">", _SCRIPT_END
+    start = raw.find(marker)
+    if start < 0:
+        return None
+    start = raw.find(tag_end, start + len(marker)) + 1
+    end = raw.find(script_end, start)
+    if start <= 0 or end < 0:
+        return None
+    return raw[start:end]
+
+
+def extract_item_struct(raw):
+    """Lấy itemStruct của trang video từ HTML (bytes hoặc str)."""
+    blob = find_rehydration_json(raw)
+    if blob is None:
+        return None, "shell"
+    try:
+        data = loads(blob)
+    except ValueError:  # orjson.JSONDecodeError cũng là ValueError
+        return None, "error"
+    # JSON hợp lệ nhưng sai dạng (list, chuỗi, ...) ở bất kỳ tầng nào cũng coi như rỗng
+    item_struct = data
+    for key in ("__DEFAULT_SCOPE__", "webapp.video-detail", "itemInfo", "itemStruct"):
+        item_struct = item_struct.get(key) if isinstance(item_struct, dict) else None
+    if not isinstance(item_struct, dict) or not item_struct.get("stats"):
+        return None, "empty"
+    return item_struct, None
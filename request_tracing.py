@@ -0,0 +1,166 @@
+"""
+request_tracing.py
+------------------
+Middleware ASGI ghi trace cho từng request: method, path, kích thước body vào/ra,
+status và latency, thay cho việc đọc + print toàn bộ body của mọi request.
+
+- Không buffer body: chỉ đếm byte khi body đi qua, và giữ tối đa TRACE_BODY_BYTES byte đầu.
+- Ghi bất đồng bộ: request chỉ đẩy dict vào queue; một thread nền serialize và ghi JSONL.
+  Queue đầy thì bỏ trace (đếm trong sink.dropped) chứ không chặn request.
+- Che secret (gemini_api_key, token, password, key Google "AIza...") trong body và query.
+
+Cấu hình qua biến môi trường:
+  TRACE_SAMPLE_RATE   tỉ lệ request được ghi, 0..1 (mặc định: 1.0); request lỗi 5xx luôn được ghi
+  TRACE_BODY_BYTES    số byte đầu của body giữ trong trace (mặc định: 0 = không ghi body)
+  TRACE_LOG_FILE      file JSONL nhận trace (mặc định: stdout)
+  TRACE_QUEUE_MAX     số trace chờ ghi tối đa (mặc định: 10000)
+"""
+
+import json
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+
+import metrics
+
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+TRACE_BODY_BYTES = int(os.getenv("TRACE_BODY_BYTES", "0"))
+TRACE_LOG_FILE = os.getenv("TRACE_LOG_FILE") or None
+TRACE_QUEUE_MAX = int(os.getenv("TRACE_QUEUE_MAX", "10000"))
+
+_SECRET_NAME = r"[\w\-]*(?:api[_\-]?key|token|secret|password|passwd|authorization|credential)[\w\-]*"
+# "gemini_api_key": "..."  (JSON) và  gemini_api_key=...  (query / form)
+_SECRET_JSON = re.compile(r'("' + _SECRET_NAME + r'"\s*:\s*")(?:[^"\\]|\\.)*("?)', re.I)
+_SECRET_PARAM = re.compile(r"(\b" + _SECRET_NAME + r"=)[^&\s]*", re.I)
+_GOOGLE_KEY = re.compile(r"AIza[0-9A-Za-z_\-]{20,}")
+REDACTED = "***"
+
+
+def redact(text: str) -> str:
+    text = _SECRET_JSON.sub(lambda m: m.group(1) + REDACTED + m.group(2), text)
+    text = _SECRET_PARAM.sub(lambda m: m.group(1) + REDACTED, text)
+    return _GOOGLE_KEY.sub(REDACTED, text)
+
+
+class TraceSink:
+    """Queue có giới hạn + thread nền ghi JSONL (stdout hoặc file)."""
+
+    def __init__(self, path=TRACE_LOG_FILE, max_queue: int = TRACE_QUEUE_MAX) -> None:
+        self.path = path
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def emit(self, record: dict) -> None:
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="trace-sink", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        out = open(self.path, "a", encoding="utf-8") if self.path else sys.stdout
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < 500:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                out.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in batch))
+                out.flush()
+            except Exception as e:
+                print(f"[WARNING] trace sink ghi lỗi: {e}", file=sys.stderr)
+
+
+sink = TraceSink()
+
+
+class TracingMiddleware:
+    """app.add_middleware(TracingMiddleware) — ASGI thuần, không bọc/buffer response (an toàn với StreamingResponse)."""
+
+    def __init__(self, app, sink: TraceSink = sink, sample_rate: float = TRACE_SAMPLE_RATE, body_bytes: int = TRACE_BODY_BYTES) -> None:
+        self.app = app
+        self.sink = sink
+        self.sample_rate = sample_rate
+        self.body_bytes = body_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        state = {"status": None, "req_bytes": 0, "resp_bytes": 0}
+        preview = bytearray()
+
+        async def traced_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                chunk = message.get("body", b"")
+                state["req_bytes"] += len(chunk)
+                if len(preview) < self.body_bytes:
+                    preview.extend(chunk[: self.body_bytes - len(preview)])
+            return message
+
+        async def traced_send(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                state["resp_bytes"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, traced_receive, traced_send)
+        except Exception:
+            state["status"] = state["status"] or 500
+            raise
+        finally:
+            self._record(scope, state, preview, time.perf_counter() - start)
+
+    def _record(self, scope, state, preview: bytearray, elapsed: float) -> None:
+        status = state["status"] or 500
+        # Histogram latency theo route template (vd: /jobs/{job_id}), không bị ảnh hưởng bởi sampling
+        route = getattr(scope.get("route"), "path", None) or "unmatched"
+        metrics.observe("http_request_duration_seconds", elapsed, method=scope.get("method"), route=route, status=status)
+
+        if status < 500 and random.random() >= self.sample_rate:
+            return
+
+        req_bytes = state["req_bytes"]
+        for name, value in scope.get("headers", ()):
+            if name == b"content-length":
+                try:
+                    req_bytes = max(req_bytes, int(value))
+                except ValueError:
+                    pass
+                break
+
+        record = {
+            "ts": time.time(),
+            "method": scope.get("method"),
+            "path": scope.get("path"),
+            "status": status,
+            "latency_ms": round(elapsed * 1000, 2),
+            "req_bytes": req_bytes,
+            "resp_bytes": state["resp_bytes"],
+        }
+        query = scope.get("query_string", b"")
+        if query:
+            record["query"] = redact(query.decode("latin-1"))
+        if preview:
+            record["body"] = redact(preview.decode("utf-8", "replace"))
+            record["body_truncated"] = req_bytes > len(preview)
+        self.sink.emit(record)
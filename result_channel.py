@@ -0,0 +1,132 @@
+"""
+result_channel.py
+-----------------
+Kênh trả kết quả có đóng khung giữa API và các script chạy bằng subprocess,
+thay cho việc regex/raw_decode dò JSON trong stdout.
+
+Script ghi kết quả đúng MỘT lần vào file (env RESULT_FILE) hoặc fd (env RESULT_FD):
+
+    MAGIC (4 byte) | độ dài payload (8 byte, big-endian) | payload JSON UTF-8
+
+Bên đọc lấy header rồi đọc đúng số byte payload, nên chi phí parse tuyến tính theo
+kết quả và log trên stdout/stderr lớn bao nhiêu cũng không ảnh hưởng.
+Khi không có RESULT_FILE/RESULT_FD (chạy CLI bằng tay), write_result() trả False để
+script tự in kết quả ra stdout như trước.
+
+Chế độ stream (env RESULT_STREAM=1, thường đi với RESULT_FD là một pipe): script gọi
+write_item() cho từng item ngay khi có, mỗi item là một frame MAGIC_ITEM; frame kết quả
+(MAGIC) vẫn là frame cuối cùng. `items_written` đếm số item đã stream, script không cần
+giữ lại item chỉ để báo số lượng.
+"""
+
+import json
+import os
+import struct
+
+MAGIC = b"RSL1"
+MAGIC_ITEM = b"ITM1"
+HEADER = struct.Struct(">4sQ")
+
+RESULT = "result"
+ITEM = "item"
+_KINDS = {MAGIC: RESULT, MAGIC_ITEM: ITEM}
+
+ENV_FILE = "RESULT_FILE"
+ENV_FD = "RESULT_FD"
+ENV_STREAM = "RESULT_STREAM"
+
+_out = None
+_written = False
+items_written = 0
+
+
+class ResultChannelError(RuntimeError):
+    pass
+
+
+def encode(obj, magic: bytes = MAGIC) -> bytes:
+    payload = json.dumps(obj, ensure_ascii=False, default=str).encode("utf-8")
+    return HEADER.pack(magic, len(payload)) + payload
+
+
+def decode(data: bytes):
+    if len(data) < HEADER.size:
+        raise ResultChannelError("Script không ghi kết quả (kênh kết quả rỗng)")
+    magic, length = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ResultChannelError(f"Sai magic của kênh kết quả: {magic!r}")
+    end = HEADER.size + length
+    if len(data) < end:
+        raise ResultChannelError(f"Kết quả bị cắt: cần {length} byte, có {len(data) - HEADER.size}")
+    return json.loads(data[HEADER.size:end])
+
+
+def streaming() -> bool:
+    return os.getenv(ENV_STREAM) == "1" and _channel() is not None
+
+
+def _channel():
+    global _out
+    if _out is None:
+        path = os.getenv(ENV_FILE)
+        fd = os.getenv(ENV_FD)
+        if path:
+            _out = open(path, "wb")
+        elif fd:
+            _out = os.fdopen(int(fd), "wb")
+    return _out
+
+
+def write_item(obj) -> bool:
+    """Stream một item về API ngay lập tức; không làm gì nếu không chạy ở chế độ stream."""
+    global items_written
+    if _written or not streaming():
+        return False
+    out = _channel()
+    out.write(encode(obj, MAGIC_ITEM))
+    out.flush()
+    items_written += 1
+    return True
+
+
+def write_result(obj) -> bool:
+    """Ghi kết quả vào kênh; trả False nếu script không chạy dưới API (không có kênh)."""
+    global _written
+    out = _channel()
+    if out is None:
+        return False
+    if _written:
+        raise ResultChannelError("Mỗi script chỉ được ghi kết quả một lần")
+
+    out.write(encode(obj))
+    out.close()
+    _written = True
+    return True
+
+
+def iter_frames(f):
+    """Đọc lần lượt các frame từ file/pipe nhị phân, yield (ITEM|RESULT, payload bytes)."""
+    while True:
+        header = f.read(HEADER.size)
+        if not header:
+            return
+        if len(header) < HEADER.size:
+            raise ResultChannelError("Header frame bị cắt")
+        magic, length = HEADER.unpack(header)
+        kind = _KINDS.get(magic)
+        if kind is None:
+            raise ResultChannelError(f"Sai magic của kênh kết quả: {magic!r}")
+        payload = f.read(length)
+        if len(payload) < length:
+            raise ResultChannelError(f"Kết quả bị cắt: cần {length} byte, có {len(payload)}")
+        yield kind, payload
+        if kind == RESULT:
+            return
+
+
+def read_result(path: str):
+    with open(path, "rb") as f:
+        for kind, payload in iter_frames(f):
+            if kind == RESULT:
+                return json.loads(payload)
+    raise ResultChannelError("Script không ghi kết quả (kênh kết quả rỗng)")
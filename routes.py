@@ -1,5 +1,6 @@
 import asyncio
-import json
+import os
+import weakref
 import urllib.parse  # Import for URL encoding
 
 from playwright.async_api import Page
@@ -8,11 +9,17 @@ from crawlee.crawlers import PlaywrightCrawlingContext
 from crawlee.router import Router
 from datetime import datetime, timezone
 import pytz
+import crawl_blocking
+import metrics
+import rehydration
+import video_http
+from result_channel import streaming, write_item
 class CaptchaDetected(RuntimeError):
     pass
 
 async def _force_retry(context: PlaywrightCrawlingContext, reason: str = "CAPTCHA_DETECTED") -> None:
     # Báo cho Crawlee đánh dấu request này fail và xếp lịch retry (nếu còn slot)
+    metrics.inc("crawl_retries_total", reason=reason)
     try:
         await context.request.retry(reason)  # Crawlee Python: trả về True/False tùy còn slot
     except Exception:
@@ -29,6 +36,7 @@ async def _guard_captcha_or_retry(context: PlaywrightCrawlingContext):
         modal = page.locator(CAPTCHA_MODAL_SEL)
         if await modal.count() > 0 and await modal.first.is_visible():
             logger.warning("CAPTCHA detected! Forcing retry...")
+            metrics.inc("captcha_detected_total", label=context.request.label or "")
             await _force_retry(context, "CAPTCHA_DETECTED")
     except CaptchaDetected:
         # Cho lỗi đi xuyên (không nuốt)
@@ -38,6 +46,14 @@ async def _guard_captcha_or_retry(context: PlaywrightCrawlingContext):
         return
 
 
+async def _push_data(context: PlaywrightCrawlingContext, data) -> None:
+    """Chế độ stream: gửi thẳng từng item về API, không giữ trong dataset; ngược lại push_data vào dataset."""
+    if not streaming():
+        await context.push_data(data)
+        return
+    for item in data if isinstance(data, list) else [data]:
+        write_item(item)
+
 
 def convert_timestamp_to_vn_time(timestamp: int) -> str:
     # Khởi tạo timezone
@@ -76,28 +92,332 @@ def normalize_views(view_str: str) -> int:
     else:
         return int(number)
 
-async def extract_video_metadata(page: Page) -> list[dict]:
+# --- Chờ theo sự kiện (thay cho wait_for_timeout cố định): xong sớm ngay khi nội dung tới ---
+_WAIT_COUNT_GROWTH_JS = """
+([sel, previous, timeout]) => new Promise((resolve) => {
+    const count = () => document.querySelectorAll(sel).length;
+    if (count() > previous) return resolve(count());
+    const done = () => { observer.disconnect(); clearTimeout(timer); resolve(count()); };
+    const observer = new MutationObserver(() => { if (count() > previous) done(); });
+    const timer = setTimeout(done, timeout);
+    observer.observe(document.body, {childList: true, subtree: true});
+})
+"""
+
+_WAIT_DOM_QUIET_JS = """
+([sel, quiet, timeout]) => new Promise((resolve) => {
+    const root = document.querySelector(sel) || document.body;
+    let quietTimer;
+    const done = (value) => { observer.disconnect(); clearTimeout(quietTimer); clearTimeout(timer); resolve(value); };
+    const arm = () => { clearTimeout(quietTimer); quietTimer = setTimeout(() => done(true), quiet); };
+    const observer = new MutationObserver(arm);
+    const timer = setTimeout(() => done(false), timeout);
+    observer.observe(root, {childList: true, subtree: true, characterData: true});
+    arm();
+})
+"""
+
+
+async def wait_for_count_growth(page: Page, selector: str, previous: int, timeout: int = 3000) -> int:
+    """Chờ tới khi số phần tử khớp `selector` > `previous` hoặc hết `timeout` ms; trả số phần tử hiện có."""
+    try:
+        return await page.evaluate(_WAIT_COUNT_GROWTH_JS, [selector, previous, timeout])
+    except Exception:
+        return previous
+
+
+async def wait_for_dom_quiet(page: Page, selector: str, quiet_ms: int = 500, timeout: int = 5000) -> bool:
+    """Chờ tới khi cây DOM dưới `selector` không đổi trong `quiet_ms` ms; False nếu hết `timeout` ms trước."""
+    try:
+        return await page.evaluate(_WAIT_DOM_QUIET_JS, [selector, quiet_ms, timeout])
+    except Exception:
+        return False
+
+
+async def wait_for_network_quiet(page: Page, url_part: str, quiet_ms: int = 500, timeout: int = 10000) -> bool:
+    """Chờ tới khi không còn request nào có URL chứa `url_part` đang chạy và không có request mới trong `quiet_ms` ms."""
+    inflight = set()
+    activity = asyncio.Event()
+
+    def on_request(request) -> None:
+        if url_part in request.url:
+            inflight.add(request)
+            activity.set()
+
+    def on_done(request) -> None:
+        if request in inflight:
+            inflight.discard(request)
+            activity.set()
+
+    page.on('request', on_request)
+    page.on('requestfinished', on_done)
+    page.on('requestfailed', on_done)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout / 1000
+    try:
+        while True:
+            activity.clear()
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return not inflight
+            try:
+                await asyncio.wait_for(activity.wait(), remaining if inflight else min(quiet_ms / 1000, remaining))
+            except asyncio.TimeoutError:
+                if not inflight:
+                    return True
+    finally:
+        page.remove_listener('request', on_request)
+        page.remove_listener('requestfinished', on_done)
+        page.remove_listener('requestfailed', on_done)
+
+
+async def _await_response(page: Page, predicate, action, timeout: int = 8000) -> bool:
+    """Chạy `action` và chờ response khớp `predicate` (thay cho wait_for_timeout cố định)."""
+    try:
+        async with page.expect_response(predicate, timeout=timeout) as info:
+            await action()
+        await info.value
+        return True
+    except Exception:
+        return False
+
+
+# Đọc {href, views} của mọi item từ vị trí `start` trong MỘT lần evaluate.
+# `next` = item đầu tiên chưa đủ dữ liệu (lazy-load) để lần sau đọc lại từ đó.
+_EXTRACT_VIDEO_ITEMS_JS = """
+(start) => {
+    const items = document.querySelectorAll('[data-e2e="user-post-item"]');
+    const out = [];
+    let next = items.length;
+    for (let i = start; i < items.length; i++) {
+        const link = items[i].querySelector('a[href*="/video/"]');
+        const views = items[i].querySelector('[data-e2e="video-views"]');
+        const href = link && link.getAttribute('href');
+        const text = views && views.innerText;
+        if (href && text) out.push([href, text]);
+        else if (next === items.length) next = i;
+    }
+    return {items: out, next: next};
+}
+"""
+
+async def extract_video_metadata(page: Page, start: int = 0) -> tuple[list[dict], int]:
     """
-    Trích xuất danh sách video với URL và lượt xem (đã chuẩn hóa).
-    Trả về dạng: [{'url': ..., 'views': int}, ...]
+    Trích xuất danh sách video với URL và lượt xem (đã chuẩn hóa) từ item thứ `start` trở đi.
+    Trả về ([{'url': ..., 'views': int}, ...], start cho lần gọi sau).
     """
-    results = []
-    video_items = await page.query_selector_all('[data-e2e="user-post-item"]')
+    data = await page.evaluate(_EXTRACT_VIDEO_ITEMS_JS, start)
+    results = [{'url': href, 'views': normalize_views(views_text)} for href, views_text in data['items']]
+    return results, data['next']
+
+ITEM_LIST_API = '/api/post/item_list/'
+PROFILE_ITEM_SEL = '[data-e2e="user-post-item"]'
+
+
+def _is_item_list(response) -> bool:
+    return ITEM_LIST_API in response.url
+
+
+_VIDEO_ID_RE = re.compile(r'/video/(\d+)')
+
+
+def profile_video_item(url: str, views, video_id=None, create_time=None) -> dict:
+    """Một video của danh sách profile, cùng dạng cho đường item_list API và fallback DOM
+    (DOM không có create_time -> None; id lấy từ URL)."""
+    if video_id is None:
+        match = _VIDEO_ID_RE.search(url)
+        video_id = match.group(1) if match else None
+    return {'url': url, 'views': views, 'id': video_id, 'create_time': create_time}
+
+
+class ItemListCollector:
+    """Gom video từ JSON item_list mà trang profile gọi khi cuộn (page.on("response"))."""
+
+    def __init__(self) -> None:
+        self.items = {}  # url -> {'url', 'views', 'id', 'create_time'}, theo thứ tự API trả về
+        self.has_more = True
+        self.seen_traffic = False
+        self._tasks = set()
+
+    def attach(self, page: Page) -> None:
+        page.on('response', self._on_response)
+
+    def reset(self) -> None:
+        """Bỏ dữ liệu đã gom (vd: sau khi chuyển tab Popular, danh sách được tải lại theo thứ tự khác)."""
+        self.items = {}
+        self.has_more = True
+        self.seen_traffic = False
+
+    def _on_response(self, response) -> None:
+        if not _is_item_list(response):
+            return
+        task = asyncio.ensure_future(self._consume(response))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _consume(self, response) -> None:
+        try:
+            data = await response.json()
+        except Exception:
+            return
+        self.seen_traffic = True
+        for v in data.get('itemList') or []:
+            vid = v.get('id')
+            handle = (v.get('author') or {}).get('uniqueId')
+            if not vid or not handle:
+                continue
+            url = f'https://www.tiktok.com/@{handle}/video/{vid}'
+            stats = v.get('stats') or {}
+            views = stats.get('playCount')
+            if views is None:
+                views = int((v.get('statsV2') or {}).get('playCount') or 0)
+            if url not in self.items:
+                self.items[url] = profile_video_item(url, views, vid, v.get('createTime'))
+        self.has_more = bool(data.get('hasMore'))
+
+    async def settle(self) -> None:
+        """Chờ parse xong các response đã nhận."""
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+
+_item_list_collectors = weakref.WeakKeyDictionary()
+
+
+def item_list_collector(page: Page) -> ItemListCollector:
+    collector = _item_list_collectors.get(page)
+    if collector is None:
+        collector = _item_list_collectors[page] = ItemListCollector()
+        collector.attach(page)
+    return collector
+
+
+async def _scroll_profile(page: Page) -> None:
+    await page.evaluate('window.scrollBy(0, window.innerHeight);')
+
+
+async def _collect_profile_api(context: PlaywrightCrawlingContext, collector: ItemListCollector, limit: int):
+    """Lấy video qua JSON item_list; trả None nếu không thấy traffic API (để fallback DOM)."""
+    page = context.page
+    await collector.settle()
+    if not collector.seen_traffic:
+        await _await_response(page, _is_item_list, lambda: _scroll_profile(page), timeout=10000)
+        await collector.settle()
+        if not collector.seen_traffic:
+            context.log.info('No item_list API traffic seen, falling back to DOM scraping')
+            return None
+
+    # Trang tiếp theo: cuộn và đi tiếp ngay khi response tới thay vì sleep cố định
+    stale = 0
+    while len(collector.items) < limit and collector.has_more and stale < 3:
+        await _guard_captcha_or_retry(context)
+        before = len(collector.items)
+        await _await_response(page, _is_item_list, lambda: _scroll_profile(page))
+        await collector.settle()
+        stale = stale + 1 if len(collector.items) == before else 0
+        context.log.info(f'Found {len(collector.items)} video links so far...')
+
+    return list(collector.items.values())
+
+
+async def _scrape_profile_dom(context: PlaywrightCrawlingContext, limit: int, max_retries: int, pause_ms: int, reset_on_progress: bool) -> list[dict]:
+    """Cuộn grid + đọc DOM (dùng khi không bắt được item_list API); item cùng dạng profile_video_item."""
+    collected = {}
+    retries = 0
+    length_collected = 0
+    cursor = 0
+    while len(collected) < limit and retries < max_retries:
+        links, cursor = await extract_video_metadata(context.page, cursor)
+        for item in links:
+            url = item['url']
+            if url not in collected:
+                collected[url] = item['views']
+
+        context.log.info(f'Found {len(collected)} video links so far...')
+
+        if len(collected) >= limit:
+            break
+
+        # Scroll xuống và chờ grid có thêm item (tối đa pause_ms)
+        shown = await context.page.locator(PROFILE_ITEM_SEL).count()
+        await context.page.evaluate('window.scrollBy(0, window.innerHeight);')
+        await wait_for_count_growth(context.page, PROFILE_ITEM_SEL, shown, timeout=pause_ms)
+        if reset_on_progress and len(collected) > length_collected:
+            length_collected = len(collected)
+            retries = 0  # reset retries if new items found
+        else:
+            retries += 1
+
+    # Cùng dạng item với đường item_list API
+    return [profile_video_item(url, views) for url, views in collected.items()]
+
+
+def build_video_item(item_struct: dict, url: str) -> dict:
+    """Item metadata video từ itemStruct của JSON rehydration (dùng chung cho bản browser và HTTP)."""
+    return {
+        'author': {
+            'nickname': item_struct['author']['nickname'],
+            'id': item_struct['author']['id'],
+            'handle': item_struct['author']['uniqueId'],
+            'signature': item_struct['author']['signature'],
+            'followers': item_struct['authorStats']['followerCount'],
+            'following': item_struct['authorStats']['followingCount'],
+            'hearts': item_struct['authorStats']['heart'],
+            'videos': item_struct['authorStats']['videoCount'],
+        },
+        'description': item_struct['desc'],
+        'tags': [t['hashtagName'] for t in item_struct.get('textExtra', []) if t.get('hashtagName')],
+        'hearts': item_struct['stats']['diggCount'],
+        'shares': item_struct['stats']['shareCount'],
+        'comments': item_struct['stats']['commentCount'],
+        'plays': item_struct['stats']['playCount'],
+        'saves': int(item_struct['stats']['collectCount']),  # <--- thêm dòng này
+        'video_url': url,
+        'thumbnail': item_struct['video']['cover'],
+        'publishedAt': convert_timestamp_to_vn_time(int(item_struct['createTime']))
+    }
+
 
-    for item in video_items:
-        link_el = await item.query_selector('a[href*="/video/"]')
-        href = await link_el.get_attribute('href') if link_el else None
+async def fetch_videos_http(urls: list[str], push) -> list[str]:
+    """Metadata-only: lấy video qua HTTP và `await push(items)`; trả các URL cần mở bằng Playwright."""
+    if not video_http.ENABLED or not urls:
+        return urls
+    items = []
+    fallback = []
+    for url, item_struct, _reason in await video_http.fetch_many(urls):
+        item = None
+        if item_struct is not None:
+            try:
+                item = build_video_item(item_struct, url)
+            except (KeyError, TypeError, ValueError):
+                pass  # JSON thiếu field: để browser đọc lại
+        if item is None:
+            fallback.append(url)
+        else:
+            items.append(item)
+    if items:
+        await push(items)
+    return fallback
 
-        views_el = await item.query_selector('[data-e2e="video-views"]')
-        views_text = await views_el.inner_text() if views_el else None
 
-        if href and views_text:
-            results.append({
-                'url': href,
-                'views': normalize_views(views_text)
-            })
+async def _enqueue_videos(context: PlaywrightCrawlingContext, links: list[dict]) -> None:
+    """enqueue_videos: đưa request 'video' cho từng link vào chính crawler đang chạy."""
+    if not context.request.user_data.get('enqueue_videos') or not links:
+        return
+    max_comments = context.request.user_data.get('video_max_comments', MAX_COMMENTS)
+    urls = [link['url'] for link in links]
+    if max_comments <= 0:
+        # Chỉ cần metadata: thử HTTP trước, chỉ mở browser cho video HTTP không đọc được
+        urls = await fetch_videos_http(urls, lambda items: _push_data(context, items))
+        context.log.info(f'Fetched {len(links) - len(urls)} videos over HTTP')
+    if not urls:
+        return
+    await context.add_requests([
+        Request.from_url(url, label='video', user_data={'max_comments': max_comments, 'profile': context.request.url})
+        for url in urls
+    ])
+    context.log.info(f'Enqueued {len(urls)} video requests')
 
-    return results
 
 # --- Handler mặc định: crawl trang profile để lấy link video ---
 @router.handler(label='newest')
@@ -109,7 +429,8 @@ async def newest_handler(context: PlaywrightCrawlingContext) -> None:
     limit = context.request.user_data.get('limit', 10)
     if not isinstance(limit, int) or limit <= 0:
         raise ValueError('`limit` must be a positive integer')
-    await context.page.wait_for_load_state("networkidle", timeout=30000)
+    # networkidle hiếm khi tới được (TikTok gọi analytics liên tục): chỉ chờ các request item_list xong
+    await wait_for_network_quiet(context.page, ITEM_LIST_API, quiet_ms=500, timeout=30000)
     try:
         skip_btn = await context.page.locator("div.TUXButton-label:has-text('Skip')").first
         # Đợi tối đa 5s cho đến khi nút hiển thị
@@ -120,39 +441,16 @@ async def newest_handler(context: PlaywrightCrawlingContext) -> None:
     # Đợi user-post hoặc nút load-more hiển thị
     await context.page.locator('[data-e2e="user-post-item"]').first.wait_for(timeout=3000)
 
-    collected = {}
-    retries = 0
-    MAX_RETRIES = 3
-    length_collected = 0
-    while len(collected) < limit and retries < MAX_RETRIES:
-        links = await extract_video_metadata(context.page)
-        for item in links:
-            url = item['url']
-            if url not in collected:
-                collected[url] = item['views']
-        
-        context.log.info(f'Found {len(collected)} video links so far...')
-
-        if len(collected) >= limit:
-            break
-
-        # Scroll xuống và chờ load thêm nội dung
-        await context.page.evaluate('window.scrollBy(0, window.innerHeight);')
-        await asyncio.sleep(3)  # Chờ nội dung load xong
-        if len(collected) > length_collected:
-            length_collected = len(collected)
-            retries = 0  # reset retries if new items found
-        else: 
-            retries += 1
-
-    # Tạo danh sách link video và lượt xem từ collected
-    final_links = [{'url': url, 'views': views} for url, views in collected.items()]
+    final_links = await _collect_profile_api(context, item_list_collector(context.page), limit)
+    if final_links is None:
+        final_links = await _scrape_profile_dom(context, limit, max_retries=3, pause_ms=3000, reset_on_progress=True)
 
     if not final_links:
         raise RuntimeError('No video links found on profile page')
     context.log.info(f'Queued {len(final_links)} video requests')
     # Trả về danh sách link video và lượt xem
-    await context.push_data(final_links[:limit])
+    await _push_data(context, final_links[:limit])
+    await _enqueue_videos(context, final_links[:limit])
 
 @router.handler(label='popular')
 async def popular_handler(context: PlaywrightCrawlingContext) -> None:
@@ -167,8 +465,12 @@ async def popular_handler(context: PlaywrightCrawlingContext) -> None:
     # Chuyển sang tab Popular nếu có
     await context.page.locator('button[aria-label="Popular"]').first.wait_for(timeout=30000)
     popular_btn = await context.page.query_selector('button[aria-label="Popular"]')
+    collector = item_list_collector(context.page)
     if popular_btn:
-        await popular_btn.click()
+        # item_list của tab mặc định (Latest) không dùng được: bỏ đi và chờ danh sách Popular
+        await collector.settle()
+        collector.reset()
+        await _await_response(context.page, _is_item_list, popular_btn.click)
         context.log.info('Switched to Popular tab')
         
     # Đợi user-post hoặc nút load-more hiển thị
@@ -179,48 +481,443 @@ async def popular_handler(context: PlaywrightCrawlingContext) -> None:
     if btn:
         await btn.click()
         
-    collected = {}
-    retries = 0
-    MAX_RETRIES = 50
-
-    while len(collected) < limit and retries < MAX_RETRIES:
-        links = await extract_video_metadata(context.page)
-        for item in links:
-            url = item['url']
-            if url not in collected:
-                collected[url] = item['views']
-
-        context.log.info(f'Found {len(collected)} video links so far...')
-
-        if len(collected) >= limit:
-            break
-
-        # Scroll xuống và chờ load thêm nội dung
-        await context.page.evaluate('window.scrollBy(0, window.innerHeight);')
-        await asyncio.sleep(1)  # Chờ nội dung load xong
-
-        retries += 1
-
-    # Tạo danh sách link video và lượt xem từ collected
-    final_links = [{'url': url, 'views': views} for url, views in collected.items()]
+    final_links = await _collect_profile_api(context, collector, limit)
+    if final_links is None:
+        final_links = await _scrape_profile_dom(context, limit, max_retries=50, pause_ms=1000, reset_on_progress=False)
 
     if not final_links:
         raise RuntimeError('No video links found on profile page')
     context.log.info(f'Queued {len(final_links)} video requests')
     # Trả về danh sách link video và lượt xem
-    await context.push_data(final_links[:limit])
+    await _push_data(context, final_links[:limit])
+    await _enqueue_videos(context, final_links[:limit])
     
 # --- Cấu hình chung ---
 MAX_COMMENTS = 30
 SCROLL_PAUSE_MS = 1000
+# 'api': dựng cây comment từ JSON của /api/comment/list/ mà trang tự gọi; 'dom': click + đọc DOM
+COMMENT_MODE = os.getenv('COMMENT_MODE', 'api')
+
+COMMENT_SEL = "div.css-zjz0t7-5e6d46e3--DivCommentObjectWrapper.e16z10169"
+VIEW_MORE_INNER_SEL = (
+    "div.css-1ey35vz-5e6d46e3--DivViewRepliesContainer.e1cx7wx92 "
+    "span:has-text('Xem'), "
+    "div.css-1ey35vz-5e6d46e3--DivViewRepliesContainer.e1cx7wx92 "
+    "span:has-text('View')"
+)
+
+COMMENT_API = '/api/comment/list/'
+REPLY_API = '/api/comment/list/reply/'
+
+
+def _is_comment_list(response) -> bool:
+    return COMMENT_API in response.url and REPLY_API not in response.url
+
+
+def _is_reply_list(response) -> bool:
+    return REPLY_API in response.url
+
+
+class CommentCollector:
+    """Gom JSON comment/reply từ các XHR mà chính trang TikTok gọi (page.on("response"))."""
+
+    def __init__(self) -> None:
+        self.top = {}  # cid -> comment cấp 1, theo thứ tự API trả về
+        self.replies = {}  # cid cha -> {cid reply -> reply}
+        self.has_more = True
+        self.seen_traffic = False
+        self._tasks = set()
+
+    def attach(self, page: Page) -> None:
+        page.on('response', self._on_response)
+
+    def _on_response(self, response) -> None:
+        if COMMENT_API not in response.url:
+            return
+        task = asyncio.ensure_future(self._consume(response, _is_reply_list(response)))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _consume(self, response, is_reply: bool) -> None:
+        try:
+            data = await response.json()
+        except Exception:
+            return
+        self.seen_traffic = True
+        for c in data.get('comments') or []:
+            cid = c.get('cid')
+            if not cid:
+                continue
+            if is_reply:
+                self.replies.setdefault(c.get('reply_id'), {})[cid] = c
+                continue
+            self.top.setdefault(cid, c)
+            for r in c.get('reply_comment') or []:
+                if r.get('cid'):
+                    self.replies.setdefault(cid, {})[r['cid']] = r
+        if not is_reply:
+            self.has_more = bool(data.get('has_more'))
+
+    async def settle(self) -> None:
+        """Chờ parse xong các response đã nhận."""
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    def pending_replies(self, limit: int) -> bool:
+        """Còn comment nào trong top `limit` chưa tải đủ reply không."""
+        for cid, c in list(self.top.items())[:limit]:
+            if (c.get('reply_comment_total') or 0) > len(self.replies.get(cid, {})):
+                return True
+        return False
+
+    @staticmethod
+    def _user(c: dict) -> dict:
+        user = c.get('user') or {}
+        handle = user.get('unique_id') or ''
+        return {'name': user.get('nickname') or handle, 'href': f'/@{handle}' if handle else ''}
+
+    def threads(self, limit: int) -> list[dict]:
+        """Cùng định dạng với bản DOM: [{"cmt_1": {user, text, likes, replies: [...]}}]."""
+        threads = []
+        for cid, c in list(self.top.items())[:limit]:
+            replies = [
+                {'user': self._user(r), 'text': r.get('text') or '', 'likes': r.get('digg_count') or 0}
+                for r in self.replies.get(cid, {}).values()
+            ]
+            threads.append({'cmt_1': {
+                'user': self._user(c),
+                'text': c.get('text') or '',
+                'likes': c.get('digg_count') or 0,
+                'replies': replies,
+            }})
+        return threads
+
+
+_comment_collectors = weakref.WeakKeyDictionary()
+
+
+def comment_collector(page: Page) -> CommentCollector:
+    collector = _comment_collectors.get(page)
+    if collector is None:
+        collector = _comment_collectors[page] = CommentCollector()
+        collector.attach(page)
+    return collector
+
+
+async def pre_navigation_hook(context) -> None:
+    """Gắn listener trước khi goto: trang gọi comment/list, item_list ngay khi load, gắn trong handler là lỡ trang đầu."""
+    await crawl_blocking.install(context.page, context.request.label)
+    if context.request.label == 'video':
+        comment_collector(context.page)
+    elif context.request.label in ('newest', 'popular'):
+        item_list_collector(context.page)
+
+
+async def _scroll_comments(page: Page) -> None:
+    await page.evaluate("""() => {
+        const els = document.querySelectorAll('span[data-e2e="comment-level-1"]');
+        const last = els[els.length - 1];
+        if (last) last.scrollIntoView({block: 'end'});
+    }""")
+    await page.mouse.wheel(0, 800)
+
+
+async def _collect_comments_api(context: PlaywrightCrawlingContext, collector: CommentCollector, max_comments: int):
+    """Lấy comment qua JSON của comment API; trả None nếu không thấy traffic API (để fallback DOM)."""
+    page = context.page
+    await collector.settle()
+    if not collector.seen_traffic:
+        await _await_response(page, _is_comment_list, lambda: _scroll_comments(page), timeout=10000)
+        await collector.settle()
+        if not collector.seen_traffic:
+            context.log.info('No comment API traffic seen, falling back to DOM scraping')
+            return None
+
+    # Trang comment tiếp theo: cuộn tới comment cuối và chờ response thay vì sleep
+    stale = 0
+    while len(collector.top) < max_comments and collector.has_more and stale < 3:
+        await _guard_captcha_or_retry(context)
+        before = len(collector.top)
+        await _await_response(page, _is_comment_list, lambda: _scroll_comments(page))
+        await collector.settle()
+        stale = stale + 1 if len(collector.top) == before else 0
+
+    # Reply chỉ được tải khi bấm "Xem phản hồi": bấm theo thứ tự DOM tới khi top N đủ reply
+    buttons = page.locator(VIEW_MORE_INNER_SEL)
+    clicks = 0
+    while collector.pending_replies(max_comments) and clicks < max_comments * 10:
+        await _guard_captcha_or_retry(context)
+        btn = buttons.first
+        if not await btn.count():
+            break
+        if not await _await_response(page, _is_reply_list, lambda: btn.click(timeout=2000), timeout=5000):
+            break
+        await collector.settle()
+        clicks += 1
+
+    context.log.info(f'Comment API: {len(collector.top)} comments, {clicks} reply pages')
+    return collector.threads(max_comments)
+
+REPLY_TEXT_SEL = 'span[data-e2e="comment-level-2"]'
+
+_COMMENT_DOM_SELECTORS = {
+    "wrapper": COMMENT_SEL,
+    "lv1User": 'div[data-e2e="comment-username-1"] a.link-a11y-focus',
+    "lv2User": 'div[data-e2e="comment-username-2"] a.link-a11y-focus',
+    "lv1Text": 'span[data-e2e="comment-level-1"]',
+    "lv2Text": REPLY_TEXT_SEL,
+    "likeBox": 'div[role="button"][aria-pressed]',
+    "likeCount": 'span.TUXText',
+}
+
+# Đọc toàn bộ cây comment (user name/href, text, text lượt like, replies) trong MỘT lần evaluate.
+# Reply: user ghép theo index với text (cùng thứ tự DOM); like lấy từ div gần nhất chứa reply,
+# không có thì "" để phía Python dùng like của comment cha như trước.
+_SERIALIZE_COMMENTS_JS = """
+(sel) => {
+    const text = (el) => (el && el.innerText || '').trim();
+    const user = (el) => ({name: text(el), href: el && el.getAttribute('href') || ''});
+    const likes = (scope) => {
+        const box = scope && scope.querySelector(sel.likeBox);
+        return text(box && box.querySelector(sel.likeCount));
+    };
+    const threads = [];
+    for (const wrap of document.querySelectorAll(sel.wrapper)) {
+        const lv1 = text(wrap.querySelector(sel.lv1Text));
+        if (!lv1) continue;
+        const users = wrap.querySelectorAll(sel.lv2User);
+        const replies = [];
+        wrap.querySelectorAll(sel.lv2Text).forEach((span, i) => {
+            const t = text(span);
+            if (!t) return;
+            replies.push({user: user(users[i]), text: t, likes: likes(span.closest('div'))});
+        });
+        threads.push({
+            user: user(wrap.querySelector(sel.lv1User)),
+            text: lv1,
+            likes: likes(wrap),
+            replies: replies,
+        });
+    }
+    return threads;
+}
+"""
+
+
+def _parse_int(text: str) -> int:
+    t = (text or "").strip()
+    m = re.search(r'([\d\.,]+)\s*([kKmM]?)', t)
+    if not m: return 0
+    num, unit = m.group(1), m.group(2).lower()
+    num = num.replace('.', '').replace(',', '')
+    if not num.isdigit():
+        d = re.findall(r'\d+', t)
+        return int(d[0]) if d else 0
+    val = int(num)
+    if unit == 'k': val *= 1000
+    elif unit == 'm': val *= 1_000_000
+    return val
+
+
+async def _scrape_comments_dom(context: PlaywrightCrawlingContext, max_comments: int) -> list[dict]:
+    """Lấy comment bằng cách click "Xem phản hồi" + đọc DOM (chậm, dùng khi không bắt được comment API)."""
+    seen = set()
+    # await context.page.wait_for_timeout(20000)
+    previous = 0
+    retries = 0
+    locator = context.page.locator("div.css-zjz0t7-5e6d46e3--DivCommentObjectWrapper.e16z10169").first  # <-- bỏ await
+    await locator.scroll_into_view_if_needed(timeout=3000)
+
+    await _guard_captcha_or_retry(context)
+    # Yêu cầu: MAX_COMMENTS, SCROLL_PAUSE_MS đã khai báo
+    await context.page.wait_for_selector(COMMENT_SEL, timeout=3000)
+    comments_loc = context.page.locator(COMMENT_SEL)
+
+    vp = context.page.viewport_size or {"height": 800}
+
+    previous = 0
+    retries = 0
+
+    async def expand_view_more_in_top_n(page, wrappers_loc, top_n, per_wrapper_click_limit=10) -> tuple[bool, bool]:
+        """
+        Trả về (changed, any_left):
+        - changed: có mở thêm ít nhất 1 reply không
+        - any_left: sau khi click, còn nút Xem nào trong top_n không
+        """
+        changed = False
+        total_left = 0
+
+        n_wrappers = await wrappers_loc.count()
+        limit = min(top_n, n_wrappers)
+
+        for i in range(limit):
+            await _guard_captcha_or_retry(context)
+            wrap = wrappers_loc.nth(i)
+            # click tối đa per_wrapper_click_limit lần / wrapper để tránh kẹt
+            clicks = 0
+            while clicks < per_wrapper_click_limit:
+                btns = wrap.locator(VIEW_MORE_INNER_SEL)
+                n_btn = await btns.count()
+                if n_btn == 0:
+                    break
+                # luôn lấy cái đầu vì sau click DOM thay đổi
+                btn = btns.first
+                if await btn.is_visible():
+                    try:
+                        await btn.scroll_into_view_if_needed(timeout=1500)
+                    except Exception:
+                        pass
+                    try:
+                        replies_before = await page.locator(REPLY_TEXT_SEL).count()
+                        await btn.click(timeout=2000)
+                        changed = True
+                        clicks += 1
+                        # cho UI cập nhật: đi tiếp ngay khi reply mới được render
+                        await wait_for_count_growth(page, REPLY_TEXT_SEL, replies_before, timeout=2000)
+                    except Exception:
+                        # nếu click fail, thoát vòng while để tránh kẹt
+                        break
+                else:
+                    break
+
+            # đếm còn lại ở wrapper này sau khi đã click
+            total_left += await wrap.locator(VIEW_MORE_INNER_SEL).count()
+
+        any_left = total_left > 0
+        return changed, any_left
+
+    while True:
+        await _guard_captcha_or_retry(context)
+                    # Mở các nút "Xem..." CHỈ trong top N = max_comments
+        changed, any_left_in_top_n = await expand_view_more_in_top_n(
+            context.page, comments_loc, max_comments, per_wrapper_click_limit=10
+        )
+
+        # Đợi lazy-load (xong ngay nếu lần cuộn trước đã làm tăng số comment)
+        new_count = await wait_for_count_growth(context.page, COMMENT_SEL, previous, timeout=SCROLL_PAUSE_MS)
+        if new_count == previous and not changed:
+            retries += 1
+        else:
+            retries = 0
+            previous = new_count
+
+        # Điều kiện dừng theo đúng yêu cầu:
+        # - đủ max_comments, hoặc
+        # - retries > 2 và KHÔNG còn nút Xem trong top N wrappers
+        if (new_count >= max_comments and not any_left_in_top_n) or (retries > 2 ):
+            break
+
+        # --- helper: kéo VƯỢT QUA target ---
+        async def _scroll_past(page, target_locator, overshoot_px: int) -> None:
+            # 1) thử tìm container cuộn gần nhất rồi kéo quá target
+            try:
+                await target_locator.scroll_into_view_if_needed(timeout=300)
+                await page.wait_for_timeout(50)
+                await target_locator.evaluate("""
+                (el, extra) => {
+                    const isScrollable = (n) => {
+                        if (!n || !n.ownerDocument) return false;
+                        const cs = n.ownerDocument.defaultView.getComputedStyle(n);
+                        return ['auto','scroll'].includes(cs.overflowY) && n.scrollHeight > n.clientHeight;
+                    };
+                    // tìm ancestor có overflow-y cuộn
+                    let node = el.parentElement;
+                    while (node) {
+                        if (isScrollable(node)) {
+                            // cuộn sao cho điểm bottom của el VƯỢT quá viewport của container
+                            const elBottom = el.offsetTop + el.offsetHeight;
+                            const targetTop = elBottom - node.clientHeight + extra; // vượt quá một đoạn
+                            node.scrollTop = Math.max(0, targetTop);
+                            return true;
+                        }
+                        node = node.parentElement;
+                    }
+                    // fallback: cuộn window vượt quá
+                    const rect = el.getBoundingClientRect();
+                    const absBottom = rect.bottom + window.scrollY;
+                    window.scrollTo({ top: absBottom + extra, behavior: 'instant' });
+                    return true;
+                }
+                """, overshoot_px)
+                return
+            except Exception:
+                pass
+
+            # 2) fallback cuối: lăn chuột
+            try:
+                await page.mouse.wheel(0, overshoot_px)
+            except Exception:
+                # fallback nữa: trang xuống 1 phát lớn
+                await page.evaluate("(y)=>window.scrollBy(0,y)", overshoot_px)
+
+        # --- trong vòng lặp của bạn ---
+        vp = context.page.viewport_size or {"height": 800}
+        half_screen   = max(200, int(vp["height"] * 0.5))
+        overshoot_px  = max(400, int(vp["height"] * 0.75))  # vượt ~3/4 màn hình
+
+        boundary_index = min(max_comments, new_count) - 1
+        if boundary_index >= 0:
+            try:
+                last = comments_loc.nth(boundary_index)
+                await _scroll_past(context.page, last, overshoot_px=overshoot_px)
+            except Exception:
+                await context.page.mouse.wheel(0, overshoot_px)
+        else:
+            await context.page.mouse.wheel(0, overshoot_px)
+
+        grown = await wait_for_count_growth(context.page, COMMENT_SEL, new_count, timeout=SCROLL_PAUSE_MS)
+
+        # mẹo nhỏ: nếu vẫn không tăng count, thử overshoot “mạnh” 1 lần trước khi tăng retries
+        if grown == new_count:
+            try:
+                if boundary_index >= 0:
+                    last = comments_loc.nth(boundary_index)
+                    await _scroll_past(context.page, last, overshoot_px=vp["height"] * 2)  # mạnh tay
+                    await wait_for_count_growth(context.page, COMMENT_SEL, new_count, timeout=int(SCROLL_PAUSE_MS * 1.2))
+            except Exception:
+                pass
+
+    # Thu thập threads (cmt lvl-1 + replies) + user href + likes: serialize cả cây trong 1 lần evaluate
+    raw_threads = await context.page.evaluate(_SERIALIZE_COMMENTS_JS, _COMMENT_DOM_SELECTORS)
+    threads = []
+    seen = set()
+
+    for raw in raw_threads:
+        lv1_likes = _parse_int(raw["likes"])  # like của item cha (scope ngay trong wrapper)
+        replies = [
+            {"user": r["user"], "text": r["text"], "likes": _parse_int(r["likes"]) or lv1_likes}
+            for r in raw["replies"]
+        ]
+        thread = {
+            "cmt_1": {
+                "user": raw["user"],
+                "text": raw["text"],
+                "likes": lv1_likes,
+                "replies": replies
+            }
+        }
+
+        # ===== Dedupe theo (lv1_href, lv1_text, reply tuples) =====
+        key = (
+            raw["user"]["href"],
+            raw["text"],
+            tuple((r["user"]["href"], r["text"]) for r in replies)
+        )
+        if key not in seen:
+            seen.add(key)
+            threads.append(thread)
+
+    return threads[:max_comments]
+
 
 # --- Handler xử lý từng video riêng lẻ ---
 @router.handler(label='video')
 async def video_handler(context: PlaywrightCrawlingContext) -> None:
     url = context.request.user_data.get('url') or context.request.url
     max_comments = context.request.user_data.get('max_comments', MAX_COMMENTS)
+    comment_mode = context.request.user_data.get('comment_mode', COMMENT_MODE)
     context.log.info(f'Start video crawl: {url}')
-    await context.page.wait_for_load_state("networkidle", timeout=30000)
+    await wait_for_network_quiet(context.page, COMMENT_API, quiet_ms=500, timeout=30000)
     # Lấy dữ liệu JSON từ trang
     elem = await context.page.query_selector('#__UNIVERSAL_DATA_FOR_REHYDRATION__')
     if not elem:
@@ -229,32 +926,11 @@ async def video_handler(context: PlaywrightCrawlingContext) -> None:
     await _guard_captcha_or_retry(context)
     
     raw = await elem.text_content()
-    data_json = json.loads(raw)
+    data_json = rehydration.loads(raw)
     item_struct = data_json['__DEFAULT_SCOPE__']['webapp.video-detail']['itemInfo']['itemStruct']
     
     # Tạo item cơ bản
-    item = {
-        'author': {
-            'nickname': item_struct['author']['nickname'],
-            'id': item_struct['author']['id'],
-            'handle': item_struct['author']['uniqueId'],
-            'signature': item_struct['author']['signature'],
-            'followers': item_struct['authorStats']['followerCount'],
-            'following': item_struct['authorStats']['followingCount'],
-            'hearts': item_struct['authorStats']['heart'],
-            'videos': item_struct['authorStats']['videoCount'],
-        },
-        'description': item_struct['desc'],
-        'tags': [t['hashtagName'] for t in item_struct.get('textExtra', []) if t.get('hashtagName')],
-        'hearts': item_struct['stats']['diggCount'],
-        'shares': item_struct['stats']['shareCount'],
-        'comments': item_struct['stats']['commentCount'],
-        'plays': item_struct['stats']['playCount'],
-        'saves': int(item_struct['stats']['collectCount']),  # <--- thêm dòng này
-        'video_url': url,
-        'thumbnail': item_struct['video']['cover'],
-        'publishedAt': convert_timestamp_to_vn_time(int(item_struct['createTime']))
-    }
+    item = build_video_item(item_struct, url)
     
     try:
         skip_btn = context.page.locator("div.TUXButton-label:has-text('Skip')").first
@@ -278,297 +954,19 @@ async def video_handler(context: PlaywrightCrawlingContext) -> None:
     
     num_comments = item_struct['stats']['commentCount']
     
-    if num_comments > 0:
-        seen = set()
-        # await context.page.wait_for_timeout(20000)
-        previous = 0
-        retries = 0
-        locator = context.page.locator("div.css-zjz0t7-5e6d46e3--DivCommentObjectWrapper.e16z10169").first  # <-- bỏ await
-        await locator.scroll_into_view_if_needed(timeout=3000)
-
-        COMMENT_SEL = "div.css-zjz0t7-5e6d46e3--DivCommentObjectWrapper.e16z10169"
-        VIEW_MORE_INNER_SEL = (
-            "div.css-1ey35vz-5e6d46e3--DivViewRepliesContainer.e1cx7wx92 "
-            "span:has-text('Xem'), "
-            "div.css-1ey35vz-5e6d46e3--DivViewRepliesContainer.e1cx7wx92 "
-            "span:has-text('View')"
-        )
-        
-        await _guard_captcha_or_retry(context)
-        # Yêu cầu: MAX_COMMENTS, SCROLL_PAUSE_MS đã khai báo
-        await context.page.wait_for_selector(COMMENT_SEL, timeout=3000)
-        comments_loc = context.page.locator(COMMENT_SEL)
-
-        vp = context.page.viewport_size or {"height": 800}
-
-        previous = 0
-        retries = 0
-
-        async def expand_view_more_in_top_n(page, wrappers_loc, top_n, per_wrapper_click_limit=10) -> tuple[bool, bool]:
-            """
-            Trả về (changed, any_left):
-            - changed: có mở thêm ít nhất 1 reply không
-            - any_left: sau khi click, còn nút Xem nào trong top_n không
-            """
-            changed = False
-            total_left = 0
-
-            n_wrappers = await wrappers_loc.count()
-            limit = min(top_n, n_wrappers)
-
-            for i in range(limit):
-                await _guard_captcha_or_retry(context)
-                wrap = wrappers_loc.nth(i)
-                # click tối đa per_wrapper_click_limit lần / wrapper để tránh kẹt
-                clicks = 0
-                while clicks < per_wrapper_click_limit:
-                    btns = wrap.locator(VIEW_MORE_INNER_SEL)
-                    n_btn = await btns.count()
-                    if n_btn == 0:
-                        break
-                    # luôn lấy cái đầu vì sau click DOM thay đổi
-                    btn = btns.first
-                    if await btn.is_visible():
-                        try:
-                            await btn.scroll_into_view_if_needed(timeout=1500)
-                        except Exception:
-                            pass
-                        try:
-                            await page.wait_for_timeout(2000)
-                            await btn.click(timeout=2000)
-                            changed = True
-                            clicks += 1
-                            # cho UI cập nhật
-                            await page.wait_for_timeout(2000)
-                        except Exception:
-                            # nếu click fail, thoát vòng while để tránh kẹt
-                            break
-                    else:
-                        break
-
-                # đếm còn lại ở wrapper này sau khi đã click
-                total_left += await wrap.locator(VIEW_MORE_INNER_SEL).count()
-
-            any_left = total_left > 0
-            return changed, any_left
-
-        while True:
-            await _guard_captcha_or_retry(context)
-                        # Mở các nút "Xem..." CHỈ trong top N = max_comments
-            changed, any_left_in_top_n = await expand_view_more_in_top_n(
-                context.page, comments_loc, max_comments, per_wrapper_click_limit=10
-            )
-
-            # Đợi lazy-load
-            await context.page.wait_for_timeout(SCROLL_PAUSE_MS)
-
-            new_count = await comments_loc.count()
-            if new_count == previous and not changed:
-                retries += 1
-            else:
-                retries = 0
-                previous = new_count
-
-            # Điều kiện dừng theo đúng yêu cầu:
-            # - đủ max_comments, hoặc
-            # - retries > 2 và KHÔNG còn nút Xem trong top N wrappers
-            if (new_count >= max_comments and not any_left_in_top_n) or (retries > 2 ):
-                break
-
-            # --- helper: kéo VƯỢT QUA target ---
-            async def _scroll_past(page, target_locator, overshoot_px: int) -> None:
-                # 1) thử tìm container cuộn gần nhất rồi kéo quá target
-                try:
-                    await target_locator.scroll_into_view_if_needed(timeout=300)
-                    await page.wait_for_timeout(50)
-                    await target_locator.evaluate("""
-                    (el, extra) => {
-                        const isScrollable = (n) => {
-                            if (!n || !n.ownerDocument) return false;
-                            const cs = n.ownerDocument.defaultView.getComputedStyle(n);
-                            return ['auto','scroll'].includes(cs.overflowY) && n.scrollHeight > n.clientHeight;
-                        };
-                        // tìm ancestor có overflow-y cuộn
-                        let node = el.parentElement;
-                        while (node) {
-                            if (isScrollable(node)) {
-                                // cuộn sao cho điểm bottom của el VƯỢT quá viewport của container
-                                const elBottom = el.offsetTop + el.offsetHeight;
-                                const targetTop = elBottom - node.clientHeight + extra; // vượt quá một đoạn
-                                node.scrollTop = Math.max(0, targetTop);
-                                return true;
-                            }
-                            node = node.parentElement;
-                        }
-                        // fallback: cuộn window vượt quá
-                        const rect = el.getBoundingClientRect();
-                        const absBottom = rect.bottom + window.scrollY;
-                        window.scrollTo({ top: absBottom + extra, behavior: 'instant' });
-                        return true;
-                    }
-                    """, overshoot_px)
-                    return
-                except Exception:
-                    pass
-
-                # 2) fallback cuối: lăn chuột
-                try:
-                    await page.mouse.wheel(0, overshoot_px)
-                except Exception:
-                    # fallback nữa: trang xuống 1 phát lớn
-                    await page.evaluate("(y)=>window.scrollBy(0,y)", overshoot_px)
-
-            # --- trong vòng lặp của bạn ---
-            vp = context.page.viewport_size or {"height": 800}
-            half_screen   = max(200, int(vp["height"] * 0.5))
-            overshoot_px  = max(400, int(vp["height"] * 0.75))  # vượt ~3/4 màn hình
-
-            boundary_index = min(max_comments, new_count) - 1
-            if boundary_index >= 0:
-                try:
-                    last = comments_loc.nth(boundary_index)
-                    await _scroll_past(context.page, last, overshoot_px=overshoot_px)
-                except Exception:
-                    await context.page.mouse.wheel(0, overshoot_px)
-            else:
-                await context.page.mouse.wheel(0, overshoot_px)
-
-            await context.page.wait_for_timeout(SCROLL_PAUSE_MS)
-
-            # mẹo nhỏ: nếu vẫn không tăng count, thử overshoot “mạnh” 1 lần trước khi tăng retries
-            if (await comments_loc.count()) == new_count:
-                try:
-                    if boundary_index >= 0:
-                        last = comments_loc.nth(boundary_index)
-                        await _scroll_past(context.page, last, overshoot_px=vp["height"] * 2)  # mạnh tay
-                        await context.page.wait_for_timeout(int(SCROLL_PAUSE_MS * 1.2))
-                except Exception:
-                    pass
-
-        import re
-
-        COMMENT_WRAPPER_SEL = 'div.css-zjz0t7-5e6d46e3--DivCommentObjectWrapper.e16z10169'
-        LV1_USER_SEL       = 'div[data-e2e="comment-username-1"] a.link-a11y-focus'
-        LV2_USER_SEL       = 'div[data-e2e="comment-username-2"] a.link-a11y-focus'
-        LV1_TEXT_SEL       = 'span[data-e2e="comment-level-1"]'
-        LV2_TEXT_SEL       = 'span[data-e2e="comment-level-2"]'
-        LIKE_CONTAINER_SEL = 'div[role="button"][aria-pressed]'
-        LIKE_COUNT_INNER   = 'span.TUXText'
-
-        def _parse_int(text: str) -> int:
-            import re
-            t = (text or "").strip()
-            m = re.search(r'([\d\.,]+)\s*([kKmM]?)', t)
-            if not m: return 0
-            num, unit = m.group(1), m.group(2).lower()
-            num = num.replace('.', '').replace(',', '')
-            if not num.isdigit():
-                d = re.findall(r'\d+', t)
-                return int(d[0]) if d else 0
-            val = int(num)
-            if unit == 'k': val *= 1000
-            elif unit == 'm': val *= 1_000_000
-            return val
-
-        async def _get_like_from(scope_el) -> int:
-            try:
-                like_box = await scope_el.query_selector(LIKE_CONTAINER_SEL)
-                if like_box:
-                    span_num = await like_box.query_selector(LIKE_COUNT_INNER)
-                    if span_num:
-                        return _parse_int((await span_num.inner_text()) or "")
-            except Exception:
-                pass
-            return 0
-
-        # Thu thập threads (cmt lvl-1 + replies) + user href + likes
-        comment_divs = await context.page.query_selector_all(COMMENT_WRAPPER_SEL)
-        threads = []
-        seen = set()
-
-        for wrap in comment_divs:
-            # ===== LV1 trong wrapper =====
-            lv1_text_el = await wrap.query_selector(LV1_TEXT_SEL)
-            if not lv1_text_el:
-                continue
-            lv1_text = (await lv1_text_el.inner_text() or "").strip()
-            if not lv1_text:
-                continue
-
-            u1 = await wrap.query_selector(LV1_USER_SEL)
-            lv1_user = {"name": "", "href": ""}
-            if u1:
-                try:
-                    lv1_user["href"] = await u1.get_attribute("href") or ""
-                    lv1_user["name"] = (await u1.inner_text() or "").strip()
-                except Exception:
-                    pass
-
-            lv1_likes = await _get_like_from(wrap)  # like của item cha (scope ngay trong wrapper)
-
-            thread = {
-                "cmt_1": {
-                    "user": lv1_user,
-                    "text": lv1_text,
-                    "likes": lv1_likes,
-                    "replies": []
-                }
-            }
-
-            # ===== LV2 trong wrapper (không dùng ancestor) =====
-            reply_text_nodes = await wrap.query_selector_all(LV2_TEXT_SEL)
-            reply_user_nodes = await wrap.query_selector_all(LV2_USER_SEL)
-            print(f"Found {len(reply_text_nodes)} replies under this comment")
-            
-            # Đồng bộ theo index: tên/href thường align với text theo thứ tự DOM
-            for i, rs in enumerate(reply_text_nodes):
-                t = (await rs.inner_text() or "").strip()
-                if not t:
-                    continue
-
-                user = {"name": "", "href": ""}
-                if i < len(reply_user_nodes) and reply_user_nodes[i]:
-                    try:
-                        user["href"] = await reply_user_nodes[i].get_attribute("href") or ""
-                        user["name"] = (await reply_user_nodes[i].inner_text() or "").strip()
-                    except Exception:
-                        pass
-
-                # Like cho từng reply: lấy like container gần nhất *bên trong wrapper*,
-                # ưu tiên node cha gần reply bằng evaluate(closest) để vẫn giữ scope tương đối.
-                likes = 0
-                try:
-                    anc = await rs.evaluate_handle(
-                        """el => el.closest('div')""")  # đủ dùng: wrapper item nhỏ nhất chứa reply
-                    if anc:
-                        # Tìm like container bắt đầu từ anc, fallback: wrap
-                        likes = await _get_like_from(anc) or await _get_like_from(wrap)
-                except Exception:
-                    likes = await _get_like_from(wrap)
-
-                thread["cmt_1"]["replies"].append({
-                    "user":  user,
-                    "text":  t,
-                    "likes": likes
-                })
-
-            # ===== Dedupe theo (lv1_href, lv1_text, reply tuples) =====
-            key = (
-                thread["cmt_1"]["user"].get("href", ""),
-                thread["cmt_1"]["text"],
-                tuple((r["user"].get("href",""), r["text"]) for r in thread["cmt_1"]["replies"])
-            )
-            if key not in seen:
-                seen.add(key)
-                threads.append(thread)
-
+    if num_comments > 0 and max_comments > 0:
+        threads = None
+        if comment_mode == 'api':
+            threads = await _collect_comments_api(context, comment_collector(context.page), max_comments)
+        if threads is None:
+            threads = await _scrape_comments_dom(context, max_comments)
         item['comments_content'] = threads[:max_comments]
 
         context.log.info(f'Collected {len(item["comments_content"])} threads')
 
 
     # Lưu kết quả
-    await context.push_data(item)
+    await _push_data(context, item)
 
 @router.handler(label='trending_videos_search')
 async def trending_videos_search(context: PlaywrightCrawlingContext) -> None:
@@ -579,7 +977,8 @@ async def trending_videos_search(context: PlaywrightCrawlingContext) -> None:
     # Không đợi visible, chỉ cần attach là đủ
     await context.page.wait_for_selector('ul[data-e2e="search-transfer"] li[data-e2e="search-transfer-guess-search-item"]', state='attached', timeout=30000)
 
-    await context.page.wait_for_timeout(5000) 
+    # Danh sách gợi ý render dần: đợi tới khi list ngừng thay đổi (tối đa 5s như trước)
+    await wait_for_dom_quiet(context.page, 'ul[data-e2e="search-transfer"]', quiet_ms=500, timeout=5000)
     # Extract text and generate search URL from the list items
     list_items = await context.page.query_selector_all('li[data-e2e="search-transfer-guess-search-item"]')
     trending_videos = []
@@ -598,9 +997,12 @@ async def trending_videos_search(context: PlaywrightCrawlingContext) -> None:
     context.log.info(f'Collected trending videos: {trending_videos}')
     
     # Save the results
-    await context.push_data(trending_videos)
+    await _push_data(context, trending_videos)
     
 
+ADS_VIDEO_SEL = 'div.index-mobile_cardWrapper__SgzEk blockquote[data-video-id]'
+
+
 @router.handler(label='tiktok_ads_get_url_trending_videos')
 async def tiktok_ads(context: PlaywrightCrawlingContext) -> None:
     # Get limit from user data
@@ -617,7 +1019,7 @@ async def tiktok_ads(context: PlaywrightCrawlingContext) -> None:
 
     while len(collected_videos) < limit and retries < MAX_RETRIES:
         # Extract video IDs and URLs
-        iframe_elements = await context.page.query_selector_all('div.index-mobile_cardWrapper__SgzEk blockquote[data-video-id]')
+        iframe_elements = await context.page.query_selector_all(ADS_VIDEO_SEL)
         new_videos = [
             {
                 'video_id': await iframe.get_attribute('data-video-id'),
@@ -637,7 +1039,8 @@ async def tiktok_ads(context: PlaywrightCrawlingContext) -> None:
         view_more_btn = await context.page.query_selector('div[data-testid="cc_contentArea_viewmore_btn"]')
         if view_more_btn:
             await view_more_btn.click()
-            await context.page.wait_for_timeout(2000)  # Wait for new content to load
+            # Wait for new content to load
+            await wait_for_count_growth(context.page, ADS_VIDEO_SEL, len(iframe_elements), timeout=2000)
         else:
             # If no button found, we've reached the end
             break
@@ -647,4 +1050,4 @@ async def tiktok_ads(context: PlaywrightCrawlingContext) -> None:
     # Trim to limit and save results
     final_videos = collected_videos[:limit]
     context.log.info(f'Collected {len(final_videos)} videos')
-    await context.push_data(final_videos)
\ No newline at end of file
+    await _push_data(context, final_videos)
\ No newline at end of file
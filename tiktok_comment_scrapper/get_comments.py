@@ -4,9 +4,10 @@ import click
 import json
 
 from loguru import logger
+from typing import Any, AsyncIterator, Dict, Optional
 # HEHE
 
-from .tiktokcomment import TiktokComment
+from .tiktokcomment import TiktokComment, AsyncTiktokComment
 from .tiktokcomment.typing import Comments
 
 __title__ = 'TikTok Comment Scrapper'
@@ -14,7 +15,9 @@ __version__ = '2.0.0'
 __MINH__ = '1.0.0'
 def get_comments(
     aweme_id: str,
+    **limits
 ): 
+    """limits: max_comments, max_replies_per_comment, include_replies, time_budget (giây)."""
     if(not aweme_id):
         raise ValueError('example id : 7418294751977327878')      
     
@@ -22,12 +25,55 @@ def get_comments(
         'start scrap comments %s' % aweme_id
     )
 
-    comments: Comments = TiktokComment()(
-        aweme_id=aweme_id
+    comments: Comments = TiktokComment().get_all_comments(
+        aweme_id=aweme_id,
+        **limits
     )
     
     return comments.dict
 
+async def get_comments_async(
+    aweme_id: str,
+    concurrency: int = 8,
+    **limits
+):
+    if(not aweme_id):
+        raise ValueError('example id : 7418294751977327878')
+
+    logger.info(
+        'start scrap comments (async) %s' % aweme_id
+    )
+
+    async with AsyncTiktokComment(concurrency=concurrency) as client:
+        comments: Comments = await client.get_all_comments(
+            aweme_id=aweme_id,
+            **limits
+        )
+
+    return comments.dict
+
+async def iter_comments_async(
+    aweme_id: str,
+    concurrency: int = 8,
+    meta: Optional[Dict[str, Any]] = None,
+    **limits
+) -> AsyncIterator[Dict[str, Any]]:
+    """Yield dict của từng comment cấp 1 (kèm replies) ngay khi lấy xong."""
+    if(not aweme_id):
+        raise ValueError('example id : 7418294751977327878')
+
+    logger.info(
+        'start stream comments (async) %s' % aweme_id
+    )
+
+    async with AsyncTiktokComment(concurrency=concurrency) as client:
+        async for comment in client.iter_comments(
+            aweme_id=aweme_id,
+            meta=meta,
+            **limits
+        ):
+            yield comment.dict
+
 # import sys
 # if(__name__ == '__main__'):
 #     id = sys.argv[1] if len(sys.argv) > 1 else "7418294751977327878"
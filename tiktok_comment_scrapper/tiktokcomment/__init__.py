@@ -1 +1,2 @@
-from .tiktokcomment import TiktokComment
\ No newline at end of file
+from .tiktokcomment import TiktokComment
+from .async_tiktokcomment import AsyncTiktokComment
\ No newline at end of file
@@ -0,0 +1,394 @@
+import asyncio
+import math
+import random
+import aiohttp
+
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
+from loguru import logger
+from ..tiktokcomment.typing import Comments, Comment
+from .tiktokcomment import COMMENTS_EXPR, comment_fields, deadline_of, expired, page_meta
+
+class AsyncTiktokComment:
+    """
+    Bản async của TiktokComment: các trang comment và trang reply được lấy song song
+    (tối đa `concurrency` request cùng lúc) trên một connection pool dùng chung.
+    Kết quả giữ đúng dạng Comments/Comment như bản sync.
+    429 / 5xx / lỗi mạng / body không phải JSON được thử lại tối đa `retries` lần
+    (backoff full jitter như get_meta_data_video), hết lượt thì raise.
+
+        async with AsyncTiktokComment(concurrency=8) as client:
+            comments = await client(aweme_id)
+            async for comment in client.iter_comments(aweme_id, max_comments=200, time_budget=30):
+                ...
+    """
+    BASE_URL: str = 'https://www.tiktok.com'
+    API_URL: str = '%s/api' % BASE_URL
+    HEADERS: Dict[str, str] = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36',
+        'Referer': '%s/' % BASE_URL
+    }
+    BACKOFF_BASE: float = 0.5
+    BACKOFF_MAX: float = 10.0
+
+    def __init__(
+        self: 'AsyncTiktokComment',
+        concurrency: Optional[int] = 8,
+        timeout: Optional[float] = 30,
+        retries: Optional[int] = 3
+    ) -> None:
+        self.concurrency: int = concurrency
+        self.retries: int = retries
+        self.__timeout: float = timeout
+        self.__semaphore: asyncio.Semaphore = asyncio.Semaphore(concurrency)
+        self.__session: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(
+        self: 'AsyncTiktokComment'
+    ) -> 'AsyncTiktokComment':
+        return self
+
+    async def __aexit__(
+        self: 'AsyncTiktokComment',
+        *exc: Any
+    ) -> None:
+        await self.close()
+
+    async def close(
+        self: 'AsyncTiktokComment'
+    ) -> None:
+        if(self.__session is not None and not self.__session.closed):
+            await self.__session.close()
+        self.__session = None
+
+    def __get_session(
+        self: 'AsyncTiktokComment'
+    ) -> aiohttp.ClientSession:
+        # Tạo lazy trong event loop; keep-alive dùng chung cho mọi request của client
+        if(self.__session is None or self.__session.closed):
+            self.__session = aiohttp.ClientSession(
+                headers=self.HEADERS,
+                timeout=aiohttp.ClientTimeout(total=self.__timeout),
+                connector=aiohttp.TCPConnector(
+                    limit=self.concurrency,
+                    ttl_dns_cache=300
+                )
+            )
+        return self.__session
+
+    async def __get_json(
+        self: 'AsyncTiktokComment',
+        path: str,
+        params: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        for attempt in range(self.retries + 1):
+            if(attempt):
+                # Full jitter: các request bị 429 cùng lúc không retry cùng lúc
+                await asyncio.sleep(random.uniform(0, min(self.BACKOFF_MAX, self.BACKOFF_BASE * 2 ** attempt)))
+            try:
+                # Chỉ giữ semaphore trong lúc gọi HTTP, không giữ khi backoff/parse/lấy reply
+                async with self.__semaphore:
+                    async with self.__get_session().get(
+                        '%s/%s' % (self.API_URL, path),
+                        params=params
+                    ) as response:
+                        response.raise_for_status()
+                        return await response.json(content_type=None) or {}
+            except aiohttp.ClientResponseError as error:
+                if(error.status != 429 and error.status < 500 or attempt == self.retries): raise
+                logger.warning('%s: HTTP %s, thử lại (%d/%d)' % (path, error.status, attempt + 1, self.retries))
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as error:
+                # ValueError: body không phải JSON (trang captcha / bị cắt giữa chừng)
+                if(attempt == self.retries): raise
+                logger.warning('%s: %r, thử lại (%d/%d)' % (path, error, attempt + 1, self.retries))
+
+    async def __parse_comment(
+        self: 'AsyncTiktokComment',
+        data: Dict[str, Any],
+        aweme_id: str,
+        max_replies: Optional[int] = None,
+        include_replies: Optional[bool] = True,
+        deadline: Optional[float] = None
+    ) -> Comment:
+        data: Dict[str, Any] = comment_fields(
+            data
+        )
+
+        comment: Comment = Comment(
+            **data,
+            replies=await self.get_all_replies(
+                comment_id=data.get('comment_id'),
+                aweme_id=aweme_id,
+                total=data.get('total_reply'),
+                limit=max_replies,
+                deadline=deadline
+            ) if include_replies and data.get('total_reply') and max_replies != 0 else []
+        )
+
+        # lazy: chỉ format create_time khi log INFO thật sự được ghi
+        logger.opt(lazy=True).info(
+            '{} - {} : {}',
+            lambda: comment.create_time,
+            lambda: comment.username,
+            lambda: comment.comment
+        )
+
+        return comment
+
+    async def __parse_comments(
+        self: 'AsyncTiktokComment',
+        raw_comments: List[Dict[str, Any]],
+        aweme_id: str
+    ) -> List[Comment]:
+        return list(await asyncio.gather(*(
+            self.__parse_comment(
+                comment,
+                aweme_id
+            ) for comment in raw_comments
+        )))
+
+    async def __fetch_replies(
+        self: 'AsyncTiktokComment',
+        comment_id: str,
+        aweme_id: str,
+        size: int,
+        page: int
+    ) -> Dict[str, Any]:
+        return await self.__get_json(
+            'comment/list/reply/',
+            {
+                'aid': 1988,
+                'comment_id': comment_id,
+                'item_id': aweme_id,
+                'count': size,
+                'cursor': (page - 1) * size
+            }
+        )
+
+    async def __fetch_comments(
+        self: 'AsyncTiktokComment',
+        aweme_id: str,
+        size: int,
+        page: int
+    ) -> Dict[str, Any]:
+        return await self.__get_json(
+            'comment/list/',
+            {
+                'aid': 1988,
+                'aweme_id': aweme_id,
+                'count': size,
+                'cursor': (page - 1) * size
+            }
+        )
+
+    async def __fetch_pages(
+        self: 'AsyncTiktokComment',
+        fetch: Any,
+        size: int,
+        total: Optional[int],
+        limit: Optional[int] = None,
+        deadline: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Lấy các trang của một danh sách có phân trang theo cursor (đủ `limit` phần tử thì dừng).
+        Trang 1 trước; biết `total` thì lấy các trang còn lại song song, sau đó (total có thể
+        đã cũ) đi tiếp từng đợt `concurrency` trang cho tới trang hết has_more / rỗng.
+        Quá `deadline` thì không mở đợt mới.
+        """
+        pages: List[Dict[str, Any]] = [await fetch(1)]
+        total = total or pages[0].get('total') or 0
+        if(limit is not None): total = min(total, limit)
+        known: int = math.ceil(total / size)
+        if(pages[0].get('has_more') and known > 1):
+            pages.extend(await asyncio.gather(*(
+                fetch(page) for page in range(2, known + 1)
+            )))
+        while(
+            pages[-1].get('has_more') and pages[-1].get('comments')
+            and (limit is None or sum(len(data.get('comments') or []) for data in pages) < limit)
+            and not expired(deadline)
+        ):
+            start: int = len(pages) + 1
+            batch = await asyncio.gather(*(
+                fetch(page) for page in range(start, start + self.concurrency)
+            ))
+            for data in batch:
+                pages.append(data)
+                if(not (data.get('has_more') and data.get('comments'))): break
+        return pages
+
+    async def get_replies(
+        self: 'AsyncTiktokComment',
+        comment_id: str,
+        aweme_id: str,
+        size: Optional[int] = 50,
+        page: Optional[int] = 1
+    ) -> List[Comment]:
+        data: Dict[str, Any] = await self.__fetch_replies(
+            comment_id,
+            aweme_id,
+            size,
+            page
+        )
+
+        return await self.__parse_comments(
+            data.get('comments') or [],
+            aweme_id
+        )
+
+    async def get_all_replies(
+        self: 'AsyncTiktokComment',
+        comment_id: str,
+        aweme_id: str,
+        total: Optional[int] = None,
+        size: Optional[int] = 50,
+        limit: Optional[int] = None,
+        deadline: Optional[float] = None
+    ) -> List[Comment]:
+        if(limit is not None): size = max(1, min(size, limit))
+        pages: List[Dict[str, Any]] = await self.__fetch_pages(
+            lambda page: self.__fetch_replies(comment_id, aweme_id, size, page),
+            size,
+            total,
+            limit,
+            deadline
+        )
+
+        return await self.__parse_comments(
+            [reply for data in pages for reply in data.get('comments') or []][:limit],
+            aweme_id
+        )
+
+    async def get_comments(
+        self: 'AsyncTiktokComment',
+        aweme_id: str,
+        size: Optional[int] = 50,
+        page: Optional[int] = 1
+    ) -> Comments:
+        data: Dict[str, Any] = COMMENTS_EXPR.search(
+            await self.__fetch_comments(
+                aweme_id,
+                size,
+                page
+            )
+        )
+
+        return Comments(
+            comments=await self.__parse_comments(
+                data.pop('comments') or [],
+                aweme_id
+            ),
+            **data,
+        )
+
+    async def iter_comments(
+        self: 'AsyncTiktokComment',
+        aweme_id: str,
+        max_comments: Optional[int] = None,
+        max_replies_per_comment: Optional[int] = None,
+        include_replies: Optional[bool] = True,
+        time_budget: Optional[float] = None,
+        size: Optional[int] = 50,
+        meta: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[Comment]:
+        """
+        Yield từng comment cấp 1 (kèm replies) theo thứ tự trang, ngay khi parse xong.
+        Trang tiếp theo được lấy trước trong lúc parse trang hiện tại (tối đa `concurrency`
+        trang, không vượt quá số trang cần cho `max_comments`); replies của một trang lấy song song.
+        Dừng sớm khi đủ `max_comments` hoặc hết `time_budget` giây. `meta` (nếu truyền) được
+        điền caption / video_url / has_more (1 nếu dừng sớm khi vẫn còn comment).
+        Trang 1 luôn được lấy (kể cả max_comments=0 / time_budget=0) để có meta như bản sync.
+        """
+        deadline: Optional[float] = deadline_of(time_budget)
+        meta = {} if meta is None else meta
+        last_page: float = max(1, math.ceil(max_comments / size)) if max_comments is not None else math.inf
+        pending: Deque[asyncio.Future] = deque()
+        parsing: List[asyncio.Future] = []
+        next_page: int = 1
+        page: int = 1
+        count: int = 0
+
+        def prefetch() -> None:
+            nonlocal next_page
+            # Hết giờ thì không mở trang mới (trừ trang 1, cần cho meta)
+            while(
+                len(pending) < self.concurrency and next_page <= last_page
+                and (next_page == 1 or not expired(deadline))
+            ):
+                pending.append(asyncio.ensure_future(
+                    self.__fetch_comments(aweme_id, size, next_page)
+                ))
+                next_page += 1
+
+        try:
+            prefetch()
+            while(pending):
+                data: Dict[str, Any] = await pending.popleft()
+                if(page == 1): meta.update(page_meta(data))
+
+                raw = data.get('comments') or []
+                take = raw if max_comments is None else raw[:max(0, max_comments - count)]
+                more: bool = bool(data.get('has_more') and raw)
+                meta['has_more'] = int(more or len(take) < len(raw))
+                if(more and not expired(deadline)):
+                    prefetch()
+                else:
+                    # Trang cuối (hoặc hết giờ): huỷ các trang đã đoán trước
+                    for future in pending: future.cancel()
+                    pending.clear()
+
+                parsing = [
+                    asyncio.ensure_future(self.__parse_comment(
+                        comment,
+                        aweme_id,
+                        max_replies_per_comment,
+                        include_replies,
+                        deadline
+                    )) for comment in take
+                ]
+                for task in parsing:
+                    if(expired(deadline)):
+                        meta['has_more'] = 1
+                        return
+                    yield await task
+                    count += 1
+
+                page += 1
+                if(expired(deadline)): return
+        finally:
+            for future in [*pending, *parsing]: future.cancel()
+
+    async def get_all_comments(
+        self: 'AsyncTiktokComment',
+        aweme_id: str,
+        max_comments: Optional[int] = None,
+        max_replies_per_comment: Optional[int] = None,
+        include_replies: Optional[bool] = True,
+        time_budget: Optional[float] = None
+    ) -> Comments:
+        meta: Dict[str, Any] = {}
+        comments: List[Comment] = [
+            comment async for comment in self.iter_comments(
+                aweme_id=aweme_id,
+                max_comments=max_comments,
+                max_replies_per_comment=max_replies_per_comment,
+                include_replies=include_replies,
+                time_budget=time_budget,
+                meta=meta
+            )
+        ]
+
+        return Comments(
+            comments=comments,
+            caption=meta.get('caption'),
+            video_url=meta.get('video_url'),
+            has_more=meta.get('has_more', 0)
+        )
+
+    async def __call__(
+        self: 'AsyncTiktokComment',
+        aweme_id: str
+    ) -> Comments:
+        return await self.get_all_comments(
+            aweme_id=aweme_id
+        )
@@ -1,12 +1,70 @@
+import time
 import jmespath
 
 from typing import Any, Dict, Iterator
+from itertools import islice
 from requests import Session, Response
 from loguru import logger
 from typing import Optional
 from datetime import datetime
 from ..tiktokcomment.typing import Comments, Comment
 
+# Dùng chung cho TiktokComment và AsyncTiktokComment
+COMMENTS_QUERY: str = """
+{
+    caption: comments[0].share_info.title,
+    video_url: comments[0].share_info.url,
+    comments: comments,
+    has_more: has_more
+}
+"""
+
+# Compile một lần khi import thay vì parse lại chuỗi query ở mỗi trang
+COMMENTS_EXPR = jmespath.compile(COMMENTS_QUERY)
+
+def comment_fields(
+    data: Dict[str, Any]
+) -> Dict[str, Any]:
+    """
+    Field của một comment trong JSON API (thiếu thì None, như JMESPath). Chạy cho từng
+    comment nên đọc dict trực tiếp thay vì qua JMESPath.
+    """
+    user: Dict[str, Any] = data.get('user') or {}
+    avatars = (user.get('avatar_thumb') or {}).get('url_list') or [None]
+    return {
+        'comment_id': data.get('cid'),
+        'username': user.get('unique_id'),
+        'nickname': user.get('nickname'),
+        'comment': data.get('text'),
+        'create_time': data.get('create_time'),
+        'avatar': avatars[0],
+        'total_reply': data.get('reply_comment_total'),
+        'likes': data.get('digg_count')
+    }
+
+def deadline_of(
+    time_budget: Optional[float]
+) -> Optional[float]:
+    # 0 là hết giờ ngay (chỉ lấy trang đầu cho caption / video_url), None mới là không giới hạn
+    return time.monotonic() + time_budget if time_budget is not None else None
+
+def expired(
+    deadline: Optional[float]
+) -> bool:
+    return deadline is not None and time.monotonic() >= deadline
+
+def page_meta(
+    data: Dict[str, Any]
+) -> Dict[str, Any]:
+    # caption / video_url của video lấy từ trang comment đầu tiên
+    meta: Dict[str, Any] = COMMENTS_EXPR.search(
+        data
+    ) or {}
+    return {
+        'caption': meta.get('caption'),
+        'video_url': meta.get('video_url')
+    }
+
 class TiktokComment:
     BASE_URL: str = 'https://www.tiktok.com'
     API_URL: str = '%s/api' % BASE_URL
@@ -15,46 +73,42 @@ class TiktokComment:
         self: 'TiktokComment'
     ) -> None:
         self.__session: Session = Session()
-    
+
     def __parse_comment(
         self: 'TiktokComment',
-        data: Dict[str, Any]
+        data: Dict[str, Any],
+        max_replies: Optional[int] = None,
+        include_replies: Optional[bool] = True,
+        deadline: Optional[float] = None
     ) -> Comment:
-        data: Dict[str, Any] = jmespath.search(
-            """
-            {
-                comment_id: cid,
-                username: user.unique_id,
-                nickname: user.nickname,
-                comment: text,
-                create_time: create_time,
-                avatar: user.avatar_thumb.url_list[0],
-                total_reply: reply_comment_total,
-                likes: digg_count
-            }
-            """ ,
+        data: Dict[str, Any] = comment_fields(
             data
         )
-    
+
         comment: Comment = Comment(
             **data,
             replies=list(
-                self.get_all_replies(data.get('comment_id'))
-            ) if data.get('total_reply') else []
+                islice(
+                    self.get_all_replies(data.get('comment_id'), deadline),
+                    max_replies
+                )
+            ) if include_replies and data.get('total_reply') else []
         )
 
-        logger.info('%s - %s : %s' % (
-                comment.create_time,
-                comment.username, 
-                comment.comment
-            )
+        # lazy: chỉ format create_time khi log INFO thật sự được ghi
+        logger.opt(lazy=True).info(
+            '{} - {} : {}',
+            lambda: comment.create_time,
+            lambda: comment.username,
+            lambda: comment.comment
         )
 
         return comment
 
     def get_all_replies(
         self: 'TiktokComment',
-        comment_id: str
+        comment_id: str,
+        deadline: Optional[float] = None
     ) -> Iterator[Comment]:
         page: int = 1
         while True:
@@ -66,7 +120,8 @@ class TiktokComment:
             ): break
             for reply in replies:
                 yield reply
-            
+            if(expired(deadline)): break
+
             page += 1
 
     def get_replies(
@@ -91,37 +146,13 @@ class TiktokComment:
                 comment
             ) for comment in response.json().pop('comments')
         ]
-    
-    def get_all_comments(
-        self: 'TiktokComment',
-        aweme_id: str
-    ) -> Comments:
-        page: int = 1
-        data: Comments = self.get_comments(
-            aweme_id=aweme_id,
-            page=page   
-        )
-        while(True):
-            page += 1
-            
-            comments: Comments = self.get_comments(
-                aweme_id=aweme_id,
-                page=page
-            )
-            if(not comments.has_more): break
 
-            data.comments.extend(
-                comments.comments
-            )
-
-        return data
-
-    def get_comments(
+    def __fetch_comments(
         self: 'TiktokComment',
         aweme_id: str,
-        size: Optional[int] = 50,
-        page: Optional[int] = 1
-    ) -> Comments:
+        size: int,
+        page: int
+    ) -> Dict[str, Any]:
         self.aweme_id: str = aweme_id
 
         response: Response = self.__session.get(
@@ -134,27 +165,110 @@ class TiktokComment:
             }
         )
 
-        data: Dict[str, Any] = jmespath.search(    
-            """
-            {
-                caption: comments[0].share_info.title,
-                video_url: comments[0].share_info.url,
-                comments: comments,
-                has_more: has_more
-            }
-            """,
-            response.json()
+        return response.json() or {}
+
+    def iter_comments(
+        self: 'TiktokComment',
+        aweme_id: str,
+        max_comments: Optional[int] = None,
+        max_replies_per_comment: Optional[int] = None,
+        include_replies: Optional[bool] = True,
+        time_budget: Optional[float] = None,
+        size: Optional[int] = 50,
+        meta: Optional[Dict[str, Any]] = None
+    ) -> Iterator[Comment]:
+        """
+        Yield từng comment cấp 1 (kèm replies) ngay khi parse xong, dừng sớm khi đủ
+        `max_comments` hoặc hết `time_budget` giây. `meta` (nếu truyền) được điền
+        caption / video_url / has_more (1 nếu dừng sớm khi vẫn còn comment).
+        """
+        deadline: Optional[float] = deadline_of(time_budget)
+        meta = {} if meta is None else meta
+        count: int = 0
+        page: int = 1
+        while True:
+            data: Dict[str, Any] = self.__fetch_comments(
+                aweme_id=aweme_id,
+                size=size,
+                page=page
+            )
+            if(page == 1): meta.update(page_meta(data))
+
+            raw = data.get('comments') or []
+            take = raw if max_comments is None else raw[:max(0, max_comments - count)]
+            more: bool = bool(data.get('has_more') and raw)
+            meta['has_more'] = int(more or len(take) < len(raw))
+
+            for comment in take:
+                if(expired(deadline)):
+                    meta['has_more'] = 1
+                    return
+                yield self.__parse_comment(
+                    comment,
+                    max_replies_per_comment,
+                    include_replies,
+                    deadline
+                )
+                count += 1
+
+            if(
+                not more
+                or (max_comments is not None and count >= max_comments)
+                or expired(deadline)
+            ): return
+
+            page += 1
+
+    def get_all_comments(
+        self: 'TiktokComment',
+        aweme_id: str,
+        max_comments: Optional[int] = None,
+        max_replies_per_comment: Optional[int] = None,
+        include_replies: Optional[bool] = True,
+        time_budget: Optional[float] = None
+    ) -> Comments:
+        meta: Dict[str, Any] = {}
+        comments = list(
+            self.iter_comments(
+                aweme_id=aweme_id,
+                max_comments=max_comments,
+                max_replies_per_comment=max_replies_per_comment,
+                include_replies=include_replies,
+                time_budget=time_budget,
+                meta=meta
+            )
+        )
+
+        return Comments(
+            comments=comments,
+            caption=meta.get('caption'),
+            video_url=meta.get('video_url'),
+            has_more=meta.get('has_more', 0)
+        )
+
+    def get_comments(
+        self: 'TiktokComment',
+        aweme_id: str,
+        size: Optional[int] = 50,
+        page: Optional[int] = 1
+    ) -> Comments:
+        data: Dict[str, Any] = COMMENTS_EXPR.search(
+            self.__fetch_comments(
+                aweme_id=aweme_id,
+                size=size,
+                page=page
+            )
         )
 
         return Comments(
             comments=[
                 self.__parse_comment(
                     comment
-                ) for comment in data.pop('comments')
+                ) for comment in data.pop('comments') or []
             ],
             **data,
         )
-    
+
     def __call__(
         self: 'TiktokComment',
         aweme_id: str
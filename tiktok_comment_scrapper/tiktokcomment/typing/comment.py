@@ -5,84 +5,104 @@ from datetime import datetime
 from typing import Optional, List, Dict, Any
 
 class Comment:
+    # __slots__: không có __dict__ riêng mỗi instance — video viral có hàng trăm nghìn comment
+    __slots__ = (
+        '_comment_id',
+        '_username',
+        '_nickname',
+        '_comment',
+        '_create_time',
+        '_avatar',
+        '_total_reply',
+        '_replies',
+        '_likes'
+    )
+
     def __init__(
         self: 'Comment',
         comment_id: str,
         username: str,
         nickname: str,
         comment: str,
-        create_time: str,
+        create_time: int,
         avatar: str,
         total_reply: int,
         likes: int = 0,
-        replies: Optional[List['Comment']] = []
+        replies: Optional[List['Comment']] = None
     ) -> None:
         self._comment_id: str = comment_id
         self._username: str = username
         self._nickname: str = nickname
         self._comment: str = comment
-        self._create_time: str = datetime\
-            .fromtimestamp(
-                create_time
-            ).strftime("%Y-%m-%dT%H:%M:%S")
+        # Giữ timestamp gốc, chỉ format khi đọc create_time
+        self._create_time: int = create_time
         self._avatar: str = avatar
         self._total_reply: int = total_reply
-        self._replies: List['Comment'] = replies
+        self._replies: List['Comment'] = replies if replies is not None else []
         self._likes: int = likes
     @property
     def comment_id(
         self: 'Comment'
     ) -> str:
         return self._comment_id
-    
+
     @property
     def username(
         self: 'Comment'
     ) -> str:
         return self._username
-    
+
     @property
     def nickname(
         self: 'Comment'
     ) -> str:
         return self._nickname
-    
+
     @property
     def comment(
         self: 'Comment'
     ) -> str:
         return self._comment
-    
+
     @property
     def create_time(
         self: 'Comment'
     ) -> str:
+        return datetime\
+            .fromtimestamp(
+                self._create_time
+            ).strftime("%Y-%m-%dT%H:%M:%S")
+
+    @property
+    def create_timestamp(
+        self: 'Comment'
+    ) -> int:
         return self._create_time
-    
+
     @property
     def avatar(
         self: 'Comment'
     ) -> str:
         return self._avatar
-    
+
     @property
     def likes(
         self: 'Comment'
     ) -> int:
         return self._likes
-    
+
     @property
     def total_reply(
         self: 'Comment'
     ) -> int:
         return self._total_reply
-    
+
     @property
     def replies(
         self: 'Comment'
     ) -> List['Comment']:
         return self._replies
-    
+
     @property
     def dict(
         self: 'Comment'
@@ -92,20 +112,20 @@ class Comment:
             'username': self._username,
             'nickname': self._nickname,
             'comment': self._comment,
-            'create_time': self._create_time,
+            'create_time': self.create_time,
             'avatar': self._avatar,
             'total_reply': self._total_reply,
             'likes': self._likes,
             'replies': [reply.dict for reply in self._replies]
         }
-    
+
     @property
     def json(
         self: 'Comment'
     ) -> str:
-        return json.dumps(self.json)
-    
+        return json.dumps(self.dict)
+
     def __str__(
         self: 'Comment'
     ) -> str:
-        return self.json
\ No newline at end of file
+        return self.json
@@ -5,6 +5,13 @@ from typing import List, Any, Dict
 from .comment import Comment
 
 class Comments:
+    __slots__ = (
+        '_caption',
+        '_video_url',
+        '_comments',
+        '_has_more'
+    )
+
     def __init__(
         self: 'Comments',
         caption: str,
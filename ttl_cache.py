@@ -0,0 +1,143 @@
+"""
+ttl_cache.py
+------------
+Cache trong process cho kết quả crawl đắt (vd: use-count của audio/hashtag):
+
+- TTL theo từng key (truyền số giây, hoặc hàm value -> số giây, vd: kết quả lỗi giữ ngắn hơn).
+- LRU: vượt `max_entries` thì bỏ key ít dùng nhất.
+- Single-flight: N request đồng thời cùng key chỉ chạy `compute` một lần, các request còn lại
+  chờ và dùng chung kết quả (hoặc chung exception).
+- Tuỳ chọn lưu ra file JSON (`path`) để cache còn sau khi restart; ghi atomically (tmp + rename).
+
+    cache = TTLCache(max_entries=1000, path="cache.json")
+    value = cache.get_or_compute("audio:123", lambda: crawl(...), ttl=600)
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Flight:
+    def __init__(self) -> None:
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TTLCache:
+    def __init__(self, max_entries: int = 1000, path: str | None = None) -> None:
+        self.max_entries = max_entries
+        self.path = path
+        self._data: "OrderedDict[str, tuple[float, object]]" = OrderedDict()  # key -> (hết hạn lúc, value)
+        self._flights: dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        if path:
+            self._load()
+
+    def get(self, key: str):
+        """Trả (True, value) nếu key còn hạn, ngược lại (False, None)."""
+        with self._lock:
+            return self._get_locked(key)
+
+    def _get_locked(self, key: str):
+        entry = self._data.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at <= time.time():
+            del self._data[key]
+            return False, None
+        self._data.move_to_end(key)
+        return True, value
+
+    def set(self, key: str, value, ttl: float) -> None:
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.time() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+        if self.path:
+            self._save()
+
+    def get_or_compute(self, key: str, compute, ttl):
+        """Lấy từ cache, hoặc chạy `compute()` (single-flight) rồi lưu với `ttl` (số hoặc hàm value -> số)."""
+        with self._lock:
+            hit, value = self._get_locked(key)
+            if hit:
+                self.hits += 1
+                return value
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = compute()
+            self.set(key, flight.value, ttl(flight.value) if callable(ttl) else ttl)
+            return flight.value
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.event.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "in_flight": len(self._flights),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "persisted": bool(self.path),
+            }
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print(f"[WARNING] không đọc được cache {self.path}: {e}")
+            return
+        now = time.time()
+        for key, expires_at, value in entries:
+            if expires_at > now:
+                self._data[key] = (expires_at, value)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def _save(self) -> None:
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        # Chụp snapshot trong _save_lock để bản ghi sau không bị bản cũ hơn ghi đè
+        with self._save_lock:
+            with self._lock:
+                entries = [[key, expires_at, value] for key, (expires_at, value) in self._data.items()]
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(entries, f, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                print(f"[WARNING] không ghi được cache {self.path}: {e}")
@@ -11,6 +11,7 @@ import subprocess
 from pathlib import Path
 import requests
 import json
+from result_channel import write_result
 
 
 
@@ -28,10 +29,9 @@ def download_video(url: str) -> Path:
     ]
     res = subprocess.run(cmd, capture_output=True, text=True)
     if res.returncode:
-        print(res.stderr)
-        sys.exit("yt-dlp thất bại")
+        raise RuntimeError(f"yt-dlp thất bại:\n{res.stderr}")
     if not out_path.exists():
-        sys.exit("Không tìm thấy file sau khi tải")
+        raise RuntimeError("Không tìm thấy file sau khi tải")
     return out_path
 
 def upload_gemini(file_path: Path, api_key: str) -> dict:
@@ -46,19 +46,23 @@ def upload_gemini(file_path: Path, api_key: str) -> dict:
     r.raise_for_status()
     return r.json()          # {'file': {...}}
 
+def download_and_upload(gemini_api_key: str, yt_url: str) -> dict:
+    video = download_video(yt_url)
+    try:
+        return upload_gemini(video, gemini_api_key)
+    finally:
+        if video.exists():
+            video.unlink(missing_ok=True)
+
 def main():
     if len(sys.argv) < 3:
         sys.exit("Cách dùng: python video2gemini_upload.py <gemini_api_key> <YouTube_URL>")
     gemini_api_key = sys.argv[1].strip()
     yt_url = sys.argv[2].strip()
-    video  = download_video(yt_url)
 
-    try:
-        upload_resp = upload_gemini(video, gemini_api_key)
+    upload_resp = download_and_upload(gemini_api_key, yt_url)
+    if not write_result(upload_resp):
         print(json.dumps(upload_resp, indent=2, ensure_ascii=False))
-    finally:
-        if video.exists():
-            video.unlink(missing_ok=True)
 
 if __name__ == "__main__":
     main()
@@ -5,184 +5,317 @@ import json
 import sys
 import os
 import re
-from fastapi.responses import Response
+import shutil
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 import tempfile
 from pathlib import Path
+from urllib.parse import urlsplit
 from pydantic import BaseModel, Field
 from typing import List, Literal, Optional
 
+import asyncio
+import threading
+import time
+import admission
+import get_meta_data_video
+import jobs
+import metrics
+import request_tracing
+import result_channel
+import ttl_cache
+import worker_pool
+
 app = FastAPI()
+# Bật METRICS_DIR trước khi copy env / spawn worker để mọi process con cùng ghi metrics về một chỗ
+metrics.setup_multiprocess()
 env = os.environ.copy()
 
 env["PYTHONIOENCODING"] = "utf-8"
 env["PYTHONUTF8"] = "1"
-        
-class VideoBody(BaseModel):
-    url: str
-    gemini_api_key: str
-    
-@app.middleware("http")
-async def log_request(request: Request, call_next):
-    body = await request.body()
-    print("📥 RAW request body:", body.decode("utf-8", errors="replace"))
-    response = await call_next(request)
-    return response
 
-@app.post("/video/upload")
-async def youtube_upload(body: VideoBody):
-    # Làm sạch URL khỏi dấu ; nếu có
-    clean_url = body.url.strip().rstrip(';')
-    gemini_api_key = body.gemini_api_key.strip()
-    # Đường dẫn tuyệt đối tới script (nếu cần)
-    script_path = "video2gemini_upload.py"  # hoặc /app/video2gemini_uploads.py nếu dùng Railway
 
-    cmd = ["python", script_path, gemini_api_key ,clean_url]
-    print("🔧 subprocess args:", cmd)
+@app.on_event("startup")
+def start_worker_pool():
+    # Spawn sẵn worker (đã import playwright/pandas/...) trước request đầu tiên
+    worker_pool.start()
+
 
+@app.on_event("shutdown")
+def stop_worker_pool():
+    worker_pool.shutdown()
+
+
+def run_in_worker(task: str, *args, timeout: int = 900, **kwargs):
+    """Chạy task trên worker pool, map lỗi sang HTTPException giống khi còn gọi subprocess."""
     try:
-        proc = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=900,
-            env=env
-        )
-    except subprocess.TimeoutExpired:
+        return worker_pool.run(task, *args, timeout=timeout, **kwargs)
+    except TimeoutError:
         raise HTTPException(status_code=504, detail="⏱️ Quá thời gian xử lý")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Lỗi khi chạy script:\n{e}")
 
-    if proc.returncode != 0:
-        raise HTTPException(
-            status_code=500,
-            detail=f"yt-dlp/Gemini error:\n{proc.stderr}"
-        )
 
-    # Tìm đoạn JSON trong stdout
-    import re
+async def run_in_worker_async(task: str, *args, timeout: int = 900, **kwargs):
     try:
-        json_text_match = re.search(r"{[\s\S]+}", proc.stdout)
-        if not json_text_match:
-            raise ValueError("Không tìm thấy đoạn JSON hợp lệ trong stdout")
-        json_text = json_text_match.group(0)
-        result_json = json.loads(json_text)
+        return await worker_pool.run_async(task, *args, timeout=timeout, **kwargs)
+    except TimeoutError:
+        raise HTTPException(status_code=504, detail="⏱️ Quá thời gian xử lý")
     except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Không parse được JSON từ script: {e}\nSTDOUT:\n{proc.stdout}"
-        )
+        raise HTTPException(status_code=500, detail=f"Lỗi khi chạy script:\n{e}")
 
-    return result_json
 
+STDERR_TAIL_BYTES = 20_000
 
-class ImageBody(BaseModel):
-    url: str
-    gemini_api_key: str
 
-@app.post("/image/upload")
-async def image_upload(body: ImageBody):
-    clean_url = body.url.strip().rstrip(';')
-    gemini_api_key = body.gemini_api_key.strip()
-    # Tùy theo vị trí file script
-    script_path = "image2gemini_upload.py"  # hoặc "/app/image2gemini_upload.py"
-    cmd = [sys.executable, script_path, gemini_api_key, clean_url]
-    print("🖼️ subprocess args:", cmd)
+def _stderr_tail(stderr) -> str:
+    # Chỉ lấy phần đuôi stderr (traceback) để trả về
+    stderr.seek(0, os.SEEK_END)
+    stderr.seek(max(0, stderr.tell() - STDERR_TAIL_BYTES))
+    return stderr.read().decode("utf-8", "replace")
+
+
+def _script_name(cmd: list[str]) -> str:
+    return os.path.basename(cmd[1] if len(cmd) > 1 else cmd[0])
+
 
+def run_script(cmd: list[str], timeout: int = 900, expect_result: bool = True, extra_env: Optional[dict] = None):
+    """Chạy script bằng subprocess, nhận kết quả qua result_channel (file RESULT_FILE tạm).
+
+    stdout của script đi thẳng ra log của server, stderr ghi ra file tạm và chỉ đọc
+    phần đuôi khi lỗi, nên log lớn bao nhiêu cũng không bị giữ trong bộ nhớ hay bị parse.
+    """
+    fd, result_path = tempfile.mkstemp(suffix=".result")
+    os.close(fd)
+    script_env = dict(env, **(extra_env or {}), **{result_channel.ENV_FILE: result_path})
     try:
-        proc = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=300,
-            env=os.environ  # hoặc bạn có thể tùy chỉnh biến môi trường ở đây
-        )
-    except subprocess.TimeoutExpired:
-        raise HTTPException(status_code=504, detail="⏱️ Xử lý quá thời gian")
+        with tempfile.TemporaryFile() as stderr:
+            start = time.perf_counter()
+            proc = subprocess.Popen(cmd, stderr=stderr, env=script_env)
+            metrics.observe("subprocess_spawn_seconds", time.perf_counter() - start, script=_script_name(cmd))
+            try:
+                proc.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+                raise HTTPException(status_code=504, detail="⏱️ Quá thời gian xử lý")
+            finally:
+                metrics.observe("subprocess_duration_seconds", time.perf_counter() - start, script=_script_name(cmd))
+            if proc.returncode != 0:
+                raise HTTPException(status_code=500, detail=f"Lỗi khi chạy script:\n{_stderr_tail(stderr)}")
+
+        if not expect_result:
+            return None
+        try:
+            return result_channel.read_result(result_path)
+        except (result_channel.ResultChannelError, ValueError) as e:
+            raise HTTPException(status_code=500, detail=f"Lỗi đọc kết quả từ script: {e}")
+    finally:
+        try:
+            os.unlink(result_path)
+        except OSError:
+            pass
 
-    if proc.returncode != 0:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Lỗi khi chạy script:\n{proc.stderr}"
-        )
 
+def iter_script_items(cmd: list[str], timeout: int = 900, extra_env: Optional[dict] = None, summary: Optional[dict] = None):
+    """Chạy script ở chế độ stream, yield payload JSON (bytes) của từng item ngay khi script write_item().
+
+    Kết quả đi qua một pipe (RESULT_FD) nên API không phải giữ toàn bộ kết quả trong bộ nhớ.
+    Generator bị đóng giữa chừng (client ngắt kết nối) thì script bị kill.
+    Frame kết quả cuối (dict) được update vào `summary` nếu truyền vào.
+    """
+    r, w = os.pipe()
+    script_env = dict(env, **(extra_env or {}), **{result_channel.ENV_FD: str(w), result_channel.ENV_STREAM: "1"})
+    stderr = tempfile.TemporaryFile()
+    start = time.perf_counter()
     try:
-        json_text_match = re.search(r"{[\s\S]+}", proc.stdout)
-        if not json_text_match:
-            raise ValueError("Không tìm thấy JSON hợp lệ trong stdout")
-        json_text = json_text_match.group(0)
-        result_json = json.loads(json_text)
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Lỗi parse JSON từ output: {e}\nSTDOUT:\n{proc.stdout}"
-        )
+        proc = subprocess.Popen(cmd, stderr=stderr, env=script_env, pass_fds=(w,))
+        metrics.observe("subprocess_spawn_seconds", time.perf_counter() - start, script=_script_name(cmd))
+    except BaseException:
+        os.close(r)
+        stderr.close()
+        raise
+    finally:
+        os.close(w)
+
+    timed_out = threading.Event()
+
+    def _kill():
+        timed_out.set()
+        proc.kill()
+
+    killer = threading.Timer(timeout, _kill)
+    killer.start()
+    try:
+        channel_error = None
+        with os.fdopen(r, "rb") as f:
+            try:
+                for kind, payload in result_channel.iter_frames(f):
+                    if kind == result_channel.ITEM:
+                        yield payload
+                    elif summary is not None:
+                        result = json.loads(payload)
+                        if isinstance(result, dict):
+                            summary.update(result)
+            except result_channel.ResultChannelError as e:
+                channel_error = e
+        proc.wait()
+        if timed_out.is_set():
+            raise HTTPException(status_code=504, detail="⏱️ Quá thời gian xử lý")
+        if proc.returncode != 0:
+            raise HTTPException(status_code=500, detail=f"Lỗi khi chạy script:\n{_stderr_tail(stderr)}")
+        if channel_error is not None:
+            raise HTTPException(status_code=500, detail=f"Lỗi đọc kết quả từ script: {channel_error}")
+    finally:
+        killer.cancel()
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        stderr.close()
+        metrics.observe("subprocess_duration_seconds", time.perf_counter() - start, script=_script_name(cmd))
 
-    return result_json
 
-from typing import List
+class VideoBody(BaseModel):
+    url: str
+    gemini_api_key: str
+    
+# Giới hạn đồng thời theo lớp tải (browser / render / light), đầy thì 429/503 + Retry-After
+app.add_middleware(admission.AdmissionMiddleware)
+# Trace method/path/size/status/latency (sampling, cắt body, che secret) ghi bất đồng bộ.
+# Middleware thêm sau nằm ngoài cùng => request bị admission từ chối vẫn được trace.
+app.add_middleware(request_tracing.TracingMiddleware)
 
+@app.post("/video/upload")
+async def youtube_upload(body: VideoBody):
+    # Làm sạch URL khỏi dấu ; nếu có
+    clean_url = body.url.strip().rstrip(';')
+    gemini_api_key = body.gemini_api_key.strip()
+    print("🔧 worker task: video_upload", clean_url)
 
-def load_all_json_data(folder_path="./storage/datasets/default") -> list[dict]:
-    data_list = []
+    return await run_in_worker_async("video_upload", gemini_api_key, clean_url, timeout=900)
 
-    for filename in os.listdir(folder_path):
-        if filename.endswith(".json") and filename != "__metadata__.json":
-            file_path = os.path.join(folder_path, filename)
-            try:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                    data_list.append(data)
-            except Exception as e:
-                print(f"Lỗi khi đọc file {filename}: {e}")
 
-    return data_list
+class ImageBody(BaseModel):
+    url: str
+    gemini_api_key: str
+
+@app.post("/image/upload")
+async def image_upload(body: ImageBody):
+    clean_url = body.url.strip().rstrip(';')
+    gemini_api_key = body.gemini_api_key.strip()
+    print("🖼️ worker task: image_upload", clean_url)
+
+    return await run_in_worker_async("image_upload", gemini_api_key, clean_url, timeout=300)
+
+from typing import List
 
 
 class TikTokBody(BaseModel):
-    url: str  # Danh sách các URL TikTok
+    url: str = ""  # Một hoặc nhiều URL TikTok, cách nhau bởi dấu cách
+    urls: List[str] = []  # Danh sách URL profile (crawl chung một lần, dùng chung concurrency)
     browser_type: str = "chromium"  # Mặc định là Firefox
     label: str = "newest"  # Nhãn mặc định
     max_items: int = 30  # Số lượng video tối đa mỗi trang
-    get_comments: str = "False"  # Mặc định không lấy bình luận
+    get_comments: str = "False"  # Video được enqueue có lấy bình luận không
     max_comments: int = 100  # Số lượng bình luận tối đa mỗi video
-
-@app.post("/tiktok/get_video_links_and_metadata")
-async def tiktok_get_video_links_and_metadata(body: TikTokBody):
+    enqueue_videos: bool = False  # newest/popular: crawl luôn metadata từng video trong cùng lần chạy
+    min_concurrency: int = 1  # Số page chạy song song tối thiểu
+    max_concurrency: int = 8  # Tối đa: tự tăng khi còn CPU/RAM, tự giảm khi CAPTCHA/timeout tăng
+    max_requests: int = 0  # Số request tối đa mỗi lần crawl (0 = tự tính theo số URL/video)
+
+# Trần cho max_concurrency mà client được phép xin
+CRAWL_CONCURRENCY_CAP = int(os.getenv("CRAWL_CONCURRENCY_CAP", "16"))
+
+def _profile_urls(body: TikTokBody) -> list[str]:
+    urls = [u.strip() for u in body.urls if u.strip()] + body.url.split()
+    if not urls:
+        raise HTTPException(status_code=400, detail="Cần ít nhất một URL (`url` hoặc `urls`)")
+    return list(dict.fromkeys(urls))
+
+def _validate_tiktok_body(body: TikTokBody) -> None:
+    # 400 ngay, trước khi header của stream được gửi / job được tạo
+    _profile_urls(body)
+    if not 1 <= body.min_concurrency <= body.max_concurrency <= CRAWL_CONCURRENCY_CAP:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Cần 1 ≤ min_concurrency ≤ max_concurrency ≤ {CRAWL_CONCURRENCY_CAP}",
+        )
+    if body.max_requests < 0:
+        raise HTTPException(status_code=400, detail="`max_requests` không được âm")
+
+def _video_links_env(body: TikTokBody, storage_dir: str) -> dict:
+    return {
+        "CRAWLEE_STORAGE_DIR": storage_dir,
+        "CRAWL_MIN_CONCURRENCY": str(body.min_concurrency),
+        "CRAWL_MAX_CONCURRENCY": str(body.max_concurrency),
+        "CRAWL_MAX_REQUESTS": str(body.max_requests),
+    }
+
+def _concurrency_headers(stats: Optional[dict]) -> dict:
+    if not stats:
+        return {}
+    return {
+        "X-Crawl-Concurrency": str(stats.get("final")),
+        "X-Crawl-Concurrency-Peak": str(stats.get("peak_active")),
+        "X-Crawl-Concurrency-Range": f"{stats.get('min')}-{stats.get('max')}",
+        "X-Crawl-Block-Rate": str(stats.get("block_rate")),
+    }
+
+def _video_links_timeout(body: TikTokBody) -> int:
+    # 900s cho mỗi profile như trước
+    return 900 * len(_profile_urls(body))
+
+def _video_links_cmd(body: TikTokBody) -> list[str]:
     label = body.label.strip().lower()
     browser_type = body.browser_type.strip().lower()
     max_comments = str(body.max_comments)
     # Nối các URL thành một chuỗi cách nhau bởi dấu cách
-    clean_url = body.url.strip()
+    clean_url = " ".join(_profile_urls(body))
     max_items = str(body.max_items).strip()
     script_path = "get_tiktok_video_links_and_metadata.py"
     get_comments = body.get_comments
-    cmd = [sys.executable, script_path, browser_type, label, max_items, get_comments, clean_url, max_comments]
+    enqueue_videos = "1" if body.enqueue_videos else "0"
+    cmd = [sys.executable, script_path, browser_type, label, max_items, get_comments, clean_url, max_comments, enqueue_videos]
     print(cmd)
+    return cmd
+
+def crawl_video_links(body: TikTokBody, job_id: Optional[str] = None) -> dict:
+    """Trả {"items": [...], "concurrency": thống kê concurrency của crawl}."""
+    # Mỗi crawl một thư mục storage riêng (theo job id) để crawl song song không lẫn dữ liệu;
+    # kết quả trả thẳng qua result_channel, storage bị xoá ngay khi crawl xong
+    storage_dir = tempfile.mkdtemp(prefix=f"crawlee_{job_id or 'req'}_")
     try:
-        proc = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=900,
-            encoding="utf-8",
-            env=env
-        )
-    except subprocess.TimeoutExpired:
-        raise HTTPException(status_code=504, detail="⏱️ Quá thời gian xử lý")
-    
-    if proc.returncode != 0:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Lỗi khi chạy script:\n{proc.stderr}"
+        return run_script(_video_links_cmd(body), timeout=_video_links_timeout(body), extra_env=_video_links_env(body, storage_dir))
+    finally:
+        shutil.rmtree(storage_dir, ignore_errors=True)
+
+def iter_video_links(body: TikTokBody, job_id: Optional[str] = None, summary: Optional[dict] = None):
+    """Như crawl_video_links nhưng yield từng item (JSON bytes) ngay khi crawler push_data."""
+    storage_dir = tempfile.mkdtemp(prefix=f"crawlee_{job_id or 'req'}_")
+    try:
+        yield from iter_script_items(
+            _video_links_cmd(body), timeout=_video_links_timeout(body),
+            extra_env=_video_links_env(body, storage_dir), summary=summary,
         )
-    
+    finally:
+        shutil.rmtree(storage_dir, ignore_errors=True)
+
+def stream_video_links(body: TikTokBody):
+    # Header 200 đã gửi đi nên lỗi giữa chừng được báo bằng một dòng {"error": ...} cuối stream
     try:
-        result = load_all_json_data()
+        for payload in iter_video_links(body):
+            yield payload + b"\n"
+    except HTTPException as e:
+        yield json.dumps({"error": e.detail}, ensure_ascii=False).encode("utf-8") + b"\n"
 
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Lỗi parse JSON từ output: {e}\n\n--- STDOUT ---\n{proc.stdout}"
-        )
-    return result
+@app.post("/tiktok/get_video_links_and_metadata")
+async def tiktok_get_video_links_and_metadata(body: TikTokBody, stream: bool = False):
+    _validate_tiktok_body(body)
+    if stream:
+        # NDJSON: mỗi dòng một item, gửi ngay khi crawler tạo ra
+        return StreamingResponse(stream_video_links(body), media_type="application/x-ndjson")
+    result = await asyncio.to_thread(crawl_video_links, body)
+    # Body giữ nguyên là list item; concurrency đã chọn đi qua header X-Crawl-*
+    return JSONResponse(result["items"], headers=_concurrency_headers(result.get("concurrency")))
 
 class TikTokCrawlAdsRequest(BaseModel):
     limit: str = '10'
@@ -190,90 +323,75 @@ class TikTokCrawlAdsRequest(BaseModel):
 @app.post("/tiktok/crawl_ads")
 def crawl_ads(body: TikTokCrawlAdsRequest):
     limit = body.limit
-    cmd = [sys.executable, "playwright_tiktok_ads.py", str(limit)]
-    try:
-        proc = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=900,
-            env=env,
-            encoding='utf-8'
-        )
-    except subprocess.TimeoutExpired:
-        raise HTTPException(status_code=504, detail="⏱️ Quá thời gian xử lý")
-    if proc.returncode != 0:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Lỗi khi chạy script:\n{proc.stderr}"
-        )
-        
-    try:
-        # Lấy phần output sau chữ "Result"
-        result_start = proc.stdout.find("Result:\n")
-        if result_start == -1:
-            raise ValueError("Không tìm thấy đoạn 'Result' trong stdout")
-
-        json_part = proc.stdout[result_start:]  # phần sau "Result"
-        # Tìm JSON mảng đầu tiên bắt đầu bằng [ và kết thúc bằng ]
-        json_match = re.search(r"\[\s*{[\s\S]*?}\s*\]", json_part)
-        
-        if not json_match:
-            raise ValueError("Không tìm thấy JSON hợp lệ trong stdout")
-
-        json_text = json_match.group(0).replace("\n", "")
-        result_json = json.loads(json_text)
-
-
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Lỗi parse JSON từ output: {e}\n\n--- STDOUT ---\n{proc.stdout}"
-        )
-    return result_json
+    return run_in_worker("crawl_ads", limit, timeout=900)
 
 class MetadataAdsRequest(BaseModel):
     urls: List[str]  # Danh sách các URL TikTok
     
 @app.post("/tiktok/get_metadata_ads")
 def get_metadata_ads():
-    cmd = [sys.executable, "get_meta_data_video.py"]
-    try:
-        proc = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=900,
-            env=env
-        )
-    except subprocess.TimeoutExpired:
-        raise HTTPException(status_code=504, detail="⏱️ Quá thời gian xử lý")
-    if proc.returncode != 0:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Lỗi khi chạy script:\n{proc.stderr}"
-        )
-    try:
-        # Lấy phần output sau chữ "Result"
-        result_start = proc.stdout.find("Result:\n")
-        if result_start == -1:
-            raise ValueError("Không tìm thấy đoạn 'Result' trong stdout")
-
-        json_part = proc.stdout[result_start:]  # phần sau "Result"
-        # Tìm JSON mảng đầu tiên bắt đầu bằng [ và kết thúc bằng ]
-        json_match = re.search(r"\[\s*{[\s\S]*?}\s*\]", json_part)
-        
-        if not json_match:
-            raise ValueError("Không tìm thấy JSON hợp lệ trong stdout")
-
-        json_text = json_match.group(0).replace("\n", "")
-        result_json = json.loads(json_text)
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Lỗi parse JSON từ output: {e}\n\n--- STDOUT ---\n{proc.stdout}"
-        )
-    return result_json
+    return run_in_worker("get_metadata_ads", timeout=900)
+
+# Số URL tối đa mỗi request get_metadata_videos
+METADATA_VIDEOS_MAX_URLS = int(os.getenv("METADATA_VIDEOS_MAX_URLS", "500"))
+
+class MetadataVideosRequest(BaseModel):
+    urls: List[str]  # Danh sách URL video TikTok
+    concurrency: int = get_meta_data_video.DEFAULT_CONCURRENCY  # Số request đồng thời
+    rate_per_host: Optional[float] = None  # Request/giây mỗi host; chỉ hạ được dưới trần METADATA_RATE_PER_HOST của server
+    retries: int = get_meta_data_video.DEFAULT_RETRIES  # Số lần retry mỗi video
+
+def _metadata_videos_args(body: MetadataVideosRequest):
+    urls = list(dict.fromkeys(u.strip() for u in body.urls if u.strip()))
+    if not urls:
+        raise HTTPException(status_code=400, detail="Cần ít nhất một URL trong `urls`")
+    if len(urls) > METADATA_VIDEOS_MAX_URLS:
+        raise HTTPException(status_code=400, detail=f"Tối đa {METADATA_VIDEOS_MAX_URLS} URL mỗi request")
+    if not 1 <= body.concurrency <= CRAWL_CONCURRENCY_CAP * 4:
+        raise HTTPException(status_code=400, detail=f"Cần 1 ≤ concurrency ≤ {CRAWL_CONCURRENCY_CAP * 4}")
+    if (body.rate_per_host is not None and body.rate_per_host <= 0) or not 0 <= body.retries <= 10:
+        raise HTTPException(status_code=400, detail="Cần rate_per_host > 0 và 0 ≤ retries ≤ 10")
+    return urls, {"concurrency": body.concurrency, "rate_per_host": body.rate_per_host, "retries": body.retries}
+
+async def stream_metadata_videos(urls: list[str], options: dict):
+    async for result in get_meta_data_video.iter_video_data(urls, **options):
+        yield json.dumps(result, ensure_ascii=False).encode("utf-8") + b"\n"
+
+@app.post("/tiktok/get_metadata_videos")
+async def get_metadata_videos(body: MetadataVideosRequest, stream: bool = False):
+    # Chỉ là HTTP (aiohttp) nên chạy thẳng trên event loop của API, không cần browser/worker.
+    # Mỗi phần tử là item metadata, hoặc {"video_url", "error"} nếu video đó lỗi sau khi retry.
+    urls, options = _metadata_videos_args(body)
+    if stream:
+        # NDJSON theo thứ tự video nào xong trước
+        return StreamingResponse(stream_metadata_videos(urls, options), media_type="application/x-ndjson")
+    return await get_meta_data_video.fetch_many_video_data(urls, **options)
+
+# Cache use-count: TTL theo key + LRU + single-flight (request trùng đồng thời chỉ crawl một lần).
+# USE_COUNT_CACHE_FILE (tuỳ chọn) để giữ cache qua các lần restart.
+USE_COUNT_CACHE_TTL = int(os.getenv("USE_COUNT_CACHE_TTL", "600"))
+USE_COUNT_CACHE_MISS_TTL = int(os.getenv("USE_COUNT_CACHE_MISS_TTL", "30"))  # không đọc được số: giữ ngắn
+use_count_cache = ttl_cache.TTLCache(
+    max_entries=int(os.getenv("USE_COUNT_CACHE_MAX", "5000")),
+    path=os.getenv("USE_COUNT_CACHE_FILE") or None,
+)
+
+
+def _use_count_ttl(result) -> int:
+    if isinstance(result, dict) and result.get("use_count") is not None:
+        return USE_COUNT_CACHE_TTL
+    return USE_COUNT_CACHE_MISS_TTL
+
+
+def _music_cache_key(url: str) -> str:
+    # .../music/ten-bai-7212345678901234567?lang=vi -> audio:7212345678901234567
+    parts = urlsplit(url.strip())
+    path = parts.path.rstrip("/")
+    music_id = re.search(r"(\d{6,})$", path)
+    if music_id:
+        return f"audio:{music_id.group(1)}"
+    return f"audio:{parts.netloc.lower()}{path}"
+
 
 class MusicUrl(BaseModel):
     urls: str  # Danh sách các URL TikTok
@@ -283,40 +401,11 @@ def get_audio_use_count(body: MusicUrl):
     url = body.urls.strip().rstrip(';')
     if not url:
         raise HTTPException(status_code=400, detail="URL không được để trống")
-    cmd = [sys.executable, "get_audio_use_count.py", url]
-    try:
-        proc = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=900,
-            env=env
-        )
-    except subprocess.TimeoutExpired:
-        raise HTTPException(status_code=504, detail="⏱️ Quá thời gian xử lý")
-    if proc.returncode != 0:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Lỗi khi chạy script:\n{proc.stderr}"
-        )
-    try:
-        # Lấy phần output sau chữ "Result"
-        result_start = proc.stdout.find("Result:\n")
-        if result_start == -1:
-            raise ValueError("Không tìm thấy đoạn 'Result' trong stdout")
-        json_part = proc.stdout[result_start:]  # phần sau "Result"
-        # Tìm JSON mảng đầu tiên bắt đầu bằng [ và kết thúc bằng ]
-        json_match = re.search(r"\{\s*[\s\S]*?\s*\}", json_part)
-        if not json_match:
-            raise ValueError("Không tìm thấy JSON hợp lệ trong stdout")
-        json_text = json_match.group(0).replace("\n", "")
-        result_json = json.loads(json_text)
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Lỗi parse JSON từ output: {e}\n\n--- STDOUT ---\n{proc.stdout}"
-        )
-    return result_json
+    return use_count_cache.get_or_compute(
+        _music_cache_key(url),
+        lambda: run_in_worker("get_audio_use_count", url, timeout=900),
+        ttl=_use_count_ttl,
+    )
 
 
 class Hashtag(BaseModel):
@@ -327,49 +416,17 @@ def get_hashtag_use_count(body: Hashtag):
     hashtag = body.hashtag.strip().rstrip(';')
     if not hashtag:
         raise HTTPException(status_code=400, detail="URL không được để trống")
-    cmd = [sys.executable, "get_hashtag_use_count.py", hashtag]
-    try:
-        proc = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=900,
-            env=env
-        )
-    except subprocess.TimeoutExpired:
-        raise HTTPException(status_code=504, detail="⏱️ Quá thời gian xử lý")
-    if proc.returncode != 0:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Lỗi khi chạy script:\n{proc.stderr}"
-        )
-    try:
-        # Lấy phần output sau chữ "Result"
-        result_start = proc.stdout.find("Result:\n")
-        if result_start == -1:
-            raise ValueError("Không tìm thấy đoạn 'Result' trong stdout")
-        json_part = proc.stdout[result_start:]  # phần sau "Result"
-        # Tìm JSON mảng đầu tiên bắt đầu bằng [ và kết thúc bằng ]
-        json_match = re.search(r"\{\s*[\s\S]*?\s*\}", json_part)
-        if not json_match:
-            raise ValueError("Không tìm thấy JSON hợp lệ trong stdout")
-        json_text = json_match.group(0).replace("\n", "")
-        result_json = json.loads(json_text)
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Lỗi parse JSON từ output: {e}\n\n--- STDOUT ---\n{proc.stdout}"
-        )
-    return result_json
+    return use_count_cache.get_or_compute(
+        f"hashtag:{hashtag.lstrip('#').lower()}",
+        lambda: run_in_worker("get_hashtag_use_count", hashtag, timeout=900),
+        ttl=_use_count_ttl,
+    )
 
 
+@app.get("/cache/use_count/stats")
+def get_use_count_cache_stats():
+    return use_count_cache.stats()
 
-import os
-import sys
-import json
-import re
-import subprocess
-from fastapi import HTTPException
 
 @app.post("/tiktok/crawl_audio")
 def crawl_ads(body: TikTokCrawlAdsRequest):
@@ -379,125 +436,19 @@ def crawl_ads(body: TikTokCrawlAdsRequest):
     except Exception:
         raise HTTPException(status_code=400, detail="`limit` phải là số nguyên")
 
-    # 2) Ép UTF-8 cho tiến trình con
-    base_env = os.environ.copy()
-    if 'env' in globals() and isinstance(env, dict):
-        base_env.update(env)
-    base_env.update({
-        "PYTHONUTF8": "1",
-        "PYTHONIOENCODING": "utf-8"
-    })
-
-    cmd = [sys.executable, "playwright_tiktok_audio.py", str(limit)]
-
-    try:
-        proc = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,               # chuyển bytes -> str
-            encoding="utf-8",        # QUAN TRỌNG: ép UTF-8
-            errors="replace",        # tránh UnicodeDecodeError
-            timeout=900,
-            env=base_env
-        )
-    except subprocess.TimeoutExpired:
-        raise HTTPException(status_code=504, detail="⏱️ Quá thời gian xử lý")
-
-    if proc.returncode != 0:
-        # Trả stderr đã là UTF-8 nên không vỡ ký tự
-        raise HTTPException(
-            status_code=500,
-            detail=f"Lỗi khi chạy script:\n{proc.stderr}"
-        )
-
-    # 3) Tìm mảng JSON đầu tiên trong stdout bằng cách đếm ngoặc
-    import json
-
-    def extract_first_json_array(text: str) -> str | None:
-        """
-        Tìm mảng JSON đầu tiên trong text bằng JSONDecoder.raw_decode.
-        Bỏ qua những đoạn như '[INFO]' vì không decode được thành JSON.
-        Trả về substring JSON (dạng chuỗi) nếu tìm thấy, ngược lại None.
-        """
-        decoder = json.JSONDecoder()
-
-        # Ưu tiên tìm sau 'Result:' để tránh log lặt vặt phía trước
-        start_pos = text.find("Result:")
-        search_text = text[start_pos:] if start_pos != -1 else text
-
-        for i, ch in enumerate(search_text):
-            if ch == '[':
-                try:
-                    obj, end = decoder.raw_decode(search_text[i:])  # decode từ vị trí '['
-                    if isinstance(obj, list):
-                        return search_text[i:i+end]  # cắt đúng lát JSON
-                except Exception:
-                    continue  # không hợp lệ -> thử '[' kế tiếp
-        return None
-
-    stdout = proc.stdout
-
-    json_text = extract_first_json_array(stdout)
-    if not json_text:
-        raise HTTPException(
-            status_code=500,
-            detail="Không tìm thấy mảng JSON hợp lệ trong stdout.\n--- STDOUT ---\n" + stdout
-        )
+    return run_in_worker("crawl_audio", limit, timeout=900)
 
-    try:
-        result_json = json.loads(json_text)
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Lỗi parse JSON: {e}\n--- JSON trích ra ---\n{json_text}\n--- STDOUT ---\n{stdout}"
-        )
 
-    return result_json
+def crawl_audio_job(job: jobs.Job, limit: int):
+    # Job nền cũng chiếm slot của lớp tải; hàng đợi không giới hạn vì số job đã bị job store giới hạn
+    with admission.CLASSES["browser"].slot(unbounded_queue=True):
+        return run_in_worker("crawl_audio", limit, timeout=900, on_event=job.on_event)
 
 
 @app.post("/tiktok/crawl_hashtag")
 def crawl_ads(body: TikTokCrawlAdsRequest):
     limit = body.limit
-    cmd = [sys.executable, "playwright_tiktok_hashtag.py", str(limit)]
-    try:
-        proc = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=900,
-            env=env
-        )
-    except subprocess.TimeoutExpired:
-        raise HTTPException(status_code=504, detail="⏱️ Quá thời gian xử lý")
-    if proc.returncode != 0:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Lỗi khi chạy script:\n{proc.stderr}"
-        )
-        
-    try:
-        # Lấy phần output sau chữ "Result"
-        result_start = proc.stdout.find("Result:\n")
-        if result_start == -1:
-            raise ValueError("Không tìm thấy đoạn 'Result' trong stdout")
-
-        json_part = proc.stdout[result_start:]  # phần sau "Result"
-        # Tìm JSON mảng đầu tiên bắt đầu bằng [ và kết thúc bằng ]
-        json_match = re.search(r"\[\s*{[\s\S]*?}\s*\]", json_part)
-        
-        if not json_match:
-            raise ValueError("Không tìm thấy JSON hợp lệ trong stdout")
-
-        json_text = json_match.group(0).replace("\n", "")
-        result_json = json.loads(json_text)
-
-
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Lỗi parse JSON từ output: {e}\n\n--- STDOUT ---\n{proc.stdout}"
-        )
-    return result_json
+    return run_in_worker("crawl_hashtag", limit, timeout=900)
 
 class TikTokCrawlCommentsRequest(BaseModel):
     url: str
@@ -508,47 +459,7 @@ class TikTokCrawlCommentsRequest(BaseModel):
 def crawl_ads(body: TikTokCrawlCommentsRequest):
     limit = body.limit
     url = body.url.strip().rstrip(';')
-    cmd = [sys.executable, "get_comments.py", url, str(limit)]
-    try:
-        proc = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=900,
-            encoding="utf-8",    # <- ép cha decode UTF-8
-            errors="replace",
-            env=env
-        )
-    except subprocess.TimeoutExpired:
-        raise HTTPException(status_code=504, detail="⏱️ Quá thời gian xử lý")
-    if proc.returncode != 0:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Lỗi khi chạy script:\n{proc.stderr}"
-        )
-        
-    try:
-        # Lấy phần output sau chữ "Result"
-        result_start = proc.stdout.find("Result:\n")
-        if result_start == -1:
-            raise ValueError("Không tìm thấy đoạn 'Result' trong stdout")
-
-        json_part = proc.stdout[result_start:]  # phần sau "Result"
-        # Tìm JSON mảng đầu tiên bắt đầu bằng [ và kết thúc bằng ]
-        json_match = re.search(r"\[\s*{[\s\S]*?}\s*\]", json_part)
-        
-        if not json_match:
-            raise ValueError("Không tìm thấy JSON hợp lệ trong stdout")
-
-        json_text = json_match.group(0).replace("\n", "")
-        result_json = json.loads(json_text)
-
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Lỗi parse JSON từ output: {e}\n\n--- STDOUT ---\n{proc.stdout}"
-        )
-    return result_json
+    return run_in_worker("get_comments", url, limit, timeout=900)
 
 class EasyCrawlRequest(BaseModel):
     url: str
@@ -559,26 +470,11 @@ def crawl_easy(body: EasyCrawlRequest):
     url = body.url
     type_output = body.type_output
     try:
-        result = subprocess.run(
-            [sys.executable, "get_html.py", url, type_output],
-            capture_output=True,
-            text=True,
-            check=True,
-            env=env,
-            encoding='utf-8'
-        )
-        matches = re.findall(r"\{.*\}", result.stdout, re.DOTALL)
-        json_str = matches[-1] if matches else None
-        if not json_str:
-            return {
-                "error": "Không tìm thấy JSON trong stdout",
-                "stdout": result.stdout
-            }
-        return json.loads(json_str)
-    except subprocess.CalledProcessError as e:
-        return {"error": "Script lỗi", "details": e.stderr}
+        return worker_pool.run("get_html", url, type_output, timeout=300)
+    except TimeoutError:
+        raise HTTPException(status_code=504, detail="⏱️ Quá thời gian xử lý")
     except Exception as e:
-        return {"error": "Lỗi không xác định", "details": str(e)}
+        return {"error": "Script lỗi", "details": str(e)}
 
 class TranscriptRequest(BaseModel):
     url: str
@@ -588,41 +484,7 @@ def get_transcript(body: TranscriptRequest):
     url = body.url.strip().rstrip(';')
     if not url:
         raise HTTPException(status_code=400, detail="URL không được để trống")
-    cmd = [sys.executable, "get_transcripts.py", url]
-    try:
-        proc = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=900,
-            env=env,
-            encoding='utf-8'
-        )
-    except subprocess.TimeoutExpired:
-        raise HTTPException(status_code=504, detail="⏱️ Quá thời gian xử lý")
-    if proc.returncode != 0:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Lỗi khi chạy script:\n{proc.stderr}"
-        )
-    try:
-        # Lấy phần output sau chữ "Result"
-        result_start = proc.stdout.find("Result:\n")
-        if result_start == -1:
-            raise ValueError("Không tìm thấy đoạn 'Result' trong stdout")
-        json_part = proc.stdout[result_start:]  # phần sau "Result"
-        # Tìm JSON mảng đầu tiên bắt đầu bằng { và kết thúc bằng }
-        json_match = re.search(r"\{\s*[\s\S]*?\s*\}", json_part)
-        if not json_match:
-            raise ValueError("Không tìm thấy JSON hợp lệ trong stdout")
-        json_text = json_match.group(0).replace("\n", "")
-        result_json = json.loads(json_text)
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Lỗi parse JSON từ output: {e}\n\n--- STDOUT ---\n{proc.stdout}"
-        )
-    return result_json
+    return run_in_worker("get_transcript", url, timeout=900)
 
 class DBURL(BaseModel):
     url: str
@@ -633,110 +495,7 @@ def get_pruned_groups(body: DBURL):
     url = body.url.strip().rstrip(';')
     if not url:
         raise HTTPException(status_code=400, detail="URL không được để trống")
-    cmd = [sys.executable, "groups_pruned.py", "--db-url", url]
-    try:
-        proc = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=900,
-            env=env,
-            encoding='utf-8'
-        )
-    except subprocess.TimeoutExpired:
-        raise HTTPException(status_code=504, detail="⏱️ Quá thời gian xử lý")
-    if proc.returncode != 0:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Lỗi khi chạy script:\n{proc.stderr}"
-        )
-    def _extract_first_json_array(s: str) -> str | None:
-        # Tìm và cắt mảng JSON đầu tiên bằng đếm ngoặc an toàn với chuỗi/escape
-        start = s.find('[')
-        if start == -1:
-            return None
-        depth = 0
-        in_str = False
-        esc = False
-        for i in range(start, len(s)):
-            ch = s[i]
-            if in_str:
-                if esc:
-                    esc = False
-                elif ch == '\\':
-                    esc = True
-                elif ch == '"':
-                    in_str = False
-            else:
-                if ch == '"':
-                    in_str = True
-                elif ch == '[':
-                    depth += 1
-                elif ch == ']':
-                    depth -= 1
-                    if depth == 0:
-                        return s[start:i+1]
-        return None
-
-    def parse_stdout_to_json(stdout: str):
-        # 1) Thử parse trực tiếp (trường hợp script in JSON thuần)
-        try:
-            return json.loads(stdout)
-        except json.JSONDecodeError:
-            pass
-
-        # 2) Tìm JSON đầu tiên bất kỳ ({...} hoặc [...]) bằng raw_decode
-        dec = json.JSONDecoder()
-        for i, ch in enumerate(stdout):
-            if ch in '[{':
-                try:
-                    obj, end = dec.raw_decode(stdout[i:])
-                    return obj
-                except json.JSONDecodeError:
-                    continue
-
-        # 3) Trường hợp biết producer in RA MỘT MẢNG [...]: dùng match ngoặc
-        arr = _extract_first_json_array(stdout)
-        if arr is not None:
-            return json.loads(arr)
-
-        # 4) Fallback: NDJSON (mỗi dòng là 1 JSON object)
-        items = []
-        for line in stdout.splitlines():
-            line = line.strip()
-            if not line or line[0] not in '{[':
-                continue
-            try:
-                items.append(json.loads(line))
-            except Exception:
-                pass
-        if items:
-            return items
-
-        raise ValueError("Không tìm thấy JSON hợp lệ trong stdout")
-
-    # ===== Chỗ gọi trong FastAPI =====
-    proc = subprocess.run(
-        cmd,
-        capture_output=True,
-        text=True,
-        timeout=900,
-        env=env,
-        encoding='utf-8'
-    )
-
-    if proc.returncode != 0:
-        raise HTTPException(status_code=500, detail=f"Script error: {proc.stderr}")
-
-    try:
-        result_json = parse_stdout_to_json(proc.stdout)
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Lỗi parse JSON từ output: {e}\n\n--- STDOUT ---\n{proc.stdout}"
-        )
-
-    return result_json
+    return run_in_worker("get_pruned_groups", url, timeout=900)
 
 
 class PosterRequest(BaseModel):
@@ -756,6 +515,20 @@ def generate_poster(body: PosterRequest):
     if not body.images:
         raise HTTPException(status_code=400, detail="Thiếu danh sách ảnh")
 
+    # Script mặc định: render trên worker bằng browser warm của browser_pool
+    if body.script_path == "poster_generator.py":
+        data = run_in_worker(
+            "render_poster", body.images, body.text,
+            fmt=body.fmt, quality=body.quality, scale=int(body.scale), wait=body.wait,
+            timeout=900,
+        )
+        img_ext = "jpg" if body.fmt == "jpeg" else "png"
+        headers = {
+            "Content-Disposition": f'inline; filename="poster.{img_ext}"'
+        }
+        return Response(content=data, media_type="application/octet-stream", headers=headers)
+
+    # Script tuỳ chỉnh: vẫn chạy subprocess như cũ
     # Thư mục tạm để chứa html + ảnh => auto cleanup khi ra khỏi with
     with tempfile.TemporaryDirectory() as tmpdir:
         tmpdir_path = Path(tmpdir)
@@ -776,20 +549,8 @@ def generate_poster(body: PosterRequest):
         # Ở đây script đã có --scale/--wait nên ta truyền luôn:
         cmd += ["--scale", str(int(body.scale)), "--wait", body.wait]
 
-        try:
-            proc = subprocess.run(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                timeout=900,
-                encoding="utf-8",
-            )
-        except subprocess.TimeoutExpired:
-            raise HTTPException(status_code=504, detail="⏱️ Quá thời gian xử lý")
-
-        if proc.returncode != 0:
-            err = proc.stderr.decode("utf-8", "replace")  # chỉ để hiển thị lỗi
-            raise HTTPException(status_code=500, detail=f"Script error:\n{err}")
+        # Script tuỳ chỉnh không bắt buộc ghi kết quả: đầu ra là file ảnh
+        run_script(cmd, timeout=900, expect_result=False)
 
         if not img_path.exists():
             # fallback: đôi khi người dùng truyền sai fmt, thử dò file còn lại
@@ -812,6 +573,22 @@ def generate_poster(body: PosterRequest):
         return Response(content=data, media_type="application/octet-stream", headers=headers)
     
     
+@app.get("/browser_pool/stats")
+def get_browser_pool_stats():
+    return worker_pool.browser_pool_stats()
+
+
+@app.get("/admission/stats")
+def get_admission_stats():
+    return admission.stats()
+
+
+@app.get("/metrics")
+def get_metrics():
+    # Prometheus text format, đã cộng dồn số liệu của API, worker và các script subprocess
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 class MakeVideoRequest(BaseModel):
     transcripts: List[str]
     wav_urls: List[str]
@@ -820,45 +597,106 @@ class MakeVideoRequest(BaseModel):
     show_script: bool = False
     
     
-import shutil
 from fastapi import BackgroundTasks
-def delete_resource(script_dir='./script', audio_dir='./audio', image_dir='./image'):
-    shutil.rmtree(script_dir)
-    shutil.rmtree(audio_dir)
-    shutil.rmtree(image_dir)
-
 from fastapi.responses import FileResponse
 
-@app.post("/generate-video")
-def generate_video(body: MakeVideoRequest):
-    transcripts = body.transcripts
-    wav_urls = body.wav_urls
-    image_urls = body.image_urls
-    show_script = body.show_script
-    fps = body.fps
+def render_video(body: MakeVideoRequest) -> str:
+    """Render video trong thư mục tạm riêng, trả về đường dẫn file mp4 (người gọi tự xoá)."""
+    work_dir = tempfile.mkdtemp(prefix="video_")
     # Pass arguments as JSON strings to the script
     cmd = [
         sys.executable,
         "make_video_from_image.py",
-        json.dumps(transcripts, ensure_ascii=False),
-        json.dumps(wav_urls, ensure_ascii=False),
-        json.dumps(image_urls, ensure_ascii=False),
-        str(fps),
-        str(show_script)
+        json.dumps(body.transcripts, ensure_ascii=False),
+        json.dumps(body.wav_urls, ensure_ascii=False),
+        json.dumps(body.image_urls, ensure_ascii=False),
+        str(body.fps),
+        str(body.show_script),
+        work_dir,
     ]
-    proc = subprocess.run(
-        cmd,
-        capture_output=True,
-        text=True,
-        timeout=9000,
-        env=env,
-        encoding='utf-8'
-    )
-    if proc.returncode != 0:
-        raise HTTPException(status_code=500, detail=f"Script error: {proc.stderr}")
-    video_path = './audio/my_video.mp4'
+    try:
+        result = run_script(cmd, timeout=9000)
+
+        fd, video_path = tempfile.mkstemp(suffix=".mp4")
+        os.close(fd)
+        shutil.move(result["video_path"], video_path)
+        return video_path
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+@app.post("/generate-video")
+def generate_video(body: MakeVideoRequest, background_tasks: BackgroundTasks):
+    video_path = render_video(body)
+    background_tasks.add_task(os.unlink, video_path)
     return FileResponse(path=video_path, media_type="video/mp4", filename="video.mp4")
 
+
+# ===== Job bất đồng bộ: POST trả job_id ngay, GET /jobs/{id} để poll =====
+def submit_job(kind: str, func, *args) -> dict:
+    try:
+        job = jobs.submit(kind, func, *args)
+    except jobs.JobStoreFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"job_id": job.id, "state": job.state, "status_url": f"/jobs/{job.id}"}
+
+def video_links_job(job: jobs.Job, body: TikTokBody):
+    # Item về tới đâu hiện trong partial_results tới đó
+    items = []
+    summary = {}
+    with admission.CLASSES["browser"].slot(unbounded_queue=True):
+        for payload in iter_video_links(body, job_id=job.id, summary=summary):
+            item = json.loads(payload)
+            items.append(item)
+            job.add_partial(item)
+            job.set_progress(items=len(items))
+    job.set_progress(concurrency=summary.get("concurrency"))
+    return items
+
+def render_video_job(job: jobs.Job, body: MakeVideoRequest):
+    job.set_progress(stage="waiting")
+    with admission.CLASSES["render"].slot(unbounded_queue=True):
+        job.set_progress(stage="rendering")
+        job.result_file = render_video(body)
+    job.set_progress(stage="done")
+    return None
+
+@app.post("/jobs/tiktok/get_video_links_and_metadata", status_code=202)
+def submit_video_links_job(body: TikTokBody):
+    _validate_tiktok_body(body)
+    return submit_job("get_video_links_and_metadata", video_links_job, body)
+
+@app.post("/jobs/tiktok/crawl_audio", status_code=202)
+def submit_crawl_audio_job(body: TikTokCrawlAdsRequest):
+    try:
+        limit = int(body.limit)
+    except Exception:
+        raise HTTPException(status_code=400, detail="`limit` phải là số nguyên")
+    return submit_job("crawl_audio", crawl_audio_job, limit)
+
+@app.post("/jobs/generate-video", status_code=202)
+def submit_generate_video_job(body: MakeVideoRequest):
+    return submit_job("generate_video", render_video_job, body)
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = jobs.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy job (sai id hoặc đã hết hạn)")
+    return job.to_dict()
+
+@app.get("/jobs/{job_id}/result")
+def get_job_result(job_id: str):
+    job = jobs.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy job (sai id hoặc đã hết hạn)")
+    if job.state == jobs.FAILED:
+        raise HTTPException(status_code=500, detail=job.error)
+    if job.state != jobs.SUCCEEDED:
+        raise HTTPException(status_code=409, detail=f"Job chưa xong (state={job.state})")
+    if job.result_file:
+        return FileResponse(path=job.result_file, media_type="video/mp4", filename="video.mp4")
+    return job.result
+
 class GetBatchJobContentGemini(BaseModel):
     job_name: str
     gemini_api: str
@@ -894,15 +732,48 @@ def get_batch_job_content_gemini(body: GetBatchJobContentGemini):
     
 class GetCommentTikTok(BaseModel):
     id: str
-    
-from tiktok_comment_scrapper import get_comments
+    concurrency: int = 8  # Số request API comment/reply chạy song song
+    max_comments: Optional[int] = None  # Số comment cấp 1 tối đa (None = tất cả)
+    max_replies_per_comment: Optional[int] = None  # Số reply tối đa mỗi comment (None = tất cả)
+    include_replies: bool = True  # False = bỏ qua reply (nhanh hơn nhiều với video viral)
+    time_budget: Optional[float] = None  # Số giây tối đa (None = không giới hạn); hết giờ thì trả phần đã lấy, has_more = 1
+
+from tiktok_comment_scrapper import get_comments_async, iter_comments_async
+
+def _comment_limits(body: GetCommentTikTok) -> dict:
+    if not 1 <= body.concurrency <= CRAWL_CONCURRENCY_CAP * 4:
+        raise HTTPException(status_code=400, detail=f"Cần 1 ≤ concurrency ≤ {CRAWL_CONCURRENCY_CAP * 4}")
+    for name in ("max_comments", "max_replies_per_comment", "time_budget"):
+        value = getattr(body, name)
+        if value is not None and value < 0:
+            raise HTTPException(status_code=400, detail=f"`{name}` không được âm")
+    return {
+        "max_comments": body.max_comments,
+        "max_replies_per_comment": body.max_replies_per_comment,
+        "include_replies": body.include_replies,
+        "time_budget": body.time_budget,
+    }
+
+async def stream_comments(body: GetCommentTikTok, limits: dict):
+    # Header 200 đã gửi đi: dòng cuối là {"caption", "video_url", "has_more"} hoặc {"error": ...}
+    meta = {}
+    try:
+        async for comment in iter_comments_async(str(body.id), body.concurrency, meta=meta, **limits):
+            yield json.dumps(comment, ensure_ascii=False).encode("utf-8") + b"\n"
+        yield json.dumps(meta, ensure_ascii=False).encode("utf-8") + b"\n"
+    except Exception as e:
+        yield json.dumps({"error": f"Lỗi khi lấy bình luận: {e}"}, ensure_ascii=False).encode("utf-8") + b"\n"
 
 @app.post("/tiktok/get_comments_v2")
-def get_comments_v2(body: GetCommentTikTok):
+async def get_comments_v2(body: GetCommentTikTok, stream: bool = False):
     id = str(body.id)
-    
+    limits = _comment_limits(body)
+    if stream:
+        # NDJSON: mỗi dòng một comment cấp 1 (kèm replies) ngay khi lấy xong
+        return StreamingResponse(stream_comments(body, limits), media_type="application/x-ndjson")
+
     try:
-        comments = get_comments(id)
+        comments = await get_comments_async(id, concurrency=body.concurrency, **limits)
         return comments
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi khi lấy bình luận: {e}")
@@ -0,0 +1,79 @@
+"""
+video_http.py
+-------------
+Đọc JSON __UNIVERSAL_DATA_FOR_REHYDRATION__ của trang video TikTok bằng HTTP thường (aiohttp,
+dùng chung một connection pool) thay vì mở page Playwright. Đủ cho metadata; comment vẫn cần browser.
+
+Khi không đọc được, trả kèm lý do để caller chuyển sang Playwright:
+  status   HTTP != 200
+  shell    HTML không có script rehydration (trang captcha / shell rỗng)
+  empty    có JSON nhưng không có itemStruct (video bị ẩn / chặn theo vùng)
+  error    lỗi mạng, timeout hoặc JSON hỏng
+
+Phần tách JSON khỏi HTML nằm ở rehydration.py.
+
+Cấu hình qua biến môi trường:
+  VIDEO_HTTP_FIRST         "0" để luôn dùng Playwright (mặc định: "1")
+  VIDEO_HTTP_CONCURRENCY   số connection HTTP đồng thời (mặc định: 8)
+  VIDEO_HTTP_TIMEOUT       timeout mỗi request, giây (mặc định: 15)
+"""
+
+import asyncio
+import os
+
+import aiohttp
+
+import metrics
+from rehydration import extract_item_struct
+
+ENABLED = os.getenv("VIDEO_HTTP_FIRST", "1") != "0"
+CONCURRENCY = int(os.getenv("VIDEO_HTTP_CONCURRENCY", "8"))
+TIMEOUT = float(os.getenv("VIDEO_HTTP_TIMEOUT", "15"))
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9,vi;q=0.8",
+}
+
+_session = None
+
+
+def _get_session() -> aiohttp.ClientSession:
+    # Một session cho cả lần crawl: giữ keep-alive + cookie giữa các request
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            headers=HEADERS,
+            timeout=aiohttp.ClientTimeout(total=TIMEOUT),
+            connector=aiohttp.TCPConnector(limit=CONCURRENCY, ttl_dns_cache=300),
+        )
+    return _session
+
+
+async def close() -> None:
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+async def fetch_item_struct(url: str):
+    """GET trang video và lấy itemStruct. Trả (item_struct, None) hoặc (None, lý do)."""
+    try:
+        async with _get_session().get(url) as resp:
+            if resp.status != 200:
+                result = None, "status"
+            else:
+                # Tìm script rehydration ngay trên bytes, không decode cả trang
+                result = extract_item_struct(await resp.read())
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        result = None, "error"
+    metrics.inc("video_http_fetch_total", outcome=result[1] or "ok")
+    return result
+
+
+async def fetch_many(urls: list[str]) -> list[tuple]:
+    """Lấy song song (giới hạn bởi connection pool); trả [(url, item_struct | None, lý do), ...] theo thứ tự urls."""
+    results = await asyncio.gather(*(fetch_item_struct(url) for url in urls))
+    return [(url, item_struct, reason) for url, (item_struct, reason) in zip(urls, results)]
@@ -0,0 +1,358 @@
+"""
+worker_pool.py
+--------------
+Pool tiến trình sống lâu cho FastAPI. Mỗi worker import sẵn các script
+(playwright, pandas, sqlalchemy, ...) một lần lúc khởi động, sau đó nhận job
+dạng "tên task + tham số" thay vì spawn `python script.py` cho từng request.
+
+Job quá `timeout` mà đã chạy trên worker thì worker đó bị kill (SIGKILL) và pool được tạo lại,
+giống như subprocess.run(timeout=...) trước đây kill script bị treo. Kill một worker làm
+ProcessPoolExecutor hỏng cả pool; các job khác đang chạy/xếp hàng trên pool cũ không bị lỗi
+theo mà được gửi lại lên pool mới (chạy lại từ đầu, tối đa MAX_RESUBMITS lần; job có
+on_event nhận sự kiện "restart" trước khi chạy lại).
+
+Cấu hình qua biến môi trường:
+  WORKER_POOL_SIZE   số worker chạy song song (mặc định: 2)
+  WORKER_MAX_TASKS   số job mỗi worker chạy trước khi bị thay bằng worker mới (mặc định: 20)
+
+Mỗi worker cũng boot sẵn browser của browser_pool (xem browser_pool.py).
+"""
+
+import asyncio
+import importlib
+import multiprocessing
+import os
+import signal
+import threading
+import time
+import uuid
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import metrics
+
+POOL_SIZE = int(os.getenv("WORKER_POOL_SIZE", "2"))
+MAX_TASKS_PER_WORKER = int(os.getenv("WORKER_MAX_TASKS", "20"))
+# Số lần một job được gửi lại khi pool của nó bị bỏ vì job khác bị kill
+MAX_RESUBMITS = 2
+
+# Tên task -> (module, hàm). Worker import sẵn toàn bộ các module này khi khởi động.
+TASKS = {
+    "crawl_ads": ("playwright_tiktok_ads", "crawl_trending_videos"),
+    "crawl_audio": ("playwright_tiktok_audio", "crawl_and_save_trending_audio"),
+    "crawl_hashtag": ("playwright_tiktok_hashtag", "crawl_and_save_trending_hashtags"),
+    "get_audio_use_count": ("get_audio_use_count", "get_audio_use_count"),
+    "get_hashtag_use_count": ("get_hashtag_use_count", "get_hashtag_use_count"),
+    "get_comments": ("get_comments", "get_comments"),
+    "get_metadata_ads": ("get_meta_data_video", "fetch_all_video_data"),
+    "get_transcript": ("get_transcripts", "get_transcript"),
+    "get_pruned_groups": ("groups_pruned", "get_pruned_groups"),
+    "get_html": ("get_html", "get_html"),
+    "video_upload": ("video2gemini_upload", "download_and_upload"),
+    "image_upload": ("image2gemini_upload", "download_and_upload"),
+    "render_poster": ("poster_generator", "render_poster"),
+}
+
+_pool = None
+_manager = None
+_browser_stats = None  # Manager().dict(): pid worker -> browser_pool.stats()
+_running = None  # Manager().dict(): token job -> pid worker đang chạy (0 = đã bị huỷ trước khi chạy)
+_lock = threading.Lock()
+
+# Queue sự kiện của job đang chạy trên worker hiện tại (mỗi worker chạy 1 job tại một thời điểm)
+_events = None
+
+
+def _init_worker(browser_stats=None, running=None):
+    global _running
+    _running = running
+    start = time.perf_counter()
+    # Import trước để request đầu tiên không phải trả giá import playwright/pandas/...
+    for module_name, _ in TASKS.values():
+        try:
+            importlib.import_module(module_name)
+        except Exception as e:
+            print(f"[WARNING] worker {os.getpid()}: không import được {module_name}: {e}")
+
+    # Boot sẵn Chromium; lỗi ở đây không được làm hỏng cả pool
+    try:
+        import browser_pool
+        if browser_stats is not None:
+            browser_pool.set_stats_sink(browser_stats)
+        browser_pool.warm()
+    except Exception as e:
+        print(f"[WARNING] worker {os.getpid()}: không warm được browser pool: {e}")
+    metrics.observe("worker_init_seconds", time.perf_counter() - start)
+    metrics.flush()
+
+
+def _run_task(task, args, kwargs, events=None, submitted_at=None, token=None):
+    global _events
+    if token is not None and _running is not None:
+        # Báo pid cho API process để nó kill được worker khi job quá timeout.
+        # setdefault là nguyên tử trên Manager: API đã đặt tombstone 0 thì job không chạy nữa.
+        if _running.setdefault(token, os.getpid()) != os.getpid():
+            _running.pop(token, None)
+            raise TimeoutError(f"Task {task} đã bị huỷ do quá timeout trước khi chạy")
+    if submitted_at is not None:
+        metrics.observe("worker_queue_seconds", max(0.0, time.time() - submitted_at), task=task)
+    _events = events
+    try:
+        module_name, func_name = TASKS[task]
+        func = getattr(importlib.import_module(module_name), func_name)
+        with metrics.timer("worker_task_seconds", task=task):
+            return func(*args, **kwargs)
+    finally:
+        _events = None
+        if token is not None and _running is not None:
+            _running.pop(token, None)
+        # Worker có thể bị thay (max_tasks_per_child) mà không chạy atexit: ghi metrics sau mỗi task
+        metrics.flush()
+
+
+def emit(kind: str, payload=None) -> None:
+    """Gửi sự kiện (tiến độ, item tạm...) từ script về API process.
+
+    Không làm gì khi script chạy CLI hoặc job không đăng ký `on_event`.
+    """
+    if _events is None:
+        return
+    try:
+        _events.put((kind, payload))
+    except Exception as e:
+        print(f"[WARNING] emit {kind} thất bại: {e}")
+
+
+def _ping():
+    return os.getpid()
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool, _browser_stats, _running
+    manager = _get_manager()
+    with _lock:
+        if _pool is None:
+            if _browser_stats is None:
+                _browser_stats = manager.dict()
+            if _running is None:
+                _running = manager.dict()
+            # max_tasks_per_child không dùng được với "fork" -> dùng "spawn"
+            _pool = ProcessPoolExecutor(
+                max_workers=POOL_SIZE,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(_browser_stats, _running),
+                max_tasks_per_child=MAX_TASKS_PER_WORKER,
+            )
+        return _pool
+
+
+def start() -> None:
+    """Tạo pool và spawn đủ POOL_SIZE worker ngay (không chờ import xong)."""
+    pool = get_pool()
+    for _ in range(POOL_SIZE):
+        pool.submit(_ping)
+
+
+def _get_manager():
+    global _manager
+    with _lock:
+        if _manager is None:
+            _manager = multiprocessing.get_context("spawn").Manager()
+        return _manager
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+        return True
+    except OSError:
+        return False
+
+
+def browser_pool_stats() -> dict:
+    """Tổng hợp mức sử dụng browser pool của mọi worker còn sống."""
+    if _browser_stats is None:
+        return {"workers": [], "browsers": 0, "in_use": 0, "pages_served": 0}
+    workers = [st for pid, st in _browser_stats.items() if _alive(pid)]
+    browsers = sum(w["browsers"] for w in workers)
+    in_use = sum(w["in_use"] for w in workers)
+    return {
+        "workers": workers,
+        "browsers": browsers,
+        "in_use": in_use,
+        "utilisation": round(in_use / browsers, 3) if browsers else 0.0,
+        "pages_served": sum(w["pages_served"] for w in workers),
+        "launches": sum(w["launches"] for w in workers),
+        "recycles": sum(w["recycles"] for w in workers),
+    }
+
+
+def shutdown() -> None:
+    global _pool, _manager, _browser_stats, _running
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+        _browser_stats = None
+        _running = None
+        if _manager is not None:
+            _manager.shutdown()
+            _manager = None
+
+
+def _drain_events(events, on_event) -> None:
+    while True:
+        item = events.get()
+        if item is None:
+            return
+        try:
+            on_event(*item)
+        except Exception as e:
+            print(f"[WARNING] on_event lỗi: {e}")
+
+
+def submit(task: str, *args, on_event=None, **kwargs):
+    """Gửi task lên pool, trả về concurrent.futures.Future.
+
+    `on_event(kind, payload)` (tuỳ chọn) được gọi trong API process cho mỗi `emit()` của script.
+    Future trả về không gắn với một pool cụ thể: pool bị bỏ vì job khác bị kill thì job
+    được gửi lại lên pool mới (xem _dispatch / _settle).
+    """
+    if task not in TASKS:
+        raise KeyError(f"Task không tồn tại: {task}")
+    fut = Future()
+    fut.worker_task = task
+    fut.worker_call = (args, kwargs)
+    fut.worker_events = None
+    fut.worker_killed = False
+    fut.worker_attempts = 0
+    if on_event is not None:
+        events = _get_manager().Queue()
+        threading.Thread(target=_drain_events, args=(events, on_event), daemon=True).start()
+        fut.worker_events = events
+        # emit() là RPC đồng bộ nên mọi sự kiện đã nằm trong queue trước khi future xong;
+        # sentinel đặt ở đây để thread drain luôn thoát, kể cả khi job bị huỷ / worker chết.
+        fut.add_done_callback(lambda _: events.put(None))
+    # Caller huỷ (vd: asyncio.wait_for hết giờ) -> huỷ luôn job đang xếp hàng trên pool
+    fut.add_done_callback(lambda f: f.cancelled() and f.worker_inner.cancel())
+    _dispatch(fut)
+    return fut
+
+
+def _dispatch(fut) -> None:
+    """Gửi job của `fut` lên pool hiện tại (token mới mỗi lần gửi)."""
+    args, kwargs = fut.worker_call
+    fut.worker_token = uuid.uuid4().hex
+    fut.worker_attempts += 1
+    call = (_run_task, fut.worker_task, args, kwargs, fut.worker_events, time.time(), fut.worker_token)
+    pool = get_pool()
+    try:
+        inner = pool.submit(*call)
+    except BrokenProcessPool:
+        # Worker chết ngoài kill() (OOM, segfault, ...): thay pool hỏng rồi gửi lại
+        _replace_pool(pool)
+        pool = get_pool()
+        inner = pool.submit(*call)
+    fut.worker_pool = pool
+    fut.worker_inner = inner
+    inner.add_done_callback(lambda inner: _settle(fut, inner))
+
+
+def _settle(fut, inner) -> None:
+    """Chuyển kết quả của lần chạy trên pool sang `fut`, hoặc gửi lại nếu pool bị bỏ vì job khác."""
+    if fut.done() or inner is not fut.worker_inner:
+        return
+    error = None if inner.cancelled() else inner.exception()
+    broken = inner.cancelled() or isinstance(error, BrokenProcessPool)
+    if broken and _running is not None:
+        # Executor hỏng terminate mọi worker của pool cũ: worker không kịp tự xoá token
+        _running.pop(fut.worker_token, None)
+    if broken and not fut.worker_killed and fut.worker_attempts <= MAX_RESUBMITS:
+        print(f"[WARNING] pool bị tạo lại, gửi lại task {fut.worker_task} (lần {fut.worker_attempts})")
+        metrics.inc("worker_resubmitted_total", task=fut.worker_task)
+        if fut.worker_events is not None:
+            fut.worker_events.put(("restart", None))
+        try:
+            _dispatch(fut)
+            return
+        except Exception as e:
+            error = e
+    if not fut.set_running_or_notify_cancel():
+        return
+    if inner.cancelled() and error is None:
+        error = CancelledError()
+    if error is None:
+        fut.set_result(inner.result())
+    else:
+        fut.set_exception(error)
+
+
+def _replace_pool(pool) -> None:
+    """Bỏ `pool` nếu nó vẫn là pool hiện tại; pool mới được tạo và warm ngay."""
+    global _pool
+    with _lock:
+        if _pool is not pool:
+            return
+        _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+    start()
+
+
+def kill(fut) -> None:
+    """Dừng hẳn job của `fut`: chưa chạy thì huỷ, đang chạy thì kill worker và tạo lại pool."""
+    fut.worker_killed = True
+    if fut.worker_inner.cancel() or fut.worker_inner.done():
+        return
+    running = _running
+    token = fut.worker_token
+    if running is None:
+        return
+    try:
+        # Future "running" có thể mới nằm trong call queue: đặt tombstone để worker bỏ qua job
+        pid = running.setdefault(token, 0)
+    except Exception as e:
+        print(f"[WARNING] không đọc được pid worker của {fut.worker_task}: {e}")
+        return
+    if not pid:
+        return
+    print(f"[WARNING] task {fut.worker_task} quá timeout, kill worker {pid}")
+    # Worker chết làm executor hỏng (BrokenProcessPool): thay pool trước khi kill để job khác
+    # của pool cũ (bị huỷ / BrokenProcessPool) được _settle gửi lại lên pool mới
+    _replace_pool(fut.worker_pool)
+    try:
+        os.kill(pid, signal.SIGKILL)
+    except OSError:
+        pass
+    running.pop(token, None)  # worker chết không kịp tự xoá
+    metrics.inc("worker_killed_total", task=fut.worker_task)
+
+
+def run(task: str, *args, timeout: float | None = None, **kwargs):
+    """Chạy task trên worker và chờ kết quả (dùng trong endpoint `def`).
+
+    Hết `timeout` sẽ ném concurrent.futures.TimeoutError; job chưa kịp chạy thì bị huỷ,
+    job đang chạy thì worker của nó bị kill (xem kill()).
+    """
+    fut = submit(task, *args, **kwargs)
+    try:
+        return fut.result(timeout=timeout)
+    except TimeoutError:
+        kill(fut)
+        raise
+    except BaseException:
+        fut.cancel()
+        raise
+
+
+async def run_async(task: str, *args, timeout: float | None = None, **kwargs):
+    """Bản async của `run` cho endpoint `async def` (không chặn event loop)."""
+    fut = submit(task, *args, **kwargs)
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(fut), timeout=timeout)
+    except asyncio.TimeoutError:
+        kill(fut)
+        raise
+    except BaseException:
+        fut.cancel()
+        raise